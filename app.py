@@ -1,6 +1,15 @@
 import os
+import base64
+import hashlib
+import mimetypes
+import uuid
+import shutil
+import threading
+import click
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, send_from_directory, url_for, Blueprint, abort
+from functools import wraps
+from flask import Flask, request, jsonify, send_from_directory, Blueprint, abort, redirect, g
 from flask_socketio import SocketIO, emit, join_room, leave_room
 from flask_login import login_required, current_user
 from flask_sqlalchemy import SQLAlchemy
@@ -8,6 +17,7 @@ from werkzeug.security import generate_password_hash, check_password_hash
 from flask_cors import CORS
 from flask_migrate import Migrate
 from flask_jwt_extended import (jwt_required,
+                                verify_jwt_in_request,
                                 get_jwt_identity, 
                                 JWTManager, 
                                 create_access_token,
@@ -16,10 +26,22 @@ from flask_jwt_extended import (jwt_required,
                                  set_refresh_cookies,
                                  unset_jwt_cookies)
 from werkzeug.utils import secure_filename
+from sqlalchemy import and_, or_, func, case, update, bindparam, exists
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from flask_mail import Mail, Message
-from itsdangerous import URLSafeTimedSerializer
+from itsdangerous import URLSafeTimedSerializer, BadSignature
 from config import Config
+from cache import ResponseCache
+from images import SidebarCatalogue, can_render, render_variants
+from assets import StaticManifest, RUNTIME_DIRS, compress_assets
+from media import send_media, hash_file, cas_path
+from storage import make_storage, LocalStorage
+from realtime import queue_options, run_local_broker, PAYLOAD_TABLE
+from presence import Presence
+from friend_index import FriendIndex
+from search import register_search_index, skip_search_objects, search_terms, match_posts, match_users
+from query_audit import run_audit, format_report, seed as seed_audit_data
 
 app = Flask(__name__, static_folder="static")
 app.config.from_object(Config)
@@ -33,13 +55,12 @@ CORS(app, resources={
     r"/static/uploads/*": {"origins": "*"}
 }, supports_credentials=True, 
 allow_headers=["Content-Type", "Authorization", "Access-Control-Allow-Origin"], 
-methods=["GET", "POST", "OPTIONS"])
-socketio = SocketIO(app, cors_allowed_origins="*")
+methods=["GET", "POST", "PUT", "OPTIONS"])
 messages_bp = Blueprint('messages', __name__)
 
 # JWT Configuration
 jwt = JWTManager(app)
-app.config["JWT_SECRET_KEY"] = os.urandom(24)  # Secure random key
+app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY") or os.urandom(24)  # must be shared when running several workers/nodes
 app.config["JWT_TOKEN_LOCATION"] = ["cookies"]
 app.config["JWT_COOKIE_CSRF_PROTECT"] = False  # Disable CSRF for testing
 app.config["JWT_ACCESS_COOKIE_NAME"] = "access_token"
@@ -56,33 +77,468 @@ app.config['JWT_REFRESH_COOKIE_PATH'] = '/'  # Path for the refresh token cookie
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'static/images'
 app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
+# Feed pagination
+app.config['FEED_PAGE_SIZE'] = int(os.getenv('FEED_PAGE_SIZE', 20))
+app.config['FEED_MAX_PAGE_SIZE'] = int(os.getenv('FEED_MAX_PAGE_SIZE', 100))
+app.config['FEED_COMMENT_PREVIEW'] = int(os.getenv('FEED_COMMENT_PREVIEW', 3))  # newest comments shown per post
+app.config['MESSAGES_PAGE_SIZE'] = int(os.getenv('MESSAGES_PAGE_SIZE', 50))
+app.config['MESSAGES_MAX_PAGE_SIZE'] = int(os.getenv('MESSAGES_MAX_PAGE_SIZE', 200))
+app.config['CHATS_PAGE_SIZE'] = int(os.getenv('CHATS_PAGE_SIZE', 30))
+app.config['CHATS_MAX_PAGE_SIZE'] = int(os.getenv('CHATS_MAX_PAGE_SIZE', 100))
+app.config['USERS_PAGE_SIZE'] = int(os.getenv('USERS_PAGE_SIZE', 50))
+app.config['USERS_MAX_PAGE_SIZE'] = int(os.getenv('USERS_MAX_PAGE_SIZE', 200))
+app.config['SEARCH_PAGE_SIZE'] = int(os.getenv('SEARCH_PAGE_SIZE', 20))
+app.config['SEARCH_MAX_PAGE_SIZE'] = int(os.getenv('SEARCH_MAX_PAGE_SIZE', 100))
+app.config['SEARCH_MAX_CANDIDATES'] = int(os.getenv('SEARCH_MAX_CANDIDATES', 2000))  # newest matches ranked per query
+# Home timeline: authors with more friends than this are pulled at read time instead of fanned out
+app.config['TIMELINE_FANOUT_MAX_FRIENDS'] = int(os.getenv('TIMELINE_FANOUT_MAX_FRIENDS', 5000))
+app.config['TIMELINE_BACKFILL_POSTS'] = int(os.getenv('TIMELINE_BACKFILL_POSTS', 50))  # per side, on accept
+# "People you may know", recomputed offline by `flask suggest-friends`
+app.config['SUGGESTIONS_TOP_K'] = int(os.getenv('SUGGESTIONS_TOP_K', 20))  # stored per user
+app.config['SUGGESTIONS_LOCATION_WEIGHT'] = float(os.getenv('SUGGESTIONS_LOCATION_WEIGHT', 0.5))  # score boost for a shared location
+# Response cache for public read endpoints ("memory" or "redis")
+app.config['CACHE_BACKEND'] = os.getenv('CACHE_BACKEND', 'memory')
+app.config['CACHE_REDIS_URL'] = os.getenv('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+app.config['CACHE_DEFAULT_TTL'] = int(os.getenv('CACHE_DEFAULT_TTL', 60))
+app.config['CACHE_MAX_ENTRIES'] = int(os.getenv('CACHE_MAX_ENTRIES', 1024))
+app.config['IMAGE_WORKERS'] = int(os.getenv('IMAGE_WORKERS', 2))  # uploads whose derivatives render at once
+# Chunked uploads: partial files are assembled outside static/, then handed to the storage backend
+app.config['CHUNK_UPLOAD_FOLDER'] = os.path.join(app.instance_path, 'partial_uploads')
+app.config['UPLOAD_MAX_BYTES'] = int(os.getenv('UPLOAD_MAX_BYTES', 500 * 1024 * 1024))
+app.config['MAX_CONTENT_LENGTH'] = app.config['UPLOAD_MAX_BYTES']  # rejects oversized form uploads up front
+app.config['UPLOAD_CHUNK_BYTES'] = int(os.getenv('UPLOAD_CHUNK_BYTES', 8 * 1024 * 1024))  # max per PUT
+app.config['UPLOAD_SESSION_TTL'] = timedelta(hours=int(os.getenv('UPLOAD_SESSION_TTL_HOURS', 24)))
+# Media streaming: bytes per 206 response, and whether a front proxy honours X-Sendfile
+app.config['MEDIA_MAX_RANGE_BYTES'] = int(os.getenv('MEDIA_MAX_RANGE_BYTES', 4 * 1024 * 1024))
+app.config['MEDIA_USE_X_SENDFILE'] = os.getenv('MEDIA_USE_X_SENDFILE') == '1'
+app.config['MEDIA_GC_GRACE'] = timedelta(hours=int(os.getenv('MEDIA_GC_GRACE_HOURS', 24)))  # keep unreferenced media this long
+# Where stored media lives ("local" static folder or an S3-compatible bucket) and the
+# origin its URLs are built from (e.g. a CDN); unset means this app's /static/
+app.config['MEDIA_STORAGE'] = os.getenv('MEDIA_STORAGE', 'local')
+app.config['MEDIA_BASE_URL'] = os.getenv('MEDIA_BASE_URL')
+app.config['MEDIA_S3_BUCKET'] = os.getenv('MEDIA_S3_BUCKET')
+app.config['MEDIA_S3_ENDPOINT_URL'] = os.getenv('MEDIA_S3_ENDPOINT_URL')  # e.g. a MinIO server
+app.config['MEDIA_S3_REGION'] = os.getenv('MEDIA_S3_REGION')
+app.config['MEDIA_PRESIGN_TTL'] = int(os.getenv('MEDIA_PRESIGN_TTL', 15 * 60))  # seconds a direct-upload URL is valid
+# Socket.IO fan-out across workers/nodes: redis://..., postgresql://... (LISTEN/NOTIFY) or unset for one process
+app.config['SOCKETIO_MESSAGE_QUEUE'] = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+app.config['SOCKETIO_CHANNEL'] = os.getenv('SOCKETIO_CHANNEL', 'flask-socketio')
+# "threading", "gevent" or "eventlet"; gunicorn_config.py sets it to match WORKER_PROFILE
+app.config['SOCKETIO_ASYNC_MODE'] = os.getenv('SOCKETIO_ASYNC_MODE', 'threading')
+# Presence (online / last seen) is shared across workers through Redis: PRESENCE_REDIS_URL, or the
+# Socket.IO queue when that is redis://; otherwise each process only knows its own sockets
+_queue = app.config['SOCKETIO_MESSAGE_QUEUE'] or ''
+app.config['PRESENCE_REDIS_URL'] = os.getenv('PRESENCE_REDIS_URL') or (_queue if _queue.startswith(('redis://', 'rediss://')) else None)
+app.config['PRESENCE_FLUSH_INTERVAL'] = int(os.getenv('PRESENCE_FLUSH_INTERVAL', 30))  # seconds between batched users.last_seen writes
+app.config['PRESENCE_TIMEOUT'] = int(os.getenv('PRESENCE_TIMEOUT', 90))  # sockets not seen for this long stop counting as online
+# Per-process friendship index: users whose friend arrays are kept, and how often other workers' accepts are read back
+app.config['FRIEND_INDEX_MAX_USERS'] = int(os.getenv('FRIEND_INDEX_MAX_USERS', 100000))
+app.config['FRIEND_INDEX_SYNC_INTERVAL'] = float(os.getenv('FRIEND_INDEX_SYNC_INTERVAL', 1.0))  # seconds
+# Connections per worker process; raise with gevent/eventlet, where one worker serves many requests at once
+if os.getenv('DB_POOL_SIZE'):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 10)),
+    }
+app.config['SIDEBAR_PAGE_SIZE'] = int(os.getenv('SIDEBAR_PAGE_SIZE', 100))
+app.config['SIDEBAR_MAX_PAGE_SIZE'] = int(os.getenv('SIDEBAR_MAX_PAGE_SIZE', 500))
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # Search tables/columns and the Socket.IO payload table live outside the models
+    if type_ == "table" and name == PAYLOAD_TABLE:
+        return False
+    return skip_search_objects(obj, name, type_, reflected, compare_to)
 
 # Initialize extensions
 db = SQLAlchemy(app)
 mail = Mail(app)
-migrate = Migrate(app, db)
+migrate = Migrate(app, db, include_object=include_object)
+cache = ResponseCache(app)
+presence = Presence(app)
+friend_index = FriendIndex(app, db)
+storage = make_storage(app)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=app.config['SOCKETIO_ASYNC_MODE'],
+                    **queue_options(app.config))
+image_executor = ThreadPoolExecutor(max_workers=app.config['IMAGE_WORKERS'], thread_name_prefix="image-variants")
+
+def pixel_runner(async_mode):
+    # Under gevent/eventlet the monkey-patched executor's "threads" are greenlets,
+    # and Pillow would block the worker's event loop; its pixel work goes to the
+    # hub's pool of real OS threads instead (Pillow releases the GIL there)
+    if async_mode == "gevent":
+        import gevent
+        return lambda fn, *args: gevent.get_hub().threadpool.apply(fn, args)
+    if async_mode == "eventlet":
+        from eventlet import tpool
+        return tpool.execute
+    return None
+
+run_pixels = pixel_runner(app.config['SOCKETIO_ASYNC_MODE'])
 #social_bp = Blueprint('social', __name__)
 
 # Serializer for secure tokens
 serializer = URLSafeTimedSerializer(app.config["JWT_SECRET_KEY"])
 
 # Import models
-from models import User, Message, FriendRequest, Post, Like, Comment, Notification, Friendship
+from models import (User, Message, FriendRequest, Post, Like, Comment, Notification, Friendship,
+                    TimelineEntry, ResourceVersion, ImageVariant, UploadSession, MediaObject, Conversation,
+                    FriendSuggestion)
+
+# Full-text indexes (FTS5 on SQLite, tsvector + GIN on Postgres) are created with the tables
+register_search_index(db.metadata)
 
 # Utility to check file extensions
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
 
+# Opaque keyset cursors: "<iso timestamp or sort key>|<id>" in urlsafe base64
+def encode_cursor(key, row_id):
+    key = key.isoformat() if isinstance(key, datetime) else key
+    raw = f"{key}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor, parse=datetime.fromisoformat):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        key, row_id = base64.urlsafe_b64decode(padded).decode().rsplit("|", 1)
+        return parse(key), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def insert_ignore(model, rows=None, **values):
+    # INSERT that silently skips rows violating a unique constraint.
+    # Accepts a single row as keyword arguments or a list of row dicts and
+    # returns the number of rows actually inserted.
+    rows = rows if rows is not None else [values]
+    if not rows:
+        return 0
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        inserted = 0
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.add(model(**row))
+                inserted += 1
+            except IntegrityError:
+                pass
+        return inserted
+    inserted = 0
+    for start in range(0, len(rows), 500):  # stay below bound-parameter limits
+        stmt = insert(model).values(rows[start:start + 500]).on_conflict_do_nothing()
+        inserted += db.session.execute(stmt).rowcount
+    return inserted
+
+def bump_versions(*keys):
+    # Advance the version counters behind conditional GETs. Call before the
+    # write's commit so the bump lands in the same transaction; keys in
+    # SHARED_VERSION_KEYS go through bump_shared_versions instead.
+    now = datetime.utcnow()
+    keys = sorted(set(keys))
+    insert_ignore(ResourceVersion, [{"key": key, "version": 0, "updated_at": now} for key in keys])
+    for start in range(0, len(keys), 500):
+        ResourceVersion.query.filter(ResourceVersion.key.in_(keys[start:start + 500])).update(
+            {ResourceVersion.version: ResourceVersion.version + 1, ResourceVersion.updated_at: now},
+            synchronize_session=False
+        )
+
+# Keys bumped by writes from every user. Inside each write's transaction they
+# would queue all writers site-wide on one row lock until that write commits,
+# so they are bumped right after the commit in a short transaction of their
+# own. A GET in between gets the new body under the old ETag, which costs its
+# client one more full response once the bump lands, never a stale 304.
+SHARED_VERSION_KEYS = ("feeds", "users", "suggestions")
+
+def bump_shared_versions(*keys):
+    if keys:
+        bump_versions(*keys)
+        db.session.commit()
+
+def conversation_key(user_a, user_b):
+    low, high = sorted((int(user_a), int(user_b)))
+    return f"conversation:{low}:{high}"
+
+def conditional(keys_fn, vary=None):
+    # ETag / Last-Modified support for GET endpoints. keys_fn(**view_kwargs)
+    # names the version counters the response depends on; a matching
+    # If-None-Match (or, failing that, If-Modified-Since) is answered with 304
+    # from one primary-key lookup, before the view builds its body.
+    # vary(), if given, returns extra state kept outside the database (such as
+    # presence) that is folded into the ETag; such responses get no Last-Modified.
+    # The ETag is left in g.etag for a @cache.cached view below, which keys its
+    # body by it (see cached_under_etag).
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            keys = keys_fn(**kwargs)
+            extra = vary() if vary else None
+            rows = db.session.query(
+                ResourceVersion.key, ResourceVersion.version, ResourceVersion.updated_at
+            ).filter(ResourceVersion.key.in_(keys)).all()
+            versions = {key: (version, updated_at) for key, version, updated_at in rows}
+
+            state = [(key, versions.get(key, (0, None))[0]) for key in keys]
+            etag = hashlib.sha1(repr((request.full_path, state, extra)).encode()).hexdigest()[:24]
+            stamps = [versions[key][1] for key in keys if key in versions]
+            last_modified = max(stamps).replace(microsecond=0) if len(stamps) == len(keys) and not vary else None
+            if last_modified and last_modified >= datetime.utcnow().replace(microsecond=0):
+                # Changed within the current second: a second-resolution date could hide a later write
+                last_modified = None
+
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains_weak(etag)
+            elif request.if_modified_since and last_modified:
+                not_modified = last_modified <= request.if_modified_since.replace(tzinfo=None)
+            else:
+                not_modified = False
+
+            if not_modified:
+                response = app.response_class(status=304)
+            else:
+                g.etag = etag
+                response = app.make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag, weak=True)
+            if last_modified:
+                response.last_modified = last_modified
+            response.headers["Cache-Control"] = "private, no-cache"
+            return response
+        return wrapper
+    return decorator
+
+def cached_under_etag():
+    # cache.cached vary for views under @conditional. Generations only reach
+    # this process's cache, while the ETag comes from the shared version rows,
+    # so keying by it keeps another worker's write from leaving an old body
+    # cached under the new ETag.
+    return g.etag
+
+# ----- Content-addressed media -----
+
+def store_media(filename, f=None, source_path=None, hashed=None):
+    # Store an upload by its sha256, given as an open file (already spooled by
+    # Werkzeug) or a finished file on disk; hashed is its (digest, size) when
+    # the caller already computed it. Content that is already stored is not
+    # written again. Returns (MediaObject, created); the caller's transaction
+    # must be committed.
+    if hashed is not None:
+        digest, size = hashed
+    elif f is None:
+        with open(source_path, "rb") as src:
+            digest, size = hash_file(src)
+    else:
+        digest, size = hash_file(f)
+
+    existing = MediaObject.query.filter_by(digest=digest).first()
+    if existing and lease_media(existing.id):
+        if source_path is not None:
+            os.remove(source_path)
+        return existing, False
+
+    rel_path = cas_path(digest, filename)
+    content_type = mimetypes.guess_type(filename)[0]
+    if source_path is not None:
+        storage.save_file(rel_path, source_path, content_type=content_type)
+    else:
+        storage.save(rel_path, f, content_type=content_type)
+    now = datetime.utcnow()
+    created = insert_ignore(MediaObject, digest=digest, path=rel_path, size=size, ref_count=0,
+                            created_at=now, last_used_at=now)
+    return MediaObject.query.filter_by(digest=digest).one(), bool(created)
+
+def lease_media(media_id):
+    # Restart an object's MEDIA_GC_GRACE period, in the caller's transaction, when
+    # an upload resolves to it: the upload's post or message retains it later.
+    # False when gc-media deleted it in the meantime.
+    return bool(MediaObject.query.filter_by(id=media_id).update(
+        {MediaObject.last_used_at: datetime.utcnow()}, synchronize_session=False))
+
+def retain_media(new_id, old_id=None):
+    # Move one reference from old_id (if any) to new_id, in SQL
+    if new_id == old_id:
+        return
+    if new_id:
+        MediaObject.query.filter_by(id=new_id).update(
+            {MediaObject.ref_count: MediaObject.ref_count + 1}, synchronize_session=False)
+    if old_id:
+        MediaObject.query.filter_by(id=old_id).update(
+            {MediaObject.ref_count: MediaObject.ref_count - 1}, synchronize_session=False)
+
+def media_object_for(url):
+    # Resolve a media URL handed back by an upload endpoint to its stored object
+    source = media_source(url)
+    return MediaObject.query.filter_by(path=source).first() if source else None
+
+@app.cli.command("gc-media")
+def gc_media_command():
+    # Delete stored media (and derivatives) no longer referenced by anything.
+    # Each row is deleted only if it is still unreferenced and unleased at that
+    # moment, so a retain_media or dedup hit landing after the scan keeps it.
+    cutoff = datetime.utcnow() - app.config['MEDIA_GC_GRACE']
+    unreferenced = MediaObject.ref_count <= 0, MediaObject.last_used_at < cutoff
+    candidates = db.session.query(MediaObject.id, MediaObject.path).filter(*unreferenced).all()
+    removed = 0
+    for media_id, path in candidates:
+        if not MediaObject.query.filter(MediaObject.id == media_id, *unreferenced).delete(synchronize_session=False):
+            db.session.rollback()
+            continue
+        variants = [variant for (variant,) in db.session.query(ImageVariant.path).filter_by(source=path)]
+        ImageVariant.query.filter_by(source=path).delete(synchronize_session=False)
+        # Files go before the commit, while the row is locked: an upload of the same
+        # content waits for it, finds the row gone and stores the file again
+        for rel_path in [path] + variants:
+            storage.delete(rel_path)
+        db.session.commit()
+        removed += 1
+    print(f"Removed {removed} unreferenced media object(s)")
+
+# ----- Image derivatives -----
+
+def media_source(value):
+    # Normalize a stored picture/media reference to a path relative to static/:
+    # "images/x.jpg", "/static/uploads/x.jpg" and ".../uploads/x.jpg" style URLs
+    if not value:
+        return None
+    if "://" in value:
+        # Only URLs under the storage origin, our own /static/... and
+        # /uploads/<name> (UPLOAD_FOLDER) map to a stored file
+        key = storage.key_for(value)
+        if key:
+            return key
+        if "/static/" in value:
+            return value.split("/static/", 1)[1]
+        return "images/" + value.rsplit("/", 1)[-1] if "/uploads/" in value else None
+    value = value.lstrip("/")
+    return value[len("static/"):] if value.startswith("static/") else value
+
+def process_image(source, version_keys=()):
+    # Worker-pool task: render derivatives for static/<source> and record them
+    with app.app_context():
+        try:
+            rows = render_variants(storage, source, run=run_pixels)
+            ImageVariant.query.filter_by(source=source).delete(synchronize_session=False)
+            db.session.add_all([ImageVariant(**row) for row in rows])
+            bump_versions(*[key for key in version_keys if key not in SHARED_VERSION_KEYS])
+            db.session.commit()
+            bump_shared_versions(*[key for key in version_keys if key in SHARED_VERSION_KEYS])
+            cache.invalidate(*version_keys)
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error processing image {source}: {str(e)}")
+
+def submit_image(source, *version_keys):
+    # Queue derivative rendering; the request returns without waiting for it.
+    # version_keys name the responses that should pick up the new variant URLs.
+    if source and can_render(source):
+        image_executor.submit(process_image, source, version_keys)
+
+def variant_paths(values, variant):
+    # One query mapping stored picture/media references to the static-relative
+    # path of their derivative. WebP unless the client asks for ?image_format=jpeg.
+    sources = {media_source(value) for value in values if value} - {None}
+    if not sources:
+        return {}
+    fmt = "jpeg" if request.args.get("image_format") == "jpeg" else "webp"
+    rows = db.session.query(ImageVariant.source, ImageVariant.path).filter(
+        ImageVariant.source.in_(sources),
+        ImageVariant.variant == variant,
+        ImageVariant.format == fmt
+    ).all()
+    paths = dict(rows)
+    return {value: paths[media_source(value)] for value in values if value and media_source(value) in paths}
+
+# Top-level static/ folders whose files live in the storage backend; anything
+# else (pictures and uploads from before content-addressed storage) is still
+# served from this node's disk.
+STORED_DIRS = {"media", "variants", "sidebar_images"}
+
+def public_url(value, legacy_dir="images"):
+    # Absolute URL for a stored picture/media reference, built from the storage
+    # origin (MEDIA_BASE_URL) rather than url_for. Bare filenames are legacy
+    # files in static/<legacy_dir>; foreign URLs are returned unchanged.
+    if not value:
+        return None
+    key = media_source(value)
+    if key is None:
+        return value
+    if "/" not in key:
+        key = f"{legacy_dir}/{key}"
+    if key.split("/", 1)[0] in STORED_DIRS:
+        return storage.url(key)
+    return f"{request.host_url}static/{key}"
+
+def serve_stored(key, immutable=False):
+    # Local storage streams the file itself; object storage answers with a
+    # redirect to the object so stored references keep working as /static/ URLs
+    if isinstance(storage, LocalStorage):
+        return send_media(storage.root, key, immutable=immutable)
+    return redirect(storage.url(key), code=301 if immutable else 302)
+
+def page_size_arg(default_key, max_key):
+    # Clamp the client-supplied ?limit= to the configured bounds
+    try:
+        limit = int(request.args.get("limit", app.config[default_key]))
+    except ValueError:
+        limit = app.config[default_key]
+    return max(1, min(limit, app.config[max_key]))
+
+# Built SPA files are indexed once at startup so serving them needs no filesystem stat
+static_manifest = StaticManifest(app.static_folder)
+
+@app.cli.command("realtime-broker")
+@click.option("--host", default="127.0.0.1")
+@click.option("--port", default=6390, type=int)
+def realtime_broker_command(host, port):
+    # Local Redis-protocol broker so several workers can share Socket.IO events without Redis
+    print(f"Serving a local message queue on redis://{host}:{port}/0")
+    run_local_broker(host, port)
+
+@app.cli.command("compress-assets")
+def compress_assets_command():
+    # Pre-generate gzip/brotli siblings for the built SPA (also run by gunicorn on start)
+    written = compress_assets(app.static_folder)
+    static_manifest.build()
+    print(f"Wrote {written} compressed asset(s)")
+
+@app.cli.command("audit-queries")
+@click.option("--seed", "seed_users", default=0, type=int, help="First fill an empty database with this many users")
+@click.option("--min-rows", default=1000, type=int, help="Report full scans of tables larger than this")
+@click.option("--verbose", is_flag=True, help="Print every plan, not only the findings")
+@click.option("--fail", is_flag=True, help="Exit with status 1 when anything is reported")
+def audit_queries_command(seed_users, min_rows, verbose, fail):
+    # EXPLAIN every query the main endpoints issue (SQLite or Postgres) and flag
+    # full table scans. Write endpoints really run: use a scratch or staging database.
+    if seed_users:
+        db.create_all()
+        if not seed_audit_data(db, users=seed_users):
+            print("Database already has users; auditing it as is")
+    report, rows = run_audit(app, db, min_rows=min_rows)
+    output, findings = format_report(report, rows, min_rows, verbose=verbose)
+    print(output)
+    if fail and findings:
+        raise SystemExit(1)
+
 # Routes
 @app.route("/", defaults={"path": ""})
 @app.route("/<path:path>")
 def serve_react(path):
-    file_path = os.path.join(app.static_folder, path)
+    asset = static_manifest.get(path) if path else None
+    if asset:
+        return asset.response(request)
+
+    # Runtime upload folders are not in the manifest; serve them from disk as before
+    if path.split("/", 1)[0] in RUNTIME_DIRS and os.path.exists(os.path.join(app.static_folder, path)):
+        return send_media(app.static_folder, path)
 
-    if path != "" and os.path.exists(file_path):
-        return send_from_directory(app.static_folder, path)
-    
     # fallback for React Router
+    index = static_manifest.get("index.html")
+    if index:
+        return index.response(request)
     return send_from_directory(app.static_folder, "index.html")
 
 # Refresh token endpoint
@@ -114,6 +570,7 @@ def register():
     try:
         db.session.add(new_user)
         db.session.commit()
+        bump_shared_versions("users")
         return jsonify({"message": "User registered successfully"}), 201
     except Exception as e:
         return jsonify({"message": "Registration failed", "error": str(e)}), 500
@@ -192,11 +649,24 @@ def serve_image(filename):
 
 @app.route('/<filename>')
 def static_files(filename):
-    return send_from_directory(os.path.join(app.root_path, 'static/uploads'), filename)
+    return send_media(os.path.join(app.root_path, 'static/uploads'), filename)
+
+# More specific than Flask's /static/<path:filename>, so post media gets range handling
+@app.route('/static/uploads/<path:filename>')
+def serve_upload(filename):
+    return send_media(os.path.join(app.root_path, 'static/uploads'), filename)
+
+@app.route('/static/media/<path:filename>')
+def serve_media_object(filename):
+    return serve_stored(f"media/{filename}", immutable=True)
+
+@app.route('/static/variants/<path:filename>')
+def serve_variant(filename):
+    return serve_stored(f"variants/{filename}")
 
 @app.route('/static/sidebar_images/<filename>')
 def serve_sidebar_image(filename):
-    return send_from_directory(os.path.join(app.root_path, 'static/sidebar_images'), filename)
+    return serve_stored(f"{SIDEBAR_DIR}/{filename}")
 
 @app.route("/api/token", methods=["GET"])
 @jwt_required(refresh=True)
@@ -224,41 +694,103 @@ def refresh_token():
         return jsonify({"error": str(e)}), 500
 
 
+# User directory: everyone except the current user and their friends, by name.
+# ?q= matches a name prefix and ?location= a location, both case-insensitively.
+# Pass the returned next_cursor back as ?after= to fetch the following page.
 @app.route("/api/users", methods=["GET"])
 @jwt_required()
+@conditional(lambda: ["users", f"friends:{get_jwt_identity()}"])
 def get_users():
-    try:
-        current_user_id = get_jwt_identity()
-
-        # Get friend IDs in both directions (since friendships are mutual)
-        friend_ids_query1 = db.session.query(Friendship.friend_id).filter(Friendship.user_id == current_user_id)
-        friend_ids_query2 = db.session.query(Friendship.user_id).filter(Friendship.friend_id == current_user_id)
-        friend_ids = friend_ids_query1.union(friend_ids_query2).all()
-        friend_ids = {fid[0] for fid in friend_ids}  # Convert list of tuples to a set
-
-        # Query for users who are not the current user and not in the friend IDs
-        users = User.query.filter(
-            User.id != current_user_id,
-            ~User.id.in_(friend_ids)
-        ).all()
+    current_user_id = get_jwt_identity()
+    limit = page_size_arg('USERS_PAGE_SIZE', 'USERS_MAX_PAGE_SIZE')
 
-        # Build the response list with the desired fields
-        user_list = [{
+    # Friendships are stored in both directions, so one anti-join probe of
+    # unique_friendship per candidate row excludes friends
+    query = db.session.query(User).filter(
+        User.id != current_user_id,
+        ~exists().where(Friendship.user_id == current_user_id, Friendship.friend_id == User.id)
+    )
+    prefix = request.args.get('q', '').strip()
+    if prefix:
+        # One range of ix_users_name_key (or ix_users_location_name_key)
+        key = func.lower(prefix)
+        query = query.filter(User.name_key >= key, User.name_key < key + "\U0010ffff")
+    location = request.args.get('location', '').strip()
+    if location:
+        query = query.filter(func.lower(User.location) == func.lower(location))
+    after = request.args.get('after')
+    if after:
+        cursor = decode_cursor(after, parse=str)
+        if cursor is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.filter(or_(
+            User.name_key > cursor[0],
+            and_(User.name_key == cursor[0], User.id > cursor[1])
+        ))
+    users = query.order_by(User.name_key, User.id).limit(limit + 1).all()
+    has_more = len(users) > limit
+    users = users[:limit]
+
+    avatars = variant_paths([user.picture for user in users], "avatar")
+    user_list = [{
+        'id': user.id,
+        'name': user.name,
+        'description': user.description,
+        'location': user.location,
+        'picture': public_url(avatars.get(user.picture, user.picture)),
+    } for user in users]
+
+    next_cursor = encode_cursor(users[-1].name_key, users[-1].id) if has_more else None
+    return jsonify({"users": user_list, "next_cursor": next_cursor}), 200
+
+# Ranked full-text search over posts (?type=posts, the default) or users
+# (?type=users), among the SEARCH_MAX_CANDIDATES newest matches.
+# Pass the returned next_cursor back as ?after= for the next page.
+@app.route("/api/search", methods=["GET"])
+@jwt_required()
+def search():
+    terms = search_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({"error": "Search query is required"}), 400
+    kind = request.args.get('type', 'posts')
+    if kind not in ('posts', 'users'):
+        return jsonify({"error": "type must be posts or users"}), 400
+    limit = page_size_arg('SEARCH_PAGE_SIZE', 'SEARCH_MAX_PAGE_SIZE')
+    after = request.args.get('after')
+    cursor = None
+    if after:
+        cursor = decode_cursor(after, parse=float)
+        if cursor is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    match = match_posts if kind == 'posts' else match_users
+    matches = match(db.session, terms, limit + 1, cursor, app.config['SEARCH_MAX_CANDIDATES'])
+    has_more = len(matches) > limit
+    matches = matches[:limit]
+    ids = [row_id for row_id, _ in matches]
+
+    if kind == 'posts':
+        posts = {post.id: post for post in Post.query.options(joinedload(Post.user)).filter(Post.id.in_(ids))}
+        results = serialize_feed([posts[row_id] for row_id in ids if row_id in posts])
+    else:
+        users = {user.id: user for user in User.query.filter(User.id.in_(ids))}
+        users = [users[row_id] for row_id in ids if row_id in users]
+        avatars = variant_paths([user.picture for user in users], "avatar")
+        results = [{
             'id': user.id,
             'name': user.name,
             'description': user.description,
             'location': user.location,
-            'picture': user.picture,
+            'picture': public_url(avatars.get(user.picture, user.picture)),
         } for user in users]
 
-        return jsonify(user_list), 200
-
-    except Exception as e:
-        return jsonify({"error": f"Error fetching users: {str(e)}"}), 500
+    next_cursor = encode_cursor(repr(matches[-1][1]), matches[-1][0]) if has_more else None
+    return jsonify({kind: results, "next_cursor": next_cursor}), 200
     
     
 @app.route("/api/current_user", methods=["GET"])
 @jwt_required()  # JWT Authentication will automatically check the cookies
+@conditional(lambda: [f"profile:{get_jwt_identity()}"])
 def get_current_user():
     try:
         # Get user ID from JWT token (extracted from the cookies)
@@ -274,11 +806,9 @@ def get_current_user():
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        # If the user has a picture, generate a URL for it
-        picture_url = (
-            url_for('serve_image', filename=user.picture, _external=True)
-            if user.picture else None
-        )
+        # If the user has a picture, generate a URL for it (full-size derivative when rendered)
+        full = variant_paths([user.picture], "full")
+        picture_url = public_url(full.get(user.picture, user.picture))
 
         # Send the user data as a JSON response
         data = {
@@ -293,36 +823,38 @@ def get_current_user():
         app.logger.error(f"Error fetching user data: {str(e)}")
         return jsonify({"error": f"Error fetching user data: {str(e)}"}), 500
 
+def serialize_user_posts(posts):
+    # Serialize a user's posts, pointing media and photos at derivatives when rendered
+    media = variant_paths([post.media_url for post in posts], "feed")
+    photos = variant_paths([post.user.picture for post in posts], "avatar")
+
+    return [
+        {
+            "id": post.id,
+            "content": post.content,
+            "media_url": public_url(media.get(post.media_url, post.media_url), legacy_dir="uploads"),
+            "timestamp": post.timestamp.isoformat(),  # Convert to ISO format for JSON
+            "like_count": post.like_count,
+            "user": {
+                "id": post.user.id,
+                "name": post.user.name,
+                "user_photo": public_url(photos.get(post.user.picture, post.user.picture)),
+            },
+        }
+        for post in posts
+    ]
+
 #end point to get user posts
 @app.route("/api/user_posts/<int:user_id>", methods=["GET"])
 @jwt_required()
+@conditional(lambda user_id: [f"user_posts:{user_id}"])
+@cache.cached(lambda user_id: f"user_posts:{user_id}", vary=cached_under_etag)
 def get_user_posts(user_id):
     try:
         # Query posts made by the selected user
         posts = Post.query.filter_by(user_id=user_id).order_by(Post.timestamp.desc()).all()
 
-        # Serialize post data
-        post_data = [
-            {
-                "id": post.id,
-                "content": post.content,
-                "media_url": (
-                    url_for('static_files', filename=post.media_url, _external=True)
-                    if post.media_url else None
-                ),
-                "timestamp": post.timestamp.isoformat(),  # Convert to ISO format for JSON
-                "like_count": post.like_count(),
-                "user": {
-                    "id": post.user.id,
-                    "name": post.user.name,
-                    "user_photo": (
-                        url_for('serve_image', filename=post.user.picture, _external=True)
-                        if post.user.picture else None
-                    ),
-                },
-            }
-            for post in posts
-        ]
+        post_data = serialize_user_posts(posts)
 
         return jsonify({"posts": post_data}), 200
     except Exception as e:
@@ -330,6 +862,7 @@ def get_user_posts(user_id):
 
 @app.route("/api/user_posts", methods=["GET"])
 @jwt_required()
+@conditional(lambda: [f"user_posts:{get_jwt_identity()}"])
 def get_current_user_posts():
     try:
         # Get the logged-in user's ID
@@ -338,28 +871,7 @@ def get_current_user_posts():
         # Query posts made by the logged-in user
         posts = Post.query.filter_by(user_id=current_user_id).order_by(Post.timestamp.desc()).all()
 
-        # Serialize post data
-        post_data = [
-            {
-                "id": post.id,
-                "content": post.content,
-                "media_url": (
-                    url_for('static_files', filename=post.media_url, _external=True)
-                    if post.media_url else None
-                ),
-                "timestamp": post.timestamp.isoformat(),  # Convert to ISO format for JSON
-                "like_count": post.like_count(),
-                "user": {
-                    "id": post.user.id,
-                    "name": post.user.name,
-                    "user_photo": (
-                        url_for('serve_image', filename=post.user.picture, _external=True)
-                        if post.user.picture else None
-                    ),
-                },
-            }
-            for post in posts
-        ]
+        post_data = serialize_user_posts(posts)
 
         return jsonify({"posts": post_data}), 200
     except Exception as e:
@@ -367,6 +879,23 @@ def get_current_user_posts():
 
 
 
+def profile_version_keys(user_id):
+    # Version keys of other users' responses that embed this user's name or photo:
+    # comment lists, friends' friend lists, partners' inboxes and conversations, and
+    # the notifications of everyone they sent a request to or accepted one from.
+    # Each list is one index range.
+    commented = db.session.query(Comment.post_id).filter(Comment.user_id == user_id).distinct()
+    partners = [pid for (pid,) in db.session.query(Conversation.partner_id).filter(Conversation.user_id == user_id)]
+    requested = db.session.query(FriendRequest.recipient_id).filter(FriendRequest.requester_id == user_id)
+    accepted = db.session.query(FriendRequest.requester_id).filter(FriendRequest.recipient_id == user_id)
+    return (
+        [f"comments:{pid}" for (pid,) in commented]
+        + [f"friends:{fid}" for fid in friend_ids_of(user_id)]
+        + [f"chats:{pid}" for pid in partners]
+        + [conversation_key(user_id, pid) for pid in partners]
+        + [f"notifications:{uid}" for (uid,) in requested.union(accepted)]
+    )
+
 @app.route('/api/profile', methods=['POST'])
 @jwt_required()
 def update_profile():
@@ -384,21 +913,26 @@ def update_profile():
         if not user:
             return jsonify({'error': 'User not found'}), 404
 
-        upload_folder = app.config['UPLOAD_FOLDER']
-        if not os.path.exists(upload_folder):
-            os.makedirs(upload_folder)
-
+        new_picture = None
         if picture and allowed_file(picture.filename):
-            filename = secure_filename(picture.filename)
-            image_path = os.path.join(upload_folder, filename)
-            picture.save(image_path)
-            user.picture = f'images/{filename}'
+            new_picture, new_picture_created = store_media(secure_filename(picture.filename), f=picture.stream)
+            retain_media(new_picture.id, user.picture_object_id)
+            user.picture = new_picture.path
+            user.picture_object_id = new_picture.id
 
         user.name = name
         user.description = description
         user.location = location
 
+        version_keys = [f"user_posts:{current_user_id}", f"profile:{current_user_id}"]
+        version_keys += profile_version_keys(current_user_id)
+        bump_versions(*version_keys)
         db.session.commit()
+        bump_shared_versions("feeds", "users", "suggestions")
+        if new_picture and new_picture_created:
+            submit_image(user.picture, "feeds", "users", "suggestions", *version_keys)
+        # Names and photos are embedded in cached feed, post and comment responses
+        cache.invalidate("feeds", *[key for key in version_keys if key.startswith(("user_posts:", "comments:"))])
         return jsonify({'message': 'Profile updated successfully'}), 200
     except Exception as e:
         app.logger.error(f"Error updating profile: {str(e)}")
@@ -414,15 +948,17 @@ def create_post():
 
         content = form_data.get('content')
         media_url = None
-
-        uploads_folder = os.path.join(app.root_path, 'static/uploads')
-        if not os.path.exists(uploads_folder):
-            os.makedirs(uploads_folder)
+        media_object, media_created = None, False
 
         if media:
-            media_filename = secure_filename(media.filename)
-            media.save(os.path.join(uploads_folder, media_filename))
-            media_url = f'/static/uploads/{media_filename}'
+            media_object, media_created = store_media(secure_filename(media.filename), f=media.stream)
+        elif form_data.get('media_url'):
+            # Media uploaded earlier, e.g. through the chunked upload API
+            media_object = media_object_for(form_data['media_url'])
+            if not media_object:
+                return jsonify({"error": "Unknown media_url"}), 400
+        if media_object:
+            media_url = f'/static/{media_object.path}'
 
         if not content and not media_url:
             return jsonify({"error": "Content or media_url is required"}), 400
@@ -431,37 +967,225 @@ def create_post():
             content=content,
             media_url=media_url,
             user_id=current_user_id,
-            timestamp=datetime.utcnow()
+            timestamp=datetime.utcnow(),
+            media_object_id=media_object.id if media_object else None
         )
         db.session.add(post)
+        if media_object:
+            retain_media(media_object.id)
+        bump_versions(f"user_posts:{current_user_id}")
         db.session.commit()
+        bump_shared_versions("feeds")
+        cache.invalidate("feeds", f"user_posts:{current_user_id}")
+        if media_created:
+            submit_image(media_object.path, "feeds", f"user_posts:{current_user_id}")
+
+        # Push the post into friends' home timelines off the request thread
+        socketio.start_background_task(fan_out_post, post.id)
 
         return jsonify({"message": "Post created", "post_id": post.id}), 201
     except Exception as e:
         app.logger.error(f"Error creating post: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
-# Get posts with comments
-@app.route('/api/feeds', methods=['GET'])
-def get_all_posts():
-    posts = Post.query.options(joinedload(Post.user)).order_by(Post.timestamp.desc()).all()
-    response = [{
+def serialize_feed(posts):
+    # Build feed items for a page of posts with a fixed number of queries:
+    # the page itself (authors joined, like counts denormalized on the row),
+    # comment counts and a windowed preview of the newest comments per post with their authors.
+    post_ids = [post.id for post in posts]
+    if not post_ids:
+        return []
+
+    comment_counts = dict(
+        db.session.query(Comment.post_id, func.count(Comment.id))
+        .filter(Comment.post_id.in_(post_ids))
+        .group_by(Comment.post_id)
+        .all()
+    )
+
+    ranked = (
+        db.session.query(
+            Comment.id.label("id"),
+            func.row_number().over(
+                partition_by=Comment.post_id,
+                order_by=(Comment.timestamp.desc(), Comment.id.desc())
+            ).label("rank")
+        )
+        .filter(Comment.post_id.in_(post_ids))
+        .subquery()
+    )
+    preview_rows = (
+        db.session.query(Comment, User)
+        .join(ranked, ranked.c.id == Comment.id)
+        .outerjoin(User, User.id == Comment.user_id)
+        .filter(ranked.c.rank <= app.config['FEED_COMMENT_PREVIEW'])
+        .order_by(Comment.timestamp.asc(), Comment.id.asc())
+        .all()
+    )
+    avatars = variant_paths(
+        [post.user.picture for post in posts if post.user] + [author.picture for _, author in preview_rows if author],
+        "avatar"
+    )
+    media = variant_paths([post.media_url for post in posts], "feed")
+
+    previews = {}
+    for comment, author in preview_rows:
+        previews.setdefault(comment.post_id, []).append({
+            'id': comment.id,
+            'content': comment.content,
+            'user_name': author.name if author else "Unknown",
+            'user_photo': public_url(avatars.get(author.picture, author.picture)) if author else None,
+            'timestamp': comment.timestamp.isoformat()
+        })
+
+    return [{
         'id': post.id,
         'user_id': post.user_id,
         'user_name': post.user.name if post.user else "Unknown",
-        'user_photo': post.user.picture if post.user and post.user.picture else None,
+        'user_photo': public_url(avatars.get(post.user.picture, post.user.picture)) if post.user else None,
         'content': post.content,
-        'media_url': post.media_url,
+        'media_url': public_url(media.get(post.media_url, post.media_url), legacy_dir="uploads"),
         'timestamp': post.timestamp.isoformat(),
-        'comments': [{
-            'id': comment.id,
-            'content': comment.content,
-            'user_name': comment.user.name if comment.user else "Unknown",
-            'user_photo': comment.user.picture if comment.user and comment.user.picture else None,
-            'timestamp': comment.timestamp.isoformat()
-        } for comment in post.comments]
+        'like_count': post.like_count,
+        'comment_count': comment_counts.get(post.id, 0),
+        'comments': previews.get(post.id, [])
     } for post in posts]
-    return jsonify(response), 200
+
+# ----- Home timeline (fan-out on write) -----
+
+def friend_ids_of(user_id):
+    # Friendships are stored in both directions, so one side is enough
+    return [fid for (fid,) in db.session.query(Friendship.friend_id).filter(Friendship.user_id == user_id)]
+
+def friend_index_state(*user_ids):
+    # Friend sets only grow, so their sizes tell apart responses built before and
+    # after this process's index caught up with a friends:<id> bump from another worker
+    return tuple(len(friend_index.friends(user_id)) for user_id in user_ids)
+
+def fan_out_post(post_id):
+    # Background task: copy a new post into the author's and their friends' timelines.
+    # Authors above TIMELINE_FANOUT_MAX_FRIENDS are skipped; readers pull their posts instead.
+    with app.app_context():
+        try:
+            post = db.session.get(Post, post_id)
+            if not post:
+                return
+            # The same friend_count get_timeline filters on, so every post is either pushed or pulled
+            recipients = [post.user_id]
+            if post.user.friend_count <= app.config['TIMELINE_FANOUT_MAX_FRIENDS']:
+                recipients.extend(friend_ids_of(post.user_id))
+            insert_ignore(TimelineEntry, [
+                {"user_id": uid, "post_id": post.id, "ts": post.timestamp} for uid in recipients
+            ])
+            bump_versions(*[f"timeline:{uid}" for uid in recipients])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error fanning out post {post_id}: {str(e)}")
+
+def backfill_timelines(user_a, user_b):
+    # Background task: after a new friendship, copy each side's recent posts into the other's timeline
+    with app.app_context():
+        try:
+            limit = app.config['TIMELINE_BACKFILL_POSTS']
+            for reader, author in ((user_a, user_b), (user_b, user_a)):
+                recent = (
+                    db.session.query(Post.id, Post.timestamp)
+                    .filter(Post.user_id == author)
+                    .order_by(Post.timestamp.desc(), Post.id.desc())
+                    .limit(limit)
+                    .all()
+                )
+                insert_ignore(TimelineEntry, [
+                    {"user_id": reader, "post_id": pid, "ts": ts} for pid, ts in recent
+                ])
+            bump_versions(f"timeline:{user_a}", f"timeline:{user_b}")
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            app.logger.error(f"Error backfilling timelines for {user_a}/{user_b}: {str(e)}")
+
+@app.route('/api/timeline', methods=['GET'])
+@jwt_required()
+@conditional(lambda: [f"timeline:{get_jwt_identity()}", "feeds"])
+def get_timeline():
+    current_user_id = get_jwt_identity()
+    limit = page_size_arg('FEED_PAGE_SIZE', 'FEED_MAX_PAGE_SIZE')
+
+    cursor = None
+    before = request.args.get('before')
+    if before:
+        cursor = decode_cursor(before)
+        if cursor is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    # Pushed entries: one range scan on ix_timeline_entries_user_ts
+    pushed = db.session.query(TimelineEntry.ts, TimelineEntry.post_id).filter(
+        TimelineEntry.user_id == current_user_id
+    )
+    if cursor:
+        pushed = pushed.filter(or_(
+            TimelineEntry.ts < cursor[0],
+            and_(TimelineEntry.ts == cursor[0], TimelineEntry.post_id < cursor[1])
+        ))
+    candidates = pushed.order_by(TimelineEntry.ts.desc(), TimelineEntry.post_id.desc()).limit(limit + 1).all()
+
+    # Pulled entries: friends whose posts were not fanned out because of their friend count.
+    # A range of ix_users_friend_count lists the few such authors site-wide, and one
+    # unique_friendship probe each keeps the reader's friends
+    heavy_ids = [uid for (uid,) in db.session.query(User.id).filter(
+        User.friend_count > app.config['TIMELINE_FANOUT_MAX_FRIENDS'],
+        exists().where(Friendship.user_id == current_user_id, Friendship.friend_id == User.id)
+    )]
+    if heavy_ids:
+        pulled = db.session.query(Post.timestamp, Post.id).filter(Post.user_id.in_(heavy_ids))
+        if cursor:
+            pulled = pulled.filter(or_(
+                Post.timestamp < cursor[0],
+                and_(Post.timestamp == cursor[0], Post.id < cursor[1])
+            ))
+        candidates += pulled.order_by(Post.timestamp.desc(), Post.id.desc()).limit(limit + 1).all()
+        candidates = sorted(set(candidates), reverse=True)
+
+    has_more = len(candidates) > limit
+    page_ids = [pid for _, pid in candidates[:limit]]
+    posts_by_id = {
+        post.id: post
+        for post in Post.query.options(joinedload(Post.user)).filter(Post.id.in_(page_ids))
+    } if page_ids else {}
+    posts = [posts_by_id[pid] for pid in page_ids if pid in posts_by_id]
+
+    next_cursor = encode_cursor(*candidates[limit - 1]) if has_more else None
+    return jsonify({"posts": serialize_feed(posts), "next_cursor": next_cursor}), 200
+
+# Get posts with comments, newest first, one page at a time.
+# Pass the returned next_cursor back as ?before= to fetch the following page.
+@app.route('/api/feeds', methods=['GET'])
+@conditional(lambda: ["feeds"])
+@cache.cached("feeds", vary=cached_under_etag)
+def get_all_posts():
+    limit = page_size_arg('FEED_PAGE_SIZE', 'FEED_MAX_PAGE_SIZE')
+    query = Post.query.options(joinedload(Post.user))
+
+    before = request.args.get('before')
+    if before:
+        cursor = decode_cursor(before)
+        if cursor is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+        before_ts, before_id = cursor
+        query = query.filter(or_(
+            Post.timestamp < before_ts,
+            and_(Post.timestamp == before_ts, Post.id < before_id)
+        ))
+
+    # Fetch one extra row to learn whether another page exists
+    posts = query.order_by(Post.timestamp.desc(), Post.id.desc()).limit(limit + 1).all()
+    has_more = len(posts) > limit
+    posts = posts[:limit]
+
+    response = serialize_feed(posts)
+    next_cursor = encode_cursor(posts[-1].timestamp, posts[-1].id) if has_more else None
+    return jsonify({"posts": response, "next_cursor": next_cursor}), 200
 
 
 @app.route('/api/posts/<int:post_id>/like', methods=['POST'])
@@ -474,20 +1198,27 @@ def like_post(post_id):
         if not post:
             return jsonify({"error": "Post not found"}), 404
         
-        # Check if the user already liked the post
-        existing_like = Like.query.filter_by(user_id=user_id, post_id=post_id).first()
-        if existing_like:
-            # If the user already liked the post, remove the like
-            db.session.delete(existing_like)
-            db.session.commit()
-            return jsonify({"message": "Like removed", "likes": post.like_count()})
-        
-        # If the user hasn't liked the post yet, add a like
-        new_like = Like(user_id=user_id, post_id=post_id)
-        db.session.add(new_like)
+        # Toggle: remove an existing like, otherwise insert one. The counter is
+        # adjusted in SQL by the number of rows actually affected, so concurrent
+        # double-taps can neither double count nor create duplicate likes.
+        removed = Like.query.filter_by(user_id=user_id, post_id=post_id).delete(synchronize_session=False)
+        if removed:
+            delta, message = -removed, "Like removed"
+        else:
+            delta, message = insert_ignore(Like, user_id=user_id, post_id=post_id), "Post liked"
+
+        if delta:
+            Post.query.filter_by(id=post_id).update(
+                {Post.like_count: Post.like_count + delta}, synchronize_session=False
+            )
+            bump_versions(f"user_posts:{post.user_id}")
         db.session.commit()
+        if delta:
+            bump_shared_versions("feeds")
+        cache.invalidate("feeds", f"user_posts:{post.user_id}")
 
-        return jsonify({"message": "Post liked", "likes": post.like_count()})
+        likes = db.session.query(Post.like_count).filter_by(id=post_id).scalar()
+        return jsonify({"message": message, "likes": likes})
     
     except Exception as e:
         print(f"Error in like_post: {e}")
@@ -515,7 +1246,10 @@ def add_comment(post_id):
 
         new_comment = Comment(content=comment_content, user_id=user_id, post_id=post.id)
         db.session.add(new_comment)
+        bump_versions(f"comments:{post.id}")
         db.session.commit()
+        bump_shared_versions("feeds")
+        cache.invalidate("feeds", f"comments:{post.id}")
 
         return jsonify({
             "id": new_comment.id,
@@ -533,6 +1267,8 @@ def add_comment(post_id):
 
 # New endpoint to get comments for a specific post
 @app.route('/api/posts/<int:post_id>/comments', methods=['GET'])
+@conditional(lambda post_id: [f"comments:{post_id}"])
+@cache.cached(lambda post_id: f"comments:{post_id}", vary=cached_under_etag)
 def get_comments(post_id):
     try:
         # Fetch comments for the post
@@ -578,15 +1314,13 @@ def upload_sidebar_image():
             return jsonify({"error": "No image provided or invalid format"}), 400
 
         filename = secure_filename(image.filename)
-        # Create folder if it does not exist
-        if not os.path.exists(app.config["UPLOAD_FOLDER"]):
-            os.makedirs(app.config["UPLOAD_FOLDER"])
 
-        # Save image to the folder
-        image.save(os.path.join(app.config["UPLOAD_FOLDER"], filename))
+        # Save image to the storage backend and rebuild the catalogue
+        storage.save(f"{SIDEBAR_DIR}/{filename}", image.stream, content_type=image.mimetype)
+        sidebar_catalogue.refresh()
 
         # Save image URL to return
-        image_url = f"/static/sidebar_images/{filename}"
+        image_url = public_url(f"{SIDEBAR_DIR}/{filename}")
 
         return jsonify({"message": "Image uploaded successfully", "image_url": image_url}), 201
 
@@ -601,38 +1335,35 @@ ALLOWED_EXTENSIONS = {"png", "jpg", "jpeg", "gif"}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+SIDEBAR_DIR = "sidebar_images"
+sidebar_catalogue = SidebarCatalogue(storage, SIDEBAR_DIR, allowed_file)
+
 @app.route("/api/sidebar_images", methods=["GET"])
 def get_sidebar_images():
     try:
-        # Define the folder path
-        folder_path = os.path.join(app.root_path, "static", "sidebar_images")
-        
-        # Ensure the folder exists
-        if not os.path.exists(folder_path):
-            return jsonify({"error": "Sidebar images folder not found"}), 404
-        
-        # List all allowed image files in the directory
-        files = [f for f in os.listdir(folder_path) if allowed_file(f)]
-
-        if not files:
+        catalogue = sidebar_catalogue.current()
+        if not catalogue.entries:
             return jsonify({"error": "No images found in the sidebar folder"}), 404
 
-        # Construct response with filenames and URLs
-        images = [
-            {
-                "filename": filename,
-                "url": url_for('serve_sidebar_image', filename=filename, _external=True),
-                "title": os.path.splitext(filename)[0]  # Use filename (without extension) as a placeholder title
-            }
-            for filename in files
-        ]
+        # Page through images sorted by filename; ?after= takes the previous next_cursor
+        limit = page_size_arg('SIDEBAR_PAGE_SIZE', 'SIDEBAR_MAX_PAGE_SIZE')
+        after = request.args.get("after")
+        base_url = storage.url(f"{SIDEBAR_DIR}/")
+        body = catalogue.page(base_url, after, limit)
 
-        return jsonify(images), 200
+        response = app.response_class(body, status=200, mimetype="application/json")
+        response.set_etag(hashlib.sha1(f"{catalogue.stamp}:{request.full_path}:{base_url}".encode()).hexdigest()[:24])
+        return response.make_conditional(request)
 
     except Exception as e:
         app.logger.error(f"Error fetching sidebar images: {str(e)}")
         return jsonify({"error": f"Internal Server Error: {str(e)}"}), 500
 
+@app.route("/api/cache/stats", methods=["GET"])
+@jwt_required()
+def get_cache_stats():
+    return jsonify({**cache.stats(), "friend_index": friend_index.stats()}), 200
+
 #endpoint to send friend request
 @app.route('/api/send-friend-request', methods=['POST'])
 @jwt_required()
@@ -667,14 +1398,15 @@ def send_friend_request():
     db.session.commit()  # Commit to generate friend_request.id
 
     # Create a notification for the recipient, linking to the friend request
-    notification = Notification(
+    notification = add_notification(
         user_id=recipient_id,
         message="You have a new friend request!",
         type="friend_request",
         friend_request_id=friend_request.id  # Store request ID for reference
     )
-    db.session.add(notification)
+    bump_versions(f"suggestions:{current_user_id}")
     db.session.commit()
+    push_notification(notification, db.session.get(User, current_user_id))
 
     return jsonify({"message": "Friend request sent!"}), 201
 
@@ -682,6 +1414,8 @@ def send_friend_request():
 
 @app.route("/api/user/<int:user_id>", methods=["GET"])
 @jwt_required()
+@conditional(lambda user_id: [f"profile:{user_id}", f"friends:{get_jwt_identity()}", f"friends:{user_id}"],
+             vary=lambda: friend_index_state(get_jwt_identity(), request.view_args["user_id"]))
 def get_user_by_id(user_id):
     try:
         # Get the ID of the currently authenticated user
@@ -693,17 +1427,12 @@ def get_user_by_id(user_id):
         if not user:
             return jsonify({"error": "User not found"}), 404
 
-        # Check if the logged-in user and the requested user are friends
-        is_friend = Friendship.query.filter(
-            ((Friendship.user_id == current_user_id) & (Friendship.friend_id == user_id)) |
-            ((Friendship.user_id == user_id) & (Friendship.friend_id == current_user_id))
-        ).first() is not None
+        # Friendships are stored in both directions, so the viewer's friend array answers this
+        is_friend = friend_index.is_friend(current_user_id, user_id)
 
-        # Generate a URL for the profile picture
-        picture_url = (
-            url_for('serve_image', filename=user.picture, _external=True)
-            if user.picture else None
-        )
+        # Generate a URL for the profile picture (full-size derivative when rendered)
+        full = variant_paths([user.picture], "full")
+        picture_url = public_url(full.get(user.picture, user.picture))
 
         # Return user details, including is_friend status
         return jsonify({
@@ -713,6 +1442,7 @@ def get_user_by_id(user_id):
             'location': user.location,
             'picture': picture_url,
             'is_friend': is_friend,  # Added field
+            'mutual_friends': friend_index.mutual_count(current_user_id, user_id),
         }), 200
 
     except Exception as e:
@@ -727,8 +1457,55 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import case
 from sqlalchemy.orm import aliased
 
+# ----- Notifications -----
+# users.unread_notifications counts the unread notifications get_notifications
+# shows, maintained in the same transaction as the rows. New notifications
+# are pushed to the recipient's user_<id> room as a "notification" event and
+# every drop in the count as "notifications_read", so clients need not poll.
+
+def add_notification(**values):
+    # Add a notification in the caller's transaction; push it once committed
+    notification = Notification(**values)
+    db.session.add(notification)
+    db.session.flush()
+    adjust_unread_notifications(values["user_id"], 1)
+    return notification
+
+def adjust_unread_notifications(user_id, delta):
+    if delta:
+        User.query.filter_by(id=user_id).update(
+            {User.unread_notifications: User.unread_notifications + delta}, synchronize_session=False
+        )
+        bump_versions(f"notifications:{user_id}")
+
+def unread_notifications_of(user_id):
+    return db.session.query(User.unread_notifications).filter(User.id == user_id).scalar() or 0
+
+def push_notification(notification, originator):
+    # Compact event carrying the fields get_notifications would return for it
+    socketio.emit("notification", {
+        "id": notification.id,
+        "message": notification.message,
+        "type": notification.type,
+        "friend_request_id": notification.friend_request_id,
+        "originator_id": originator.id,
+        "originator_name": originator.name,
+        "originator_profile_pic": public_url(originator.picture) or f"{request.host_url}static/default.jpg",
+        "unread_count": unread_notifications_of(notification.user_id),
+    }, room=f"user_{notification.user_id}")
+
+def push_unread_notifications(user_id):
+    socketio.emit("notifications_read", {"unread_count": unread_notifications_of(user_id)}, room=f"user_{user_id}")
+
+@app.route('/api/notifications/unread_count', methods=['GET'])
+@jwt_required()
+@conditional(lambda: [f"notifications:{get_jwt_identity()}"])
+def get_unread_notification_count():
+    return jsonify({"unread_count": unread_notifications_of(get_jwt_identity())}), 200
+
 @app.route('/api/notifications', methods=['GET'])
 @jwt_required()
+@conditional(lambda: [f"notifications:{get_jwt_identity()}"])
 def get_notifications():
     current_user_id = get_jwt_identity()
     base_url = request.host_url  # e.g., "http://127.0.0.1:5555/"
@@ -777,11 +1554,7 @@ def get_notifications():
             "friend_request_id": notif.friend_request_id,
             "friend_request_status": notif.friend_request_status or "unknown",
             "originator_name": notif.originator_name or "Unknown User",
-            "originator_profile_pic": (
-                f"{base_url}static/{notif.originator_profile_pic}"
-                if notif.originator_profile_pic
-                else f"{base_url}static/default.jpg"
-            ),
+            "originator_profile_pic": public_url(notif.originator_profile_pic) or f"{base_url}static/default.jpg",
             "originator_id": notif.originator_id,
             "read": notif.read
         }
@@ -807,19 +1580,28 @@ def accept_friend_request():
     if not friend_request:
         return jsonify({"error": "Friend request not found"}), 404
 
-    if friend_request.recipient_id != current_user_id:
+    if str(friend_request.recipient_id) != str(current_user_id):  # JWT identities arrive as strings
         return jsonify({"error": "You are not the recipient of this friend request"}), 403
 
     if friend_request.status == "accepted":
         return jsonify({"error": "Friend request already accepted"}), 400
 
-    # Accept friend request
+    # Accept friend request; its notification drops out of the recipient's list
     friend_request.status = "accepted"
+    hidden = Notification.query.filter(
+        Notification.friend_request_id == friend_request.id,
+        Notification.user_id == friend_request.recipient_id,
+        Notification.type == "friend_request",
+        Notification.read.isnot(True)
+    ).update({Notification.read: True}, synchronize_session=False)
+    adjust_unread_notifications(friend_request.recipient_id, -hidden)
 
     # Create reciprocal friendship in both directions.
     new_friendship_1 = Friendship(user_id=current_user_id, friend_id=friend_request.requester_id)
     new_friendship_2 = Friendship(user_id=friend_request.requester_id, friend_id=current_user_id)
     db.session.add_all([new_friendship_1, new_friendship_2])
+    User.query.filter(User.id.in_([current_user_id, friend_request.requester_id])).update(
+        {User.friend_count: User.friend_count + 1}, synchronize_session=False)
 
     # Fetch the requester's details
     requester_user = User.query.get(friend_request.requester_id)
@@ -832,15 +1614,25 @@ def accept_friend_request():
         return jsonify({"error": "Recipient user not found"}), 404
 
     # Notify the requester that the friend request was accepted
-    new_notification = Notification(
+    new_notification = add_notification(
         user_id=friend_request.requester_id,  # Notify the requester
         message=f"{recipient_user.name} accepted your friend request!",
         type="friend_accept",
         friend_request_id=friend_request.id  # Associate the notification with the request
     )
-    db.session.add(new_notification)
+    bump_versions(
+        f"notifications:{friend_request.requester_id}", f"notifications:{current_user_id}",
+        f"friends:{friend_request.requester_id}", f"friends:{current_user_id}"
+    )
 
     db.session.commit()
+    friend_index.add(current_user_id, friend_request.requester_id)
+    push_notification(new_notification, recipient_user)
+    if hidden:
+        push_unread_notifications(friend_request.recipient_id)
+
+    # Seed both timelines with the new friend's recent posts
+    socketio.start_background_task(backfill_timelines, current_user_id, friend_request.requester_id)
 
     return jsonify({"message": "Friend request accepted!"}), 200
 
@@ -849,21 +1641,28 @@ def accept_friend_request():
 #Fetch friends list
 @app.route('/api/friends', methods=['GET'])
 @jwt_required()
+@conditional(lambda: [f"friends:{get_jwt_identity()}"], vary=lambda: presence.generation(get_jwt_identity()))
 def get_friends():
     current_user_id = get_jwt_identity()
 
+    # One range scan of the user's friendship rows joined to users; the friend
+    # index is only needed for the pairwise is_friend/mutual_count questions
     friends = db.session.query(
         User.id,
         User.name,
-        User.picture
+        User.picture,
+        User.last_seen
     ).join(Friendship, Friendship.friend_id == User.id
-    ).filter(Friendship.user_id == current_user_id).all()
+    ).filter(Friendship.user_id == current_user_id).order_by(User.id).all()
 
+    avatars = variant_paths([friend.picture for friend in friends], "avatar")
+    statuses = presence_of([(friend.id, friend.last_seen) for friend in friends])
     friends_list = [
         {
             "id": friend.id,
             "name": friend.name,
-            "profile_pic": f"{request.host_url}static/{friend.picture}" if friend.picture else f"{request.host_url}static/default.jpg"
+            "profile_pic": public_url(avatars.get(friend.picture, friend.picture)) or f"{request.host_url}static/default.jpg",
+            **statuses[friend.id],
         }
         for friend in friends
     ]
@@ -874,37 +1673,241 @@ def get_friends():
 @jwt_required()
 def mark_all_read():
     current_user_id = get_jwt_identity()
-    Notification.query.filter_by(user_id=current_user_id, read=False).update({"read": True})
+    Notification.query.filter(
+        Notification.user_id == current_user_id, Notification.read.isnot(True)
+    ).update({"read": True}, synchronize_session=False)
+    User.query.filter_by(id=current_user_id).update({User.unread_notifications: 0}, synchronize_session=False)
+    bump_versions(f"notifications:{current_user_id}")
     db.session.commit()
+    push_unread_notifications(current_user_id)
     return jsonify({"message": "All notifications marked as read"}), 200
 
+# ----- Friend suggestions -----
+# Scored offline from the whole friendship graph (see recommendations.py) and
+# read back per user with one range scan of unique_friend_suggestion_rank.
+# ResourceVersion "suggestions:run" records when the last run took its snapshot.
+
+def compute_friend_suggestions(full=False, top_k=None, location_weight=None):
+    # Rebuild the stored suggestions of every user (full) or only of users whose
+    # friends-of-friends changed since the last run. Returns the users rescored.
+    from recommendations import build_graph, affected_rows, suggest
+    import numpy as np
+
+    top_k = top_k or app.config['SUGGESTIONS_TOP_K']
+    location_weight = app.config['SUGGESTIONS_LOCATION_WEIGHT'] if location_weight is None else location_weight
+    started = datetime.utcnow()
+    last_run = None if full else db.session.query(ResourceVersion.updated_at).filter_by(key="suggestions:run").scalar()
+
+    users = db.session.query(User.id, func.lower(User.location)).order_by(User.id).all()
+    friend_pairs = db.session.query(Friendship.user_id, Friendship.friend_id).all()
+    pending_pairs = db.session.query(FriendRequest.requester_id, FriendRequest.recipient_id).filter(
+        FriendRequest.status == "pending").all()
+    ids, A, E = build_graph([uid for uid, _ in users], friend_pairs, pending_pairs)
+    places, locations = np.unique([location or "" for _, location in users], return_inverse=True)
+    locations = np.where(places[locations] == "", -1, locations)
+
+    if last_run is None:
+        rows = np.arange(len(ids))
+    else:
+        changed = [uid for (uid,) in db.session.query(Friendship.user_id).filter(Friendship.created_at >= last_run)]
+        rows = affected_rows(A, np.searchsorted(ids, np.intersect1d(changed, ids)))
+
+    for batch, user, suggested, rank, mutual, score in suggest(A, E, rows, top_k, locations, location_weight):
+        # Replace each batch's lists in one transaction so readers never see half of one
+        batch_ids = ids[batch].tolist()
+        for start in range(0, len(batch_ids), 500):
+            FriendSuggestion.query.filter(FriendSuggestion.user_id.in_(batch_ids[start:start + 500])).delete(
+                synchronize_session=False)
+        values = [
+            {"user_id": u, "suggested_id": s, "rank": r, "mutual_count": m, "score": sc, "computed_at": started}
+            for u, s, r, m, sc in zip(ids[user].tolist(), ids[suggested].tolist(), rank.tolist(),
+                                      mutual.tolist(), score.tolist())
+        ]
+        for start in range(0, len(values), 10000):
+            db.session.execute(FriendSuggestion.__table__.insert(), values[start:start + 10000])
+        db.session.commit()
+
+    bump_versions("suggestions:run")
+    ResourceVersion.query.filter_by(key="suggestions:run").update(
+        {ResourceVersion.updated_at: started}, synchronize_session=False)
+    db.session.commit()
+    if len(rows):
+        # Only rewritten lists invalidate the ETags of /api/suggestions
+        bump_shared_versions("suggestions")
+    return len(rows)
+
+@app.cli.command("suggest-friends")
+@click.option("--full", is_flag=True, help="Rescore every user instead of those affected since the last run")
+@click.option("--top-k", default=None, type=int, help="Suggestions stored per user (SUGGESTIONS_TOP_K)")
+@click.option("--location-weight", default=None, type=float, help="Score boost for a shared location (SUGGESTIONS_LOCATION_WEIGHT)")
+def suggest_friends_command(full, top_k, location_weight):
+    # Run from cron; the first run is always a full one
+    rescored = compute_friend_suggestions(full=full, top_k=top_k, location_weight=location_weight)
+    print(f"Rescored friend suggestions for {rescored} user(s)")
+
+@app.route('/api/suggestions', methods=['GET'])
+@jwt_required()
+@conditional(lambda: ["suggestions", f"suggestions:{get_jwt_identity()}", f"friends:{get_jwt_identity()}"])
+def get_friend_suggestions():
+    current_user_id = get_jwt_identity()
+
+    # Skip people befriended or asked since the last run
+    rows = db.session.query(FriendSuggestion.mutual_count, User).join(
+        User, User.id == FriendSuggestion.suggested_id
+    ).filter(
+        FriendSuggestion.user_id == current_user_id,
+        ~exists().where(Friendship.user_id == current_user_id, Friendship.friend_id == FriendSuggestion.suggested_id),
+        ~exists().where(FriendRequest.requester_id == current_user_id,
+                        FriendRequest.recipient_id == FriendSuggestion.suggested_id,
+                        FriendRequest.status == "pending")
+    ).order_by(FriendSuggestion.rank).all()
+
+    avatars = variant_paths([user.picture for _, user in rows], "avatar")
+    suggestions = [{
+        'id': user.id,
+        'name': user.name,
+        'location': user.location,
+        'picture': public_url(avatars.get(user.picture, user.picture)),
+        'mutual_friends': mutual_count,
+    } for mutual_count, user in rows]
+
+    return jsonify({"suggestions": suggestions}), 200
+
 # ----- Messaging API Endpoints -----
 
+# ----- Presence -----
+# A socket counts towards the user named by the JWT cookie sent with its
+# handshake, and may only join that user's room. Going online or offline
+# (including timing out on a dead worker) bumps the presence generation of the
+# user's friends and chat partners, which is part of the ETag of their
+# /api/friends and /api/chats.
+
+_presence_flush_started = False
+_presence_flush_lock = threading.Lock()
+
+def presence_watchers(user_id):
+    partner_ids = db.session.query(Conversation.partner_id).filter(Conversation.user_id == user_id)
+    return set(friend_ids_of(user_id)) | {pid for (pid,) in partner_ids}
+
+def track_presence(user_id):
+    if presence.connect(request.sid, user_id):
+        presence.bump(presence_watchers(user_id))
+    start_presence_flush()
+
+def start_presence_flush():
+    global _presence_flush_started
+    with _presence_flush_lock:
+        if _presence_flush_started:
+            return
+        _presence_flush_started = True
+    socketio.start_background_task(presence_flush_loop)
+
+def presence_flush_loop():
+    while True:
+        socketio.sleep(app.config['PRESENCE_FLUSH_INTERVAL'])
+        try:
+            with app.app_context():
+                flush_presence()
+        except Exception:
+            app.logger.exception("Presence flush failed")
+
+def flush_presence():
+    # Mark this process's sockets as seen, take users left online by dead
+    # workers offline, then write every last_seen changed since the previous
+    # flush (by any worker) in one batched UPDATE
+    presence.refresh()
+    watchers = set()
+    for user_id in presence.expire():
+        watchers |= presence_watchers(user_id)
+    if watchers:
+        presence.bump(watchers)
+    seen = presence.drain()
+    if seen:
+        users = User.__table__
+        db.session.execute(
+            users.update().where(users.c.id == bindparam("uid")).values(last_seen=bindparam("seen")),
+            [{"uid": user_id, "seen": datetime.utcfromtimestamp(stamp)} for user_id, stamp in seen.items()]
+        )
+        db.session.commit()
+
+def presence_of(users):
+    # {user_id: {"online", "last_seen"}} for (id, last_seen) rows, in one presence
+    # lookup. last_seen is only reported while offline, so it changes together
+    # with the presence generation.
+    live = presence.lookup([user_id for user_id, _ in users])
+    result = {}
+    for user_id, last_seen in users:
+        online, stamp = live.get(user_id, (False, None))
+        if stamp is not None:
+            last_seen = datetime.utcfromtimestamp(stamp)
+        result[user_id] = {
+            "online": online,
+            "last_seen": last_seen.isoformat() if last_seen and not online else None,
+        }
+    return result
+
 # ---------------------------
 # Socket.IO event handlers
 @socketio.on("connect")
 def handle_connect():
+    try:
+        verify_jwt_in_request(optional=True)
+        user_id = get_jwt_identity()
+    except Exception:  # an expired or invalid cookie still lets the socket connect
+        user_id = None
+    if user_id:
+        track_presence(user_id)
     print("Client connected")
 
 @socketio.on("disconnect")
 def handle_disconnect():
+    user_id = presence.disconnect(request.sid)
+    if user_id is not None:
+        presence.bump(presence_watchers(user_id))
     print("Client disconnected")
 
 @socketio.on("join_chat")
-def handle_join_chat(data):
-    user_id = data.get("user_id")
+def handle_join_chat(data=None):
+    # The room is the socket's own user's; a user_id in the payload is ignored
+    user_id = presence.user(request.sid)
+    if user_id is None:
+        return {"error": "Authentication required"}
     join_room(f"user_{user_id}")
     print(f"User {user_id} joined room user_{user_id}")
 
 @socketio.on("leave_chat")
-def handle_leave_chat(data):
-    user_id = data.get("user_id")
+def handle_leave_chat(data=None):
+    user_id = presence.user(request.sid)
+    if user_id is None:
+        return
     leave_room(f"user_{user_id}")
     print(f"User {user_id} left room user_{user_id}")
 
 
 # --- Messaging Endpoints ---
 
+def record_message(message):
+    # Keep both sides' inbox rows current for a new (flushed) message, in the caller's transaction
+    sender_id, receiver_id = int(message.sender_id), int(message.receiver_id)
+    insert_ignore(Conversation, [
+        {"user_id": user_id, "partner_id": partner_id, "last_message_at": message.timestamp, "unread_count": 0}
+        for user_id, partner_id in {(sender_id, receiver_id), (receiver_id, sender_id)}
+    ])
+    both_sides = or_(
+        and_(Conversation.user_id == sender_id, Conversation.partner_id == receiver_id),
+        and_(Conversation.user_id == receiver_id, Conversation.partner_id == sender_id)
+    )
+    # Guarded so a slower concurrent send can't move the preview back to an older message
+    Conversation.query.filter(
+        both_sides, or_(Conversation.last_message_id.is_(None), Conversation.last_message_id < message.id)
+    ).update({
+        Conversation.last_message_id: message.id,
+        Conversation.last_message_at: message.timestamp
+    }, synchronize_session=False)
+    if sender_id != receiver_id:
+        Conversation.query.filter_by(user_id=receiver_id, partner_id=sender_id).update(
+            {Conversation.unread_count: Conversation.unread_count + 1}, synchronize_session=False)
+
 @app.route("/messages/send", methods=["POST"])
 @jwt_required()
 def send_message():
@@ -918,14 +1921,24 @@ def send_message():
         return jsonify({"error": "Receiver and message are required"}), 400
 
     current_user_id = get_jwt_identity()
+    media_object = media_object_for(media_url) if media_url else None
     message = Message(
         sender_id=current_user_id,
         receiver_id=receiver_id,
         message=message_text,
         media_url=media_url,
-        media_type=media_type
+        media_type=media_type,
+        media_object_id=media_object.id if media_object else None
     )
     db.session.add(message)
+    db.session.flush()
+    record_message(message)
+    if media_object:
+        retain_media(media_object.id)
+    bump_versions(
+        conversation_key(current_user_id, receiver_id),
+        f"chats:{current_user_id}", f"chats:{receiver_id}"
+    )
     db.session.commit()
 
     # Get sender info to include in event payload
@@ -946,41 +1959,112 @@ def send_message():
 
     return jsonify({"message": "Message sent successfully"}), 201
 
+# Conversation history one page at a time, walking back from the newest message.
+# Each page is listed oldest first; pass next_cursor back as ?before_id= for older messages.
 @app.route("/messages/<int:user_id>", methods=["GET"])
 @jwt_required()
+@conditional(lambda user_id: [conversation_key(get_jwt_identity(), user_id)])
 def get_messages(user_id):
-    current_user_id = get_jwt_identity()
-    messages = Message.query.filter(
-        ((Message.sender_id == current_user_id) & (Message.receiver_id == user_id)) |
-        ((Message.sender_id == user_id) & (Message.receiver_id == current_user_id))
-    ).order_by(Message.timestamp.asc()).all()
+    current_user_id = int(get_jwt_identity())
+    limit = page_size_arg('MESSAGES_PAGE_SIZE', 'MESSAGES_MAX_PAGE_SIZE')
+
+    cursor = None
+    before_id = request.args.get('before_id', type=int)
+    if before_id is not None:
+        cursor = db.session.query(Message.timestamp, Message.id).filter(
+            Message.id == before_id,
+            Message.sender_id.in_([current_user_id, user_id]),
+            Message.receiver_id.in_([current_user_id, user_id])
+        ).first()
+        if cursor is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    # One range scan on ix_messages_sender_receiver_ts per direction, merged here
+    candidates = []
+    for sender_id, receiver_id in ((current_user_id, user_id), (user_id, current_user_id)):
+        query = Message.query.filter(Message.sender_id == sender_id, Message.receiver_id == receiver_id)
+        if cursor:
+            query = query.filter(or_(
+                Message.timestamp < cursor[0],
+                and_(Message.timestamp == cursor[0], Message.id < cursor[1])
+            ))
+        candidates += query.order_by(Message.timestamp.desc(), Message.id.desc()).limit(limit + 1).all()
+        if sender_id == receiver_id:
+            break  # notes to self: both directions are the same range
+    candidates.sort(key=lambda msg: (msg.timestamp, msg.id), reverse=True)
+
+    has_more = len(candidates) > limit
+    messages = candidates[:limit][::-1]
+    participants = {user.id: user for user in User.query.filter(User.id.in_([current_user_id, user_id]))}
+    # The partner's watermark: every message of ours up to this id has been read
+    read_up_to_id = db.session.query(Conversation.read_up_to_id).filter_by(
+        user_id=user_id, partner_id=current_user_id).scalar()
+    media = variant_paths([msg.media_url for msg in messages if msg.media_type == "image"], "feed")
 
     result = []
     for msg in messages:
-        sender = User.query.get(msg.sender_id)
+        sender = participants.get(msg.sender_id)
         result.append({
             "id": msg.id,
             "sender_id": msg.sender_id,
             "receiver_id": msg.receiver_id,
             "message": msg.message,
-            "media_url": msg.media_url,
+            "media_url": public_url(media.get(msg.media_url, msg.media_url), legacy_dir="uploads"),
             "media_type": msg.media_type,
             "timestamp": msg.timestamp.isoformat(),
             "is_read": msg.is_read,
-            "sender_profile_pic": sender.picture,
-            "sender_name": sender.name
+            "sender_profile_pic": public_url(sender.picture) if sender else None,
+            "sender_name": sender.name if sender else "Unknown"
         })
-    return jsonify(result)
+    next_cursor = messages[0].id if has_more else None
+    return jsonify({"messages": result, "next_cursor": next_cursor, "read_up_to_id": read_up_to_id})
 
+# Marks sender_id's messages to the current user as read, optionally only up to ?up_to_id=.
+# The sender's user_<id> room gets a messages_read event with the new watermark.
 @app.route("/messages/read/<int:sender_id>", methods=["PUT"])
 @jwt_required()
 def mark_messages_as_read(sender_id):
-    current_user_id = get_jwt_identity()
-    messages = Message.query.filter_by(receiver_id=current_user_id, sender_id=sender_id, is_read=False).all()
-    for msg in messages:
-        msg.is_read = True
+    current_user_id = int(get_jwt_identity())
+    unread = and_(Message.receiver_id == current_user_id, Message.sender_id == sender_id, Message.is_read == False)
+    up_to_id = request.args.get("up_to_id", type=int)
+    if up_to_id is not None:
+        unread = and_(unread, Message.id <= up_to_id)
+
+    # One set-based UPDATE; RETURNING tells us which rows actually flipped
+    if db.engine.dialect.update_returning:
+        read_ids = [row.id for row in db.session.execute(
+            update(Message).where(unread).values(is_read=True).returning(Message.id)
+        )]
+    else:
+        read_ids = [mid for (mid,) in db.session.query(Message.id).filter(unread)]
+        if read_ids:
+            Message.query.filter(Message.id.in_(read_ids), Message.is_read == False).update(
+                {Message.is_read: True}, synchronize_session=False)
+    if not read_ids:
+        db.session.rollback()
+        return jsonify({"message": "Messages marked as read", "read_count": 0}), 200
+
+    # Advance the watermark and take exactly the flipped messages off the unread count
+    watermark = max(read_ids)
+    Conversation.query.filter_by(user_id=current_user_id, partner_id=sender_id).update({
+        Conversation.read_up_to_id: case(
+            (or_(Conversation.read_up_to_id.is_(None), Conversation.read_up_to_id < watermark), watermark),
+            else_=Conversation.read_up_to_id
+        ),
+        Conversation.unread_count: case(
+            (Conversation.unread_count > len(read_ids), Conversation.unread_count - len(read_ids)),
+            else_=0
+        )
+    }, synchronize_session=False)
+    bump_versions(conversation_key(current_user_id, sender_id), f"chats:{current_user_id}")
     db.session.commit()
-    return jsonify({"message": "Messages marked as read"}), 200
+
+    socketio.emit("messages_read", {
+        "reader_id": current_user_id,
+        "read_up_to_id": watermark,
+        "message_ids": read_ids,
+    }, room=f"user_{sender_id}")
+    return jsonify({"message": "Messages marked as read", "read_count": len(read_ids), "read_up_to_id": watermark}), 200
 
 # --- File Upload Endpoint ---
 
@@ -994,59 +2078,324 @@ def upload_file():
         return jsonify({"error": "No selected file"}), 400
 
     filename = secure_filename(file.filename)
-    file_path = os.path.join(app.config["UPLOAD_FOLDER"], filename)
-    file.save(file_path)
+    media_object, created = store_media(filename, f=file.stream)
+    db.session.commit()
+    if created:
+        submit_image(media_object.path)
+
+    # Create URL for the uploaded file; send_message links the message to it
+    file_url = public_url(media_object.path)
+    return jsonify({"media_url": file_url, "media_type": media_type_for(filename)}), 200
 
-    # Create URL for the uploaded file
-    file_url = url_for("uploaded_file", filename=filename, _external=True)
+def media_type_for(filename):
     ext = filename.rsplit(".", 1)[-1].lower()
     if ext in ["jpg", "jpeg", "png", "gif"]:
-        media_type = "image"
+        return "image"
     elif ext in ["mp4", "webm", "ogg"]:
-        media_type = "video"
-    else:
-        media_type = "file"
-    return jsonify({"media_url": file_url, "media_type": media_type}), 200
+        return "video"
+    return "file"
 
 @app.route("/uploads/<path:filename>")
 def uploaded_file(filename):
-    return send_from_directory(app.config["UPLOAD_FOLDER"], filename)
+    return send_media(app.config["UPLOAD_FOLDER"], filename)
+
+# --- Chunked, resumable uploads ---
+# POST /api/uploads {filename, size[, sha256]} -> {upload_id, offset}, or the stored media if the digest is known;
+#      a declared sha256 is checked against the assembled file on complete
+# GET  /api/uploads/<id>                        -> {offset} to resume after a disconnect
+# PUT  /api/uploads/<id>?offset=N  (raw bytes)  -> {offset}
+# POST /api/uploads/<id>/complete               -> {media_url, media_type}
+
+def partial_path(upload_id):
+    return os.path.join(app.config["CHUNK_UPLOAD_FOLDER"], upload_id)
+
+def expire_upload_sessions():
+    # Drop sessions (and their partial files) abandoned for longer than UPLOAD_SESSION_TTL
+    cutoff = datetime.utcnow() - app.config["UPLOAD_SESSION_TTL"]
+    stale = [sid for (sid,) in db.session.query(UploadSession.id).filter(UploadSession.created_at < cutoff)]
+    for upload_id in stale:
+        if os.path.exists(partial_path(upload_id)):
+            os.remove(partial_path(upload_id))
+    if stale:
+        UploadSession.query.filter(UploadSession.id.in_(stale)).delete(synchronize_session=False)
+
+def get_upload_session(upload_id):
+    session = db.session.get(UploadSession, upload_id)
+    if not session or str(session.user_id) != str(get_jwt_identity()):
+        abort(404)
+    return session
+
+@app.route("/api/uploads", methods=["POST"])
+@jwt_required()
+def init_upload():
+    data = request.get_json() or {}
+    filename = secure_filename(data.get("filename") or "")
+    size = data.get("size")
+
+    if not filename or not isinstance(size, int) or size <= 0:
+        return jsonify({"error": "filename and a positive integer size are required"}), 400
+    if size > app.config["UPLOAD_MAX_BYTES"]:
+        return jsonify({"error": "File too large", "max_bytes": app.config["UPLOAD_MAX_BYTES"]}), 413
+
+    # Clients may send the sha256 up front; content we already store needs no transfer
+    digest = (data.get("sha256") or "").lower()
+    if digest:
+        try:
+            if len(bytes.fromhex(digest)) != 32:
+                raise ValueError
+        except ValueError:
+            return jsonify({"error": "Invalid sha256"}), 400
+    existing = MediaObject.query.filter_by(digest=digest, size=size).first() if digest else None
+    if existing and lease_media(existing.id):
+        db.session.commit()
+        return jsonify({
+            "upload_id": None,
+            "complete": True,
+            "media_url": public_url(existing.path),
+            "media_type": media_type_for(filename),
+        }), 200
+
+    expire_upload_sessions()
+    session = UploadSession(id=uuid.uuid4().hex, user_id=get_jwt_identity(), filename=filename, size=size,
+                            digest=digest or None)
+    os.makedirs(app.config["CHUNK_UPLOAD_FOLDER"], exist_ok=True)
+    open(partial_path(session.id), "wb").close()
+    db.session.add(session)
+    db.session.commit()
+
+    return jsonify({
+        "upload_id": session.id,
+        "offset": 0,
+        "chunk_bytes": app.config["UPLOAD_CHUNK_BYTES"],
+    }), 201
+
+@app.route("/api/uploads/<upload_id>", methods=["GET"])
+@jwt_required()
+def get_upload_status(upload_id):
+    session = get_upload_session(upload_id)
+    return jsonify({"upload_id": session.id, "offset": session.received, "size": session.size}), 200
+
+@app.route("/api/uploads/<upload_id>", methods=["PUT"])
+@jwt_required()
+def put_upload_chunk(upload_id):
+    session = get_upload_session(upload_id)
+    offset = request.args.get("offset", type=int)
+    if offset != session.received:
+        # Client is out of sync (e.g. a retried chunk); tell it where to resume
+        return jsonify({"error": "Offset mismatch", "offset": session.received}), 409
+
+    remaining = session.size - offset
+    limit = min(remaining, app.config["UPLOAD_CHUNK_BYTES"])
+    if request.content_length is not None and request.content_length > limit:
+        return jsonify({"error": "Chunk too large", "max_bytes": limit}), 413
+
+    # Stream the body to a file of its own; never hold more than one buffer in
+    # memory. Two PUTs of the same offset (a retry while the first is still
+    # streaming) each get their own file, so their bytes can't interleave.
+    chunk_path = f"{partial_path(upload_id)}.{uuid.uuid4().hex}.chunk"
+    try:
+        written = 0
+        with open(chunk_path, "wb") as f:
+            while True:
+                buffer = request.stream.read(64 * 1024)
+                if not buffer:
+                    break
+                written += len(buffer)
+                if written > limit:
+                    return jsonify({"error": "Chunk too large", "max_bytes": limit}), 413
+                f.write(buffer)
+
+        # Claim the offset first: a concurrent chunk for it waits on this row
+        # and then matches nothing. Only the winner's bytes reach the partial file.
+        updated = UploadSession.query.filter_by(id=upload_id, received=offset).update(
+            {UploadSession.received: offset + written}, synchronize_session=False
+        )
+        if not updated:
+            db.session.rollback()
+            db.session.refresh(session)
+            return jsonify({"error": "Offset mismatch", "offset": session.received}), 409
+        try:
+            with open(chunk_path, "rb") as src, open(partial_path(upload_id), "r+b") as dest:
+                dest.seek(offset)
+                shutil.copyfileobj(src, dest, 64 * 1024)
+        except OSError:
+            db.session.rollback()
+            raise
+        db.session.commit()
+    finally:
+        if os.path.exists(chunk_path):
+            os.remove(chunk_path)
+
+    return jsonify({"upload_id": upload_id, "offset": offset + written, "size": session.size}), 200
+
+@app.route("/api/uploads/<upload_id>/complete", methods=["POST"])
+@jwt_required()
+def complete_upload(upload_id):
+    session = get_upload_session(upload_id)
+    if session.received != session.size:
+        return jsonify({"error": "Upload incomplete", "offset": session.received, "size": session.size}), 409
+
+    path = partial_path(upload_id)
+    with open(path, "rb") as f:
+        digest, size = hash_file(f)
+    if session.digest and digest != session.digest:
+        # Some chunk arrived corrupted; there is no telling which, so start over
+        os.remove(path)
+        db.session.delete(session)
+        db.session.commit()
+        return jsonify({"error": "sha256 does not match the uploaded bytes; start a new upload"}), 400
+
+    # Moved (not copied) into the content-addressed store, or dropped if already stored
+    media_object, created = store_media(session.filename, source_path=path, hashed=(digest, size))
+    db.session.delete(session)
+    db.session.commit()
+    if created:
+        submit_image(media_object.path)
+
+    return jsonify({
+        "media_url": public_url(media_object.path),
+        "media_type": media_type_for(session.filename),
+    }), 201
 
+# --- Direct uploads to object storage ---
+# POST /api/uploads/direct {filename, size, sha256} -> {upload_url, headers, token}, or the stored media if known
+#      The client PUTs the bytes to upload_url with the given headers; they never pass through this app.
+# POST /api/uploads/direct/complete {token}        -> {media_url, media_type}
 
+@app.route("/api/uploads/direct", methods=["POST"])
+@jwt_required()
+def init_direct_upload():
+    if not storage.presigned_uploads:
+        return jsonify({"error": "Direct uploads need object storage; use /api/uploads"}), 501
+
+    data = request.get_json() or {}
+    filename = secure_filename(data.get("filename") or "")
+    size = data.get("size")
+    digest = (data.get("sha256") or "").lower()
+    if not filename or not isinstance(size, int) or size <= 0 or len(digest) != 64:
+        return jsonify({"error": "filename, a positive integer size and a sha256 hex digest are required"}), 400
+    try:
+        bytes.fromhex(digest)
+    except ValueError:
+        return jsonify({"error": "Invalid sha256"}), 400
+    if size > app.config["UPLOAD_MAX_BYTES"]:
+        return jsonify({"error": "File too large", "max_bytes": app.config["UPLOAD_MAX_BYTES"]}), 413
+
+    existing = MediaObject.query.filter_by(digest=digest, size=size).first()
+    if existing and lease_media(existing.id):
+        db.session.commit()
+        return jsonify({
+            "upload_url": None,
+            "complete": True,
+            "media_url": public_url(existing.path),
+            "media_type": media_type_for(filename),
+        }), 200
+
+    # The key is derived from the declared digest and the bucket verifies the
+    # body against it, so the object can only ever hold that content
+    key = cas_path(digest, filename)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    ttl = app.config["MEDIA_PRESIGN_TTL"]
+    upload_url, headers = storage.presign_upload(key, content_type, digest, ttl)
+    token = serializer.dumps(
+        {"user_id": get_jwt_identity(), "key": key, "digest": digest, "size": size, "filename": filename},
+        salt="direct-upload"
+    )
+    return jsonify({
+        "upload_url": upload_url,
+        "method": "PUT",
+        "headers": headers,
+        "token": token,
+        "expires_in": ttl,
+    }), 201
+
+@app.route("/api/uploads/direct/complete", methods=["POST"])
+@jwt_required()
+def complete_direct_upload():
+    data = request.get_json() or {}
+    try:
+        # Generous max_age: a large PUT may start just before the URL expires
+        upload = serializer.loads(data.get("token") or "", salt="direct-upload",
+                                  max_age=2 * app.config["MEDIA_PRESIGN_TTL"])
+    except BadSignature:
+        return jsonify({"error": "Invalid or expired token"}), 400
+    if str(upload["user_id"]) != str(get_jwt_identity()):
+        return jsonify({"error": "Invalid or expired token"}), 400
+
+    size = storage.size(upload["key"])
+    if size is None:
+        return jsonify({"error": "Upload not found"}), 409
+    if size != upload["size"]:
+        return jsonify({"error": "Uploaded size does not match", "size": size}), 400
+
+    now = datetime.utcnow()
+    created = insert_ignore(MediaObject, digest=upload["digest"], path=upload["key"], size=size, ref_count=0,
+                            created_at=now, last_used_at=now)
+    # The same bytes may already be stored, possibly under another extension's key
+    media = MediaObject.query.filter_by(digest=upload["digest"]).one()
+    if not created:
+        lease_media(media.id)
+    db.session.commit()
+    if created:
+        submit_image(media.path)
+    elif media.path != upload["key"]:
+        storage.delete(upload["key"])  # a duplicate nothing refers to
+
+    return jsonify({
+        "media_url": public_url(media.path),
+        "media_type": media_type_for(upload["filename"]),
+    }), 201
+
+
+# Inbox: conversations ordered by latest activity, with the last message and unread count.
+# Pass the returned next_cursor back as ?before= to fetch the following page.
 @app.route("/api/chats", methods=["GET"])
 @jwt_required()
+@conditional(lambda: [f"chats:{get_jwt_identity()}"], vary=lambda: presence.generation(get_jwt_identity()))
 def get_chats():
     current_user_id = get_jwt_identity()
-    # Query all messages where current user is either sender or receiver.
-    messages = Message.query.filter(
-        (Message.sender_id == current_user_id) | (Message.receiver_id == current_user_id)
-    ).all()
-
-    # Use a set to collect unique partner IDs.
-    partner_ids = set()
-    for msg in messages:
-        if msg.sender_id != current_user_id:
-            partner_ids.add(msg.sender_id)
-        if msg.receiver_id != current_user_id:
-            partner_ids.add(msg.receiver_id)
-
-    # Build the chat list with user details.
+    limit = page_size_arg('CHATS_PAGE_SIZE', 'CHATS_MAX_PAGE_SIZE')
+
+    # One range scan on ix_conversations_user_last, partners and last messages joined in
+    query = (
+        db.session.query(Conversation, User, Message)
+        .join(User, User.id == Conversation.partner_id)
+        .outerjoin(Message, Message.id == Conversation.last_message_id)
+        .filter(Conversation.user_id == current_user_id, Conversation.partner_id != current_user_id)
+    )
+    before = request.args.get('before')
+    if before:
+        cursor = decode_cursor(before)
+        if cursor is None:
+            return jsonify({"error": "Invalid cursor"}), 400
+        query = query.filter(or_(
+            Conversation.last_message_at < cursor[0],
+            and_(Conversation.last_message_at == cursor[0], Conversation.id < cursor[1])
+        ))
+    rows = query.order_by(Conversation.last_message_at.desc(), Conversation.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    statuses = presence_of([(user.id, user.last_seen) for _, user, _ in rows])
     chats = []
-    for pid in partner_ids:
-        user = User.query.get(pid)
-        if user:
-            # Generate a URL for the user's profile picture if needed.
-            picture_url = (
-                url_for("serve_image", filename=user.picture, _external=True)
-                if user.picture else None
-            )
-            chats.append({
-                "id": user.id,
-                "name": user.name,
-                "profile_pic": picture_url or "/default-profile.png"
-            })
+    for conversation, user, last in rows:
+        chats.append({
+            "id": user.id,
+            "name": user.name,
+            "profile_pic": public_url(user.picture) or "/default-profile.png",
+            **statuses[user.id],
+            "unread_count": conversation.unread_count,
+            "last_message": {
+                "id": last.id,
+                "sender_id": last.sender_id,
+                "message": last.message,
+                "media_type": last.media_type,
+                "timestamp": last.timestamp.isoformat(),
+            } if last else None,
+        })
 
-    return jsonify(chats), 200
+    next_cursor = encode_cursor(rows[-1][0].last_message_at, rows[-1][0].id) if has_more else None
+    return jsonify({"chats": chats, "next_cursor": next_cursor}), 200
 
 
 
@@ -0,0 +1,148 @@
+import gzip
+import mimetypes
+import os
+import re
+import threading
+
+from flask import current_app
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; only gzip siblings are produced without it
+    brotli = None
+
+
+# Folders under static/ that are written at runtime (user uploads); they are
+# served from disk as before and never enter the startup manifest.
+RUNTIME_DIRS = {"uploads", "images", "sidebar_images", "variants", "media"}
+
+# Vite emits content-hashed names such as assets/index-BG-wIWYk.css
+HASHED_NAME = re.compile(r"-[A-Za-z0-9_-]{8}\.[A-Za-z0-9]+$")
+COMPRESSIBLE = (".js", ".css", ".html", ".svg", ".json", ".map", ".txt")
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))  # preference order
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, no-cache"
+
+
+def _walk(folder, exclude):
+    for root, dirs, files in os.walk(folder):
+        if root == folder:
+            dirs[:] = [d for d in dirs if d not in exclude]
+        for name in files:
+            # Skip Windows ADS leftovers (":Zone.Identifier") and compressed siblings
+            if ":" in name or name.endswith((".gz", ".br")):
+                continue
+            path = os.path.join(root, name)
+            yield os.path.relpath(path, folder).replace(os.sep, "/"), path
+
+
+def compress_assets(folder, exclude=RUNTIME_DIRS, min_size=1024):
+    # Write .gz (and .br when brotli is installed) next to every compressible
+    # file that lacks an up-to-date sibling. Returns the number written.
+    written = 0
+    for _, path in _walk(folder, exclude):
+        if not path.endswith(COMPRESSIBLE) or os.path.getsize(path) < min_size:
+            continue
+        mtime = os.path.getmtime(path)
+        data = None
+        for encoding, suffix in ENCODINGS:
+            if encoding == "br" and brotli is None:
+                continue
+            target = path + suffix
+            if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+                continue
+            if data is None:
+                with open(path, "rb") as f:
+                    data = f.read()
+            packed = brotli.compress(data) if encoding == "br" else gzip.compress(data, 9, mtime=0)
+            with open(target + ".tmp", "wb") as f:
+                f.write(packed)
+            os.replace(target + ".tmp", target)
+            written += 1
+    return written
+
+
+class StaticFile:
+    """One manifest entry: metadata captured at startup, bytes loaded on first hit."""
+
+    def __init__(self, rel_path, path):
+        stat = os.stat(path)
+        self.rel_path = rel_path
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.last_modified = stat.st_mtime
+        self.etag = f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+        self.immutable = rel_path.startswith("assets/") and HASHED_NAME.search(rel_path) is not None
+        self.variants = {
+            encoding: path + suffix
+            for encoding, suffix in ENCODINGS
+            if os.path.exists(path + suffix)
+        }
+        self.headers = {}
+        self._bodies = {}
+        self._lock = threading.Lock()
+
+    def _body(self, encoding):
+        body = self._bodies.get(encoding)
+        if body is None:
+            with self._lock:
+                with open(self.variants.get(encoding, self.path), "rb") as f:
+                    body = f.read()
+                self._bodies[encoding] = body
+        return body
+
+    def response(self, request):
+        encoding = None
+        for candidate in self.variants:
+            if request.accept_encodings[candidate]:
+                encoding = candidate
+                break
+
+        response = current_app.response_class(self._body(encoding), mimetype=self.mimetype)
+        response.set_etag(f"{self.etag}-{encoding}" if encoding else self.etag)
+        response.last_modified = self.last_modified
+        response.headers["Cache-Control"] = IMMUTABLE if self.immutable else REVALIDATE
+        if self.variants:
+            response.vary.add("Accept-Encoding")
+        if encoding:
+            response.headers["Content-Encoding"] = encoding
+        response.headers.update(self.headers)
+        return response.make_conditional(request)
+
+
+class StaticManifest:
+    """Startup snapshot of the built SPA under static/ (minus RUNTIME_DIRS)."""
+
+    def __init__(self, folder, exclude=RUNTIME_DIRS):
+        self.folder = folder
+        self.exclude = exclude
+        self.files = {}
+        self.build()
+
+    def build(self):
+        files = {}
+        if os.path.isdir(self.folder):
+            for rel_path, path in _walk(self.folder, self.exclude):
+                files[rel_path] = StaticFile(rel_path, path)
+        index = files.get("index.html")
+        if index:
+            with open(index.path, encoding="utf-8") as f:
+                preload = preload_links(f.read())
+            if preload:
+                index.headers["Link"] = preload
+        self.files = files
+
+    def get(self, rel_path):
+        return self.files.get(rel_path)
+
+
+SCRIPT_SRC = re.compile(r'<script[^>]*type="module"[^>]*src="([^"]+)"')
+STYLESHEET_HREF = re.compile(r'<link[^>]*rel="stylesheet"[^>]*href="([^"]+)"')
+
+
+def preload_links(html):
+    # Link header announcing index.html's entry chunks so they are fetched early
+    links = [f"<{src}>; rel=modulepreload" for src in SCRIPT_SRC.findall(html)]
+    links += [f"<{href}>; rel=preload; as=style" for href in STYLESHEET_HREF.findall(html)]
+    return ", ".join(links)
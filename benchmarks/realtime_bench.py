@@ -0,0 +1,214 @@
+"""Concurrent chat sockets and HTTP throughput of one node, per gunicorn worker profile.
+
+For each WORKER_PROFILE (see gunicorn_config.py) this starts gunicorn on a
+seeded database, then:
+
+1. opens --sockets Socket.IO clients, each joined to its user_<id> room;
+2. sends --messages chat messages over HTTP and times their delivery to the
+   receivers' sockets;
+3. fires --requests GET /api/feeds requests, --concurrency at a time, while
+   the sockets stay connected.
+
+Usage (from the repository root, with aiohttp and python-socketio[asyncio_client]):
+
+    python benchmarks/realtime_bench.py --profiles sync,gthread,gevent --sockets 500
+
+Each profile runs --workers gunicorn workers (default 1, so profiles compare
+per process). More than one worker needs SOCKETIO_MESSAGE_QUEUE in the
+environment, otherwise messages only reach sockets on the sending worker.
+Pass --database-url to run against Postgres instead of a throwaway SQLite file.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def seed(database_url, users):
+    # Create the schema and users in a separate process so this one never imports app.py
+    script = f"""
+import logging, sys
+logging.disable(logging.INFO)
+sys.path.insert(0, {ROOT!r})
+from app import app, db
+from models import User
+from flask_jwt_extended import create_access_token
+with app.app_context():
+    db.create_all()
+    start = db.session.query(db.func.max(User.id)).scalar() or 0
+    db.session.add_all([User(name=f"bench{{i}}", email=f"bench{{start + i}}@example.com", password="x")
+                        for i in range({users})])
+    db.session.commit()
+    ids = [u.id for u in User.query.filter(User.id > start).order_by(User.id)]
+    print(__import__("json").dumps([[uid, create_access_token(identity=str(uid))] for uid in ids]))
+"""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    out = subprocess.run([sys.executable, "-c", script], env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(profile, port, database_url, workers):
+    env = dict(os.environ, WORKER_PROFILE=profile, DATABASE_URL=database_url, WEB_CONCURRENCY=str(workers))
+    env.pop("SOCKETIO_ASYNC_MODE", None)  # let gunicorn_config.py match it to the profile
+    server = subprocess.Popen(
+        ["gunicorn", "app:app", "-c", "gunicorn_config.py", "--bind", f"127.0.0.1:{port}", "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"gunicorn ({profile}) did not start")
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000, 1)
+
+
+async def run_profile(profile, users, args):
+    import aiohttp
+    import socketio
+
+    port = free_port()
+    server = start_server(profile, port, args.database_url, args.workers)
+    base = f"http://127.0.0.1:{port}"
+    sender_id, sender_token = users[0]
+    receivers = users[1:args.sockets + 1]
+    clients, latencies = [], []
+    result = {"profile": profile}
+    try:
+        # 1. Sockets
+        gate = asyncio.Semaphore(100)
+
+        async def connect(user_id, token):
+            client = socketio.AsyncClient(reconnection=False)
+
+            @client.on("new_message")
+            async def on_message(data):
+                latencies.append(time.perf_counter() - float(data["message"]))
+
+            async with gate:
+                try:
+                    # The handshake's cookie decides the user, and so the room join_chat joins
+                    await asyncio.wait_for(client.connect(base, headers={"Cookie": f"access_token={token}"},
+                                                          transports=[args.transport]), args.timeout)
+                    await client.emit("join_chat", {"user_id": user_id})
+                    clients.append((user_id, client))
+                except Exception:
+                    # Workers that can't hold another socket leave the connect hanging
+                    await client.disconnect()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(connect(uid, token) for uid, token in receivers))
+        result["sockets"] = f"{len(clients)}/{len(receivers)}"
+        result["connect_s"] = round(time.perf_counter() - started, 2)
+
+        timeout = aiohttp.ClientTimeout(total=args.timeout)
+        async with aiohttp.ClientSession(cookies={"access_token": sender_token}, timeout=timeout) as session:
+            # 2. Message delivery
+            connected = [uid for uid, _ in clients]
+            sent = 0
+
+            async def send(count):
+                nonlocal sent
+                for _ in range(count):
+                    try:
+                        async with session.post(f"{base}/messages/send", json={
+                            "receiver_id": random.choice(connected), "message": repr(time.perf_counter())
+                        }) as response:
+                            sent += response.status == 201
+                    except Exception:
+                        pass
+
+            if connected:
+                senders = min(args.concurrency, args.messages)
+                await asyncio.gather(*(send(len(range(i, args.messages, senders))) for i in range(senders)))
+                await asyncio.sleep(2)
+            result["delivered"] = f"{len(latencies)}/{sent}"
+            result["delivery_p50_ms"] = percentile(latencies, 50)
+            result["delivery_p95_ms"] = percentile(latencies, 95)
+
+            # 3. HTTP while the sockets stay open
+            times, errors = [], 0
+            queue = asyncio.Queue()
+            for _ in range(args.requests):
+                queue.put_nowait(None)
+
+            async def worker():
+                nonlocal errors
+                while not queue.empty():
+                    queue.get_nowait()
+                    t = time.perf_counter()
+                    try:
+                        async with session.get(f"{base}/api/feeds?limit=20") as response:
+                            await response.read()
+                            if response.status != 200:
+                                errors += 1
+                                continue
+                        times.append(time.perf_counter() - t)
+                    except Exception:
+                        errors += 1
+
+            started = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+            result["http_rps"] = round(len(times) / elapsed, 1)
+            result["http_p50_ms"] = percentile(times, 50)
+            result["http_p95_ms"] = percentile(times, 95)
+            result["http_errors"] = errors
+    finally:
+        await asyncio.gather(*(client.disconnect() for _, client in clients), return_exceptions=True)
+        server.terminate()
+        server.wait()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--profiles", default="sync,gthread,gevent")
+    parser.add_argument("--sockets", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--transport", default="websocket", choices=["websocket", "polling"])
+    parser.add_argument("--timeout", type=float, default=10)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    if not args.database_url:
+        args.database_url = f"sqlite:///{tempfile.mkdtemp()}/bench.db"
+    os.environ.setdefault("JWT_SECRET_KEY", os.urandom(16).hex())  # shared by the seeder and every worker
+
+    users = seed(args.database_url, args.sockets + 1)
+    rows = [asyncio.run(run_profile(profile, users, args)) for profile in args.profiles.split(",")]
+
+    columns = list(rows[0])
+    print(" | ".join(columns))
+    for row in rows:
+        print(" | ".join(str(row.get(column)) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Full-text search latency over posts as the table grows into the millions.
+
+Fills a database with --posts synthetic posts (8-30 words drawn from a Zipf
+vocabulary of --vocabulary words, so a few words are in most posts and most
+words are rare), then times the query /api/search runs (search.match_posts)
+for terms of different frequencies:
+
+- common / mid / rare: one word in ~20%, ~1% and ~0.01% of posts;
+- two words: two mid-frequency words together;
+- prefix: the first letters of a mid-frequency word, as typed.
+
+For each it reports the number of matches and p50/p95 latency of the first
+page and of page --depth, reached by following the cursors.
+
+Usage (from the repository root):
+
+    python benchmarks/search_bench.py --posts 2000000
+    python benchmarks/search_bench.py --posts 2000000 --database-url postgresql://localhost/bench
+
+With no --database-url a throwaway SQLite file (FTS5) is used. The database
+must be empty or hold a previous run's data: --posts only adds the rows missing.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def word(i):
+    # Distinct five-letter words; the multiplier is coprime with 26**5, so this is a bijection
+    n = i * 2654435761 % 26 ** 5
+    out = ""
+    for _ in range(5):
+        n, r = divmod(n, 26)
+        out += "abcdefghijklmnopqrstuvwxyz"[r]
+    return out
+
+
+def fill(db, posts, vocabulary, rng):
+    from sqlalchemy import text
+    from models import User
+
+    if not db.session.query(User.id).first():
+        db.session.execute(User.__table__.insert(), [
+            {"name": f"bench{i}", "email": f"bench{i}@example.com", "password": "x"} for i in range(1000)
+        ])
+        db.session.commit()
+    user_ids = [uid for (uid,) in db.session.query(User.id)]
+    have = db.session.execute(text("SELECT count(*) FROM posts")).scalar()
+    weights = 1.0 / np.arange(1, vocabulary + 1)
+    weights /= weights.sum()
+    words = np.array([word(i) for i in range(vocabulary)])
+    started = time.perf_counter()
+    for start in range(have, posts, 50000):
+        count = min(50000, posts - start)
+        lengths = rng.integers(8, 31, count)
+        drawn = words[rng.choice(vocabulary, lengths.sum(), p=weights)]
+        bounds = np.cumsum(lengths)[:-1]
+        db.session.execute(text(
+            "INSERT INTO posts (user_id, content, timestamp, like_count) VALUES (:user_id, :content, :ts, 0)"
+        ), [
+            {"user_id": user_ids[i % len(user_ids)], "content": " ".join(chunk), "ts": "2026-01-01 00:00:00"}
+            for i, chunk in enumerate(np.split(drawn, bounds))
+        ])
+        db.session.commit()
+        print(f"  {start + count} posts ({time.perf_counter() - started:.0f}s)", file=sys.stderr)
+    db.session.execute(text("ANALYZE posts"))  # fresh statistics, as autovacuum would give Postgres
+    db.session.commit()
+    return words, weights
+
+
+def pick(words, weights, share):
+    # The word whose expected share of posts (20 words a post) is closest to `share`
+    per_post = 1 - (1 - weights) ** 20
+    return words[int(np.abs(per_post - share).argmin())]
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * pct / 100))] * 1000, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--posts", type=int, default=2_000_000)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--runs", type=int, default=20, help="Timed runs per query")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=5)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite:///{tempfile.mkdtemp()}/search_bench.db"
+    sys.path.insert(0, ROOT)
+    from app import app, db
+    from search import match_posts, search_terms
+
+    rng = np.random.default_rng(0)
+    with app.app_context():
+        db.create_all()  # also creates the FTS5 tables or tsvector columns
+        words, weights = fill(db, args.posts, args.vocabulary, rng)
+        mid = pick(words, weights, 0.01)
+        queries = {
+            "common": pick(words, weights, 0.2),
+            "mid": mid,
+            "rare": pick(words, weights, 0.0001),
+            "two words": f"{mid} {pick(words, weights, 0.02)}",
+            "prefix": mid[:3],
+        }
+
+        candidates = app.config["SEARCH_MAX_CANDIDATES"]
+        print(f"{db.engine.dialect.name}, {args.posts} posts, newest {candidates} matches ranked")
+        columns = ["query", "terms", "matches", "first_p50_ms", "first_p95_ms", f"page{args.depth}_p50_ms"]
+        print(" | ".join(columns))
+        for name, query in queries.items():
+            terms = search_terms(query)
+            matches = len(match_posts(db.session, terms, args.posts))
+            first, deep = [], []
+            for _ in range(args.runs):
+                started = time.perf_counter()
+                page = match_posts(db.session, terms, args.limit + 1, candidates=candidates)
+                first.append(time.perf_counter() - started)
+                for _ in range(args.depth - 1):
+                    if len(page) <= args.limit:
+                        break
+                    started = time.perf_counter()
+                    row_id, score = page[args.limit - 1]
+                    page = match_posts(db.session, terms, args.limit + 1, (score, row_id), candidates)
+                deep.append(time.perf_counter() - started)
+            print(" | ".join(str(value) for value in [
+                name, query, matches, percentile(first, 50), percentile(first, 95), percentile(deep, 50)
+            ]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""Friend-of-friend scoring time and memory as the friendship graph grows.
+
+For each --sizes user count this generates a random graph with --degree
+friends per user on average (heavy-tailed: a few users have hundreds of
+friends, as in a real social graph) and times, without a database:
+
+1. build_graph: the sparse adjacency and exclusion matrices;
+2. a full run of suggest() over every user;
+3. an incremental run for --changed users with new friendships, as `flask
+   suggest-friends` does between full runs.
+
+Usage (from the repository root, with numpy and scipy):
+
+    python benchmarks/suggestions_bench.py --sizes 10000,100000,1000000 --degree 20
+"""
+import argparse
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from recommendations import BATCH_NONZEROS, affected_rows, build_graph, suggest  # noqa: E402
+
+
+def random_graph(users, degree, rng):
+    # Endpoints drawn with Zipf-like weights give a long-tailed degree distribution
+    weights = 1.0 / np.arange(1, users + 1) ** 0.5
+    weights /= weights.sum()
+    edges = users * degree // 2
+    pairs = np.column_stack([rng.choice(users, edges, p=weights), rng.integers(0, users, edges)])
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    return np.arange(users), pairs, rng.integers(-1, 50, users)  # 50 places, -1 for unknown
+
+
+def run(A, E, rows, args, locations):
+    suggestions = 0
+    started = time.perf_counter()
+    for _, user, *_ in suggest(A, E, rows, args.top_k, locations, args.location_weight, args.budget):
+        suggestions += len(user)
+    return time.perf_counter() - started, suggestions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--degree", type=int, default=20)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--location-weight", type=float, default=0.5)
+    parser.add_argument("--changed", type=int, default=100, help="Users with new friendships before the incremental run")
+    parser.add_argument("--budget", type=int, default=BATCH_NONZEROS, help="Non-zeros per scoring batch")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    rows = []
+    for users in map(int, args.sizes.split(",")):
+        ids, pairs, locations = random_graph(users, args.degree, rng)
+        started = time.perf_counter()
+        ids, A, E = build_graph(ids, pairs)
+        build = time.perf_counter() - started
+
+        full, suggestions = run(A, E, np.arange(users), args, locations)
+        changed = rng.integers(0, users, args.changed)
+        started = time.perf_counter()
+        affected = affected_rows(A, changed)
+        incremental, _ = run(A, E, affected, args, locations)
+        incremental += time.perf_counter() - started
+
+        rows.append({
+            "users": users,
+            "friendships": A.nnz // 2,
+            "max_degree": int(np.diff(A.indptr).max()),
+            "build_s": round(build, 2),
+            "full_s": round(full, 2),
+            "users_per_s": int(users / full),
+            "suggestions": suggestions,
+            "incremental_users": len(affected),
+            "incremental_s": round(incremental, 3),
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+        })
+
+    columns = list(rows[0])
+    print(" | ".join(columns))
+    for row in rows:
+        print(" | ".join(str(row[column]) for column in columns))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import request, current_app
+
+
+# ----- Backends -----
+# A backend stores opaque bytes under string keys and keeps per-namespace
+# generation counters. Bumping a namespace's generation makes every key built
+# from the old generation unreachable, which is how invalidation works without
+# having to enumerate keys.
+
+class LRUBackend:
+    """In-process cache bounded by entry count, with per-entry TTL."""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._generations = {}  # kept outside the LRU so they are never evicted
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def generation(self, namespace):
+        with self._lock:
+            return self._generations.get(namespace, 0)
+
+    def bump(self, namespaces):
+        with self._lock:
+            for namespace in namespaces:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class RedisBackend:
+    """Shared cache on any Redis-protocol server.
+
+    Pass ``client`` to use an existing client (e.g. a fakeredis instance in
+    tests); otherwise one is created from ``url`` with the optional ``redis``
+    package.
+    """
+
+    def __init__(self, url=None, client=None, prefix="cache:"):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, value, ex=int(ttl))
+
+    def generation(self, namespace):
+        return int(self.client.get(f"{self.prefix}gen:{namespace}") or 0)
+
+    def bump(self, namespaces):
+        # One round trip however many namespaces a write invalidates
+        pipe = self.client.pipeline(transaction=False)
+        for namespace in namespaces:
+            pipe.incr(f"{self.prefix}gen:{namespace}")
+        pipe.execute()
+
+    def stats(self):
+        try:
+            evictions = self.client.info("stats").get("evicted_keys")
+        except Exception:
+            evictions = None
+        return {
+            "backend": "redis",
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": evictions,
+        }
+
+
+def make_backend(config):
+    backend = config.get("CACHE_BACKEND", "memory")
+    if backend == "redis":
+        return RedisBackend(url=config.get("CACHE_REDIS_URL"))
+    if backend == "memory":
+        return LRUBackend(max_entries=config.get("CACHE_MAX_ENTRIES", 1024))
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+
+
+# ----- Response cache -----
+
+class ResponseCache:
+    """Caches successful JSON responses of read endpoints.
+
+    Responses are keyed by namespace generation and request path+query, so
+    write endpoints invalidate with ``cache.invalidate(namespace)``. That only
+    reaches the backend this process uses; ``vary`` adds shared state (such as
+    the response's ETag) to the key, so a body is never served under state it
+    wasn't built for.
+    """
+
+    def __init__(self, app=None, backend=None):
+        self.backend = backend
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("CACHE_BACKEND", "memory")
+        app.config.setdefault("CACHE_DEFAULT_TTL", 60)
+        app.config.setdefault("CACHE_MAX_ENTRIES", 1024)
+        if self.backend is None:
+            self.backend = make_backend(app.config)
+        app.extensions["response_cache"] = self
+
+    def cached(self, namespace, ttl=None, vary=None):
+        # ``namespace`` may be a string or a callable receiving the view kwargs,
+        # e.g. lambda post_id: f"comments:{post_id}"; vary(), if given, returns
+        # a string folded into the key
+        def decorator(view):
+            @wraps(view)
+            def wrapper(*args, **kwargs):
+                ns = namespace(**kwargs) if callable(namespace) else namespace
+                key = f"{ns}:{self.backend.generation(ns)}:{vary() if vary else ''}:{request.full_path}"
+                body = self.backend.get(key)
+                if body is not None:
+                    return current_app.response_class(body, status=200, mimetype="application/json")
+
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code == 200:
+                    self.backend.set(key, response.get_data(), ttl or current_app.config["CACHE_DEFAULT_TTL"])
+                return response
+            return wrapper
+        return decorator
+
+    def invalidate(self, *namespaces):
+        if namespaces:
+            self.backend.bump(namespaces)
+
+    def stats(self):
+        return self.backend.stats()
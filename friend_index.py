@@ -0,0 +1,160 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+
+
+# ----- Friendship index -----
+# Friendships are stored in both directions and never deleted by the app, so
+# a user's friend set only grows, and rows with ids above a watermark are all
+# there is to catch up on. Ids are handed out before commit, though, so a
+# sync re-reads from the watermark of one at least REORDER_WINDOW seconds old
+# to pick up rows that became visible out of id order.
+
+REORDER_WINDOW = 60
+
+
+class FriendIndex:
+    """Per-process index of each user's friends as a sorted ``array('q')``.
+
+    A user's array is loaded from the unique_friendship index on first use
+    and kept for up to FRIEND_INDEX_MAX_USERS users, least recently used out
+    first. Accepts in this process update the arrays directly; friendships
+    made by other workers are picked up by a watermark query issued at most
+    every FRIEND_INDEX_SYNC_INTERVAL seconds. Arrays are replaced, never
+    changed in place, so callers may keep one they were handed.
+    """
+
+    def __init__(self, app=None, db=None):
+        self.db = db
+        self.max_users = 100000
+        self.sync_interval = 1.0
+        self._friends = OrderedDict()  # user_id -> sorted array('q') of friend ids
+        self._marks = []  # (monotonic time, max friendship id) of recent syncs, oldest first
+        self._synced_at = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db=None):
+        app.config.setdefault("FRIEND_INDEX_MAX_USERS", 100000)
+        app.config.setdefault("FRIEND_INDEX_SYNC_INTERVAL", 1.0)
+        self.max_users = app.config["FRIEND_INDEX_MAX_USERS"]
+        self.sync_interval = app.config["FRIEND_INDEX_SYNC_INTERVAL"]
+        self.db = db or self.db
+        app.extensions["friend_index"] = self
+
+    # Lookups
+
+    def friends(self, user_id):
+        user_id = int(user_id)
+        self.sync()
+        with self._lock:
+            friends = self._friends.get(user_id)
+            if friends is not None:
+                self._friends.move_to_end(user_id)
+                self.hits += 1
+                return friends
+            self.misses += 1
+        friends = self._load(user_id)  # outside the lock; a concurrent load of the same user is harmless
+        with self._lock:
+            self._friends[user_id] = friends
+            while len(self._friends) > self.max_users:
+                self._friends.popitem(last=False)
+                self.evictions += 1
+        return friends
+
+    def is_friend(self, user_id, other_id):
+        friends, other_id = self.friends(user_id), int(other_id)
+        i = bisect_left(friends, other_id)
+        return i < len(friends) and friends[i] == other_id
+
+    def mutual_count(self, user_id, other_id):
+        # Binary-search each id of the shorter array in the longer one
+        short, long = sorted((self.friends(user_id), self.friends(other_id)), key=len)
+        count, lo = 0, 0
+        for friend_id in short:
+            lo = bisect_left(long, friend_id, lo)
+            if lo == len(long):
+                break
+            count += long[lo] == friend_id
+        return count
+
+    # Updates
+
+    def add(self, user_id, friend_id):
+        # Record a committed friendship in both directions, for users already loaded
+        user_id, friend_id = int(user_id), int(friend_id)
+        with self._lock:
+            self._insert(user_id, friend_id)
+            self._insert(friend_id, user_id)
+
+    def _insert(self, user_id, friend_id):
+        friends = self._friends.get(user_id)
+        if friends is None:
+            return
+        i = bisect_left(friends, friend_id)
+        if i == len(friends) or friends[i] != friend_id:
+            self._friends[user_id] = friends[:i] + array("q", [friend_id]) + friends[i:]
+
+    def invalidate(self, user_ids=None):
+        # Drop the given users (or everyone) after friendships were removed outside the app
+        with self._lock:
+            if user_ids is None:
+                self._friends.clear()
+            else:
+                for user_id in user_ids:
+                    self._friends.pop(int(user_id), None)
+
+    def sync(self, force=False):
+        # Apply friendships committed since the last sync to the users loaded here
+        now = time.monotonic()
+        with self._lock:
+            if not force and self._synced_at is not None and now - self._synced_at < self.sync_interval:
+                return
+            self._synced_at = now
+            # Keep the newest mark older than the window and every mark inside it
+            old = [mark for mark in self._marks if mark[0] <= now - REORDER_WINDOW]
+            self._marks = old[-1:] + [mark for mark in self._marks if mark[0] > now - REORDER_WINDOW]
+            low = self._marks[0][1] if self._marks else None
+
+        from models import Friendship
+
+        if low is None:
+            # First sync: nothing is loaded yet, so only the watermark is needed
+            rows = []
+            high = self.db.session.query(self.db.func.max(Friendship.id)).scalar() or 0
+        else:
+            rows = self.db.session.query(Friendship.id, Friendship.user_id, Friendship.friend_id).filter(
+                Friendship.id > low).all()
+            high = max([low] + [row_id for row_id, _, _ in rows])
+        with self._lock:
+            for _, user_id, friend_id in rows:
+                self._insert(user_id, friend_id)
+            self._marks.append((now, high))
+
+    def _load(self, user_id):
+        from models import Friendship
+
+        rows = self.db.session.query(Friendship.friend_id).filter(
+            Friendship.user_id == user_id).order_by(Friendship.friend_id)
+        return array("q", [friend_id for (friend_id,) in rows])  # unique_friendship rules out duplicates
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._friends),
+                "friend_ids": sum(len(friends) for friends in self._friends.values()),
+                "bytes": sys.getsizeof(self._friends) + sum(
+                    sys.getsizeof(user_id) + sys.getsizeof(friends) for user_id, friends in self._friends.items()
+                ),
+                "max_users": self.max_users,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
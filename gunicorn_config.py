@@ -1,3 +1,52 @@
-bind = "0.0.0.0:5555"
-workers = 4
+import os
+
+# WORKER_PROFILE picks how a worker serves concurrent connections:
+#   sync     - one request (or Socket.IO connection) per worker at a time
+#   gthread  - THREADS OS threads per worker
+#   gevent   - cooperative greenlets, WORKER_CONNECTIONS per worker (recommended for chat)
+#   eventlet - like gevent; needs `pip install eventlet`
+# Under gevent/eventlet the worker monkey-patches the standard library before
+# app.py is imported, so never set preload_app with those profiles.
+profile = os.getenv("WORKER_PROFILE", "sync")
+
+bind = os.getenv("BIND", "0.0.0.0:5555")
+# With more than one worker, set SOCKETIO_MESSAGE_QUEUE so emits reach sockets
+# held by other workers, and a shared JWT_SECRET_KEY. Socket.IO clients should
+# connect with the websocket transport: long-polling requests are not sticky
+# across workers.
+workers = int(os.getenv("WEB_CONCURRENCY", 4 if profile in ("sync", "gthread") else 1))
 timeout = 120
+
+if profile == "gthread":
+    worker_class = "gthread"
+    threads = int(os.getenv("THREADS", 32))
+elif profile in ("gevent", "eventlet"):
+    worker_class = profile
+    worker_connections = int(os.getenv("WORKER_CONNECTIONS", 1000))
+elif profile != "sync":
+    raise ValueError(f"Unknown WORKER_PROFILE: {profile}")
+
+# app.py hands this to SocketIO so it never auto-selects an async mode that
+# doesn't match the worker class
+os.environ.setdefault("SOCKETIO_ASYNC_MODE", profile if profile in ("gevent", "eventlet") else "threading")
+
+
+def on_starting(server):
+    # Pre-generate gzip/brotli siblings of the built SPA before workers index static/
+    from assets import compress_assets
+    compress_assets("static")
+
+
+def post_fork(server, worker):
+    # psycopg2 blocks the whole worker on every query unless it yields to the
+    # event loop while waiting on the socket
+    if profile in ("gevent", "eventlet"):
+        try:
+            if profile == "gevent":
+                from psycogreen.gevent import patch_psycopg
+            else:
+                from psycogreen.eventlet import patch_psycopg
+        except ImportError:
+            server.log.warning("psycogreen is not installed; database calls will block the event loop")
+            return
+        patch_psycopg()
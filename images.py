@@ -0,0 +1,194 @@
+import bisect
+import io
+import json
+import os
+import struct
+import threading
+from urllib.parse import quote
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # derivatives are skipped without Pillow; originals are served as before
+    Image = None
+
+
+# ----- Image headers -----
+
+def image_dimensions(f):
+    # Read (width, height) from the PNG, GIF or JPEG header of an open binary
+    # file without decoding the image. Returns (None, None) for anything it
+    # can't parse.
+    try:
+        head = f.read(26)
+        if head.startswith(b"\x89PNG\r\n\x1a\n"):
+            return struct.unpack(">II", head[16:24])
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", head[6:10])
+        if head.startswith(b"\xff\xd8"):
+            return _jpeg_dimensions(f)
+    except (OSError, struct.error):
+        pass
+    return None, None
+
+
+def _jpeg_dimensions(f):
+    # Walk JPEG segments until a start-of-frame marker
+    f.seek(2)
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xFF:
+            return None, None
+        code = marker[1]
+        if code in (0xD8, 0x01) or 0xD0 <= code <= 0xD7:
+            continue  # standalone markers carry no length
+        length = struct.unpack(">H", f.read(2))[0]
+        if 0xC0 <= code <= 0xCF and code not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">xHH", f.read(5))
+            return width, height
+        f.seek(length - 2, os.SEEK_CUR)
+
+
+# ----- Sidebar catalogue -----
+
+class SidebarCatalogue:
+    """In-memory listing of the sidebar images in the storage backend.
+
+    The listing is re-read only when the backend's listing stamp changes (the
+    folder mtime on local disk) or ``refresh()`` is called after an upload.
+    Dimensions are kept per file version across rescans, so a rescan only
+    reads the headers of new or replaced files. Serialized JSON pages are
+    memoized per base URL and page until the next rebuild.
+    """
+
+    HEADER_BYTES = 64 * 1024  # enough for the SOF marker of all but EXIF-heavy JPEGs
+
+    def __init__(self, storage, prefix, allowed):
+        self.storage = storage
+        self.prefix = prefix
+        self.allowed = allowed
+        self.stamp = None
+        self.entries = []
+        self.filenames = []
+        self._pages = {}
+        self._dimensions = {}
+        self._lock = threading.Lock()
+
+    def _read_dimensions(self, key):
+        # Parse the header from a short read; fall back to the whole file only
+        # when the dimensions lie past it
+        with self.storage.head(key, self.HEADER_BYTES) as f:
+            width, height = image_dimensions(f)
+        if width is None:
+            with self.storage.open(key) as f:
+                width, height = image_dimensions(f)
+        return width, height
+
+    def _scan(self):
+        entries = []
+        dimensions = {}
+        for name, size, version in self.storage.list(self.prefix):
+            if not self.allowed(name):
+                continue
+            known = self._dimensions.get((name, version))
+            width, height = known or self._read_dimensions(f"{self.prefix}/{name}")
+            dimensions[(name, version)] = (width, height)
+            entries.append({
+                "filename": name,
+                "title": os.path.splitext(name)[0],  # Use filename (without extension) as a placeholder title
+                "width": width,
+                "height": height,
+                "bytes": size,
+            })
+        self._dimensions = dimensions  # drops files that are gone
+        return entries
+
+    def current(self):
+        # One stat per call; rebuild if the listing changed since the last scan
+        stamp = self.storage.listing_stamp(self.prefix)
+        if stamp is None or stamp != self.stamp:
+            with self._lock:
+                if stamp is None or stamp != self.stamp:
+                    self.entries = self._scan()
+                    self.filenames = [entry["filename"] for entry in self.entries]
+                    self._pages = {}
+                    self.stamp = stamp
+        return self
+
+    def refresh(self):
+        self.stamp = None
+        return self.current()
+
+    def page(self, base_url, after=None, limit=100):
+        # Returns the JSON body for the images sorted after the ``after`` filename
+        key = (base_url, after, limit)
+        body = self._pages.get(key)
+        if body is None:
+            start = bisect.bisect_right(self.filenames, after) if after else 0
+            chunk = self.entries[start:start + limit]
+            has_more = start + limit < len(self.entries)
+            body = json.dumps({
+                "images": [dict(entry, url=base_url + quote(entry["filename"])) for entry in chunk],
+                "next_cursor": chunk[-1]["filename"] if has_more and chunk else None,
+            })
+            if len(self._pages) >= 256:
+                self._pages = {}  # arbitrary cursors shouldn't grow the memo without bound
+            self._pages[key] = body
+        return body
+
+
+# ----- Upload derivatives -----
+
+# Longest edge, in pixels, of each derivative
+VARIANTS = {"avatar": 96, "feed": 1080, "full": 2048}
+VARIANT_FORMATS = {
+    "webp": ("WEBP", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", {"quality": 82, "optimize": True, "progressive": True}),
+}
+PROCESSABLE = {"jpg", "jpeg", "png", "webp"}  # GIFs are left alone to keep animation
+VARIANT_DIR = "variants"
+
+
+def can_render(source):
+    return Image is not None and source.rsplit(".", 1)[-1].lower() in PROCESSABLE
+
+
+def render_variants(storage, source, run=None):
+    # Write every VARIANTS x VARIANT_FORMATS derivative of the stored <source>
+    # under variants/<variant>/ and return one row per file written. Images
+    # are re-encoded from pixels only, so EXIF and other metadata are dropped
+    # (orientation is applied first). run(fn, *args), if given, executes the
+    # pixel work (e.g. on a real OS thread under gevent); storage I/O stays in
+    # the caller.
+    with storage.open(source) as f:
+        encoded = run(encode_variants, f, source) if run else encode_variants(f, source)
+    for row, buffer in encoded:
+        storage.save(row["path"], buffer, content_type=f"image/{row['format']}")
+    return [row for row, _ in encoded]
+
+
+def encode_variants(f, source):
+    # CPU-only part of render_variants: [(row, encoded buffer)] for the open image file
+    with Image.open(f) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ("RGB", "RGBA"):
+            original = original.convert("RGBA" if "transparency" in original.info else "RGB")
+
+        stem = os.path.splitext(source.replace("/", "__"))[0]
+        encoded = []
+        for variant, edge in VARIANTS.items():
+            resized = original.copy()
+            resized.thumbnail((edge, edge), Image.LANCZOS)
+            for fmt, (pil_format, options) in VARIANT_FORMATS.items():
+                image = resized.convert("RGB") if pil_format == "JPEG" else resized
+                buffer = io.BytesIO()
+                image.save(buffer, pil_format, **options)
+                encoded.append(({
+                    "source": source,
+                    "variant": variant,
+                    "format": fmt,
+                    "path": f"{VARIANT_DIR}/{variant}/{stem}.{fmt}",
+                    "width": image.width,
+                    "height": image.height,
+                    "bytes": buffer.tell(),
+                }, buffer))
+        return encoded
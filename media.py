@@ -0,0 +1,136 @@
+import hashlib
+import mimetypes
+import os
+
+from flask import current_app, request, abort
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+STREAM_BUFFER = 256 * 1024
+
+
+def _read_range(f, length):
+    # Fallback body for servers without a length-aware file_wrapper
+    try:
+        while length > 0:
+            data = f.read(min(STREAM_BUFFER, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+    finally:
+        f.close()
+
+
+def _parse_range(header, size):
+    # Returns (start, end) inclusive, "unsatisfiable" when the range lies past
+    # the end of the file, or None for a header to ignore (RFC 9110 lets a
+    # server ignore Range): malformed, another unit, or several ranges.
+    unit, _, spec = header.partition("=")
+    if unit.strip() != "bytes" or not spec or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    if not (first or last) or not (first + last).isdigit():
+        return None
+    if first == "":  # suffix range: last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            return "unsatisfiable"
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return "unsatisfiable"
+    return start, min(int(last) if last else size - 1, size - 1)
+
+
+# ----- Content-addressed storage -----
+# Media is stored once under media/<aa>/<sha256>.<ext> in the storage backend,
+# so identical uploads share one object and the key never changes once written.
+
+CAS_DIR = "media"
+
+
+def hash_file(f):
+    # sha256 and size of a binary file object, read in buffers from the start
+    digest = hashlib.sha256()
+    size = 0
+    f.seek(0)
+    while True:
+        data = f.read(STREAM_BUFFER)
+        if not data:
+            break
+        digest.update(data)
+        size += len(data)
+    f.seek(0)
+    return digest.hexdigest(), size
+
+
+def cas_path(digest, filename):
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else "bin"
+    return f"{CAS_DIR}/{digest[:2]}/{digest}.{ext}"
+
+
+def send_media(directory, filename, immutable=False):
+    """Serve a file with byte-range support tuned for video.
+
+    Single ranges get 206 with at most MEDIA_MAX_RANGE_BYTES per response, so
+    open-ended ``bytes=N-`` requests stream in bounded chunks; ranges past the
+    end get 416, and malformed or multi-range headers are ignored (200 with
+    the whole file). The body goes out through the server's file_wrapper
+    (sendfile under gunicorn) or via X-Sendfile when MEDIA_USE_X_SENDFILE is set.
+    """
+    path = safe_join(directory, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f"{stat.st_mtime_ns:x}-{size:x}"
+    mimetype = mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+    response = current_app.response_class(mimetype=mimetype, direct_passthrough=True)
+    response.set_etag(etag)
+    response.last_modified = stat.st_mtime
+    response.headers["Accept-Ranges"] = "bytes"
+    # Content-addressed files never change under the same name
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable" if immutable else "public, no-cache"
+
+    if request.if_none_match.contains(etag):
+        response.status_code = 304
+        return response
+
+    if current_app.config.get("MEDIA_USE_X_SENDFILE"):
+        # The front proxy reads the file itself and answers Range requests
+        response.headers["X-Sendfile"] = path
+        response.content_length = size
+        return response
+
+    start, end = 0, size - 1
+    range_header = request.headers.get("Range")
+    if_range = request.headers.get("If-Range")
+    if range_header and (not if_range or if_range.strip('"') == etag):
+        byte_range = _parse_range(range_header, size)
+        if byte_range == "unsatisfiable":
+            response.status_code = 416
+            response.headers["Content-Range"] = f"bytes */{size}"
+            return response
+        if byte_range is not None:
+            start, end = byte_range
+            end = min(end, start + current_app.config["MEDIA_MAX_RANGE_BYTES"] - 1)
+            response.status_code = 206
+            response.headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = end - start + 1
+    response.content_length = length
+
+    f = open(path, "rb")
+    f.seek(start)
+    if request.environ.get("SERVER_SOFTWARE", "").startswith("gunicorn"):
+        # gunicorn's file_wrapper sends Content-Length bytes from the current
+        # offset with os.sendfile, so the range is served zero-copy
+        response.response = wrap_file(request.environ, f, STREAM_BUFFER)
+    else:
+        response.response = _read_range(f, length)
+    return response
@@ -0,0 +1,46 @@
+"""add denormalized friend_count to users
+
+Revision ID: 116f61bbd0f6
+Revises: c5f8a1e3b796
+Create Date: 2026-10-19 09:12:37.514208
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '116f61bbd0f6'
+down_revision = 'c5f8a1e3b796'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # A plain ADD COLUMN on SQLite too: rebuilding users would drop the users_fts triggers
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('friend_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Friendships are stored in both directions, so one side counts each friend once
+    op.execute("""
+        UPDATE users SET friend_count = (
+            SELECT COUNT(*) FROM friendship WHERE friendship.user_id = users.id
+        )
+    """)
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_friend_count', 'users', ['friend_count'], unique=False,
+                        if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_friend_count', table_name='users', if_exists=True, postgresql_concurrently=True)
+
+    if op.get_bind().dialect.name == 'sqlite':
+        # Native DROP COLUMN (SQLite 3.35+): a batch rebuild can't copy the generated
+        # name_key column and would drop the users_fts triggers
+        op.execute('ALTER TABLE users DROP COLUMN friend_count')
+    else:
+        with op.batch_alter_table('users', schema=None) as batch_op:
+            batch_op.drop_column('friend_count')
@@ -0,0 +1,26 @@
+"""add last_seen to users
+
+Revision ID: 2d9f4a7c1e85
+Revises: b6f1e9a3c258
+Create Date: 2026-10-18 19:12:48.301726
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d9f4a7c1e85'
+down_revision = 'b6f1e9a3c258'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_seen', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('last_seen')
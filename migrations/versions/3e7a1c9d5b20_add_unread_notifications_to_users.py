@@ -0,0 +1,39 @@
+"""add denormalized unread_notifications counter to users
+
+Revision ID: 3e7a1c9d5b20
+Revises: 2d9f4a7c1e85
+Create Date: 2026-10-18 19:48:21.907415
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3e7a1c9d5b20'
+down_revision = '2d9f4a7c1e85'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('unread_notifications', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from the unread notifications /api/notifications lists (requests
+    # that were since accepted are hidden there)
+    op.execute("""
+        UPDATE users SET unread_notifications = (
+            SELECT COUNT(*) FROM notification
+            LEFT JOIN friend_requests ON friend_requests.id = notification.friend_request_id
+            WHERE notification.user_id = users.id
+              AND NOT COALESCE(notification.read, false)
+              AND (notification.type != 'friend_request' OR friend_requests.status IS NULL
+                   OR friend_requests.status != 'accepted')
+        )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_column('unread_notifications')
@@ -0,0 +1,26 @@
+"""add composite index on posts(timestamp, id)
+
+Revision ID: 4b1d2e7c9a10
+Revises: d5e939b2cc00
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4b1d2e7c9a10'
+down_revision = 'd5e939b2cc00'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.create_index('ix_posts_timestamp_id', ['timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_index('ix_posts_timestamp_id')
@@ -0,0 +1,26 @@
+"""add composite index on messages(sender_id, receiver_id, timestamp, id)
+
+Revision ID: 5a8e2c6f1b93
+Revises: f4c9a2b7d130
+Create Date: 2026-10-18 17:20:44.918305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a8e2c6f1b93'
+down_revision = 'f4c9a2b7d130'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.create_index('ix_messages_sender_receiver_ts', ['sender_id', 'receiver_id', 'timestamp', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_index('ix_messages_sender_receiver_ts')
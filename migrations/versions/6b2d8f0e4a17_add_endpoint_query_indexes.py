@@ -0,0 +1,43 @@
+"""add secondary indexes for the endpoint queries found by flask audit-queries
+
+Revision ID: 6b2d8f0e4a17
+Revises: 3e7a1c9d5b20
+Create Date: 2026-10-18 20:31:09.554812
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6b2d8f0e4a17'
+down_revision = '3e7a1c9d5b20'
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ('ix_posts_user_timestamp', 'posts', ['user_id', 'timestamp', 'id']),
+    ('ix_comments_post_timestamp', 'comments', ['post_id', 'timestamp']),
+    ('ix_likes_post_id', 'likes', ['post_id']),
+    ('ix_friend_requests_recipient_status', 'friend_requests', ['recipient_id', 'status']),
+    ('ix_friend_requests_requester_recipient', 'friend_requests', ['requester_id', 'recipient_id']),
+    ('ix_notification_user_read', 'notification', ['user_id', 'read']),
+    ('ix_notification_friend_request_id', 'notification', ['friend_request_id']),
+    ('ix_friendship_friend_id', 'friendship', ['friend_id']),
+]
+
+
+def upgrade():
+    # On Postgres the indexes are built with CREATE INDEX CONCURRENTLY, which
+    # doesn't block writes but can't run inside a transaction. A build that
+    # fails leaves an INVALID index behind: drop it and run the upgrade again.
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            op.create_index(name, table, columns, unique=False, if_not_exists=True,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in reversed(INDEXES):
+            op.drop_index(name, table_name=table, if_exists=True, postgresql_concurrently=True)
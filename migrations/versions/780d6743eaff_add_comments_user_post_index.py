@@ -0,0 +1,28 @@
+"""add comments (user_id, post_id) index
+
+Revision ID: 780d6743eaff
+Revises: 116f61bbd0f6
+Create Date: 2026-10-19 09:41:05.372816
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '780d6743eaff'
+down_revision = '116f61bbd0f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # update_profile invalidates the comment lists of every post the user commented on
+    with op.get_context().autocommit_block():
+        op.create_index('ix_comments_user_post', 'comments', ['user_id', 'post_id'], unique=False,
+                        if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_comments_user_post', table_name='comments', if_exists=True, postgresql_concurrently=True)
@@ -0,0 +1,43 @@
+"""add denormalized like_count to posts and unique (user_id, post_id) on likes
+
+Revision ID: 7e3f0a5b8c21
+Revises: 4b1d2e7c9a10
+Create Date: 2026-10-18 10:03:54.118730
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e3f0a5b8c21'
+down_revision = '4b1d2e7c9a10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Drop duplicate likes (keep the oldest) so the unique constraint can be added
+    op.execute(
+        "DELETE FROM likes WHERE id NOT IN "
+        "(SELECT MIN(id) FROM likes GROUP BY user_id, post_id)"
+    )
+    with op.batch_alter_table('likes', schema=None) as batch_op:
+        batch_op.create_unique_constraint('unique_like', ['user_id', 'post_id'])
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('like_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill counters from the existing likes
+    op.execute(
+        "UPDATE posts SET like_count = "
+        "(SELECT COUNT(*) FROM likes WHERE likes.post_id = posts.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_column('like_count')
+
+    with op.batch_alter_table('likes', schema=None) as batch_op:
+        batch_op.drop_constraint('unique_like', type_='unique')
@@ -0,0 +1,55 @@
+"""add conversations inbox summary table
+
+Revision ID: 8c3d7b1e4f62
+Revises: 5a8e2c6f1b93
+Create Date: 2026-10-18 17:42:09.274561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c3d7b1e4f62'
+down_revision = '5a8e2c6f1b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('conversations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('partner_id', sa.Integer(), nullable=False),
+    sa.Column('last_message_id', sa.Integer(), nullable=True),
+    sa.Column('last_message_at', sa.DateTime(), nullable=False),
+    sa.Column('unread_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['last_message_id'], ['messages.id'], ),
+    sa.ForeignKeyConstraint(['partner_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'partner_id', name='unique_conversation')
+    )
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.create_index('ix_conversations_user_last', ['user_id', 'last_message_at', 'id'], unique=False)
+
+    # Backfill both sides of every existing conversation from the message history
+    op.execute("""
+        INSERT INTO conversations (user_id, partner_id, last_message_id, last_message_at, unread_count)
+        SELECT user_id, partner_id, MAX(id), MAX(timestamp), SUM(unread)
+        FROM (
+            SELECT sender_id AS user_id, receiver_id AS partner_id, id, timestamp, 0 AS unread
+            FROM messages
+            UNION ALL
+            SELECT receiver_id, sender_id, id, timestamp, CASE WHEN NOT is_read THEN 1 ELSE 0 END
+            FROM messages WHERE receiver_id <> sender_id
+        ) AS sides
+        GROUP BY user_id, partner_id
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_index('ix_conversations_user_last')
+
+    op.drop_table('conversations')
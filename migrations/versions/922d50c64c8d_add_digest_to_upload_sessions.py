@@ -0,0 +1,26 @@
+"""add declared sha256 digest to upload_sessions
+
+Revision ID: 922d50c64c8d
+Revises: 780d6743eaff
+Create Date: 2026-10-19 10:05:48.120934
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '922d50c64c8d'
+down_revision = '780d6743eaff'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('upload_sessions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('digest', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('upload_sessions', schema=None) as batch_op:
+        batch_op.drop_column('digest')
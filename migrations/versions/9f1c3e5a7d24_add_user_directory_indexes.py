@@ -0,0 +1,42 @@
+"""add generated name_key and directory indexes to users
+
+Revision ID: 9f1c3e5a7d24
+Revises: 6b2d8f0e4a17
+Create Date: 2026-10-18 21:14:36.208893
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9f1c3e5a7d24'
+down_revision = '6b2d8f0e4a17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite can't ALTER TABLE ADD a stored generated column, so the table is rebuilt there
+    recreate = 'always' if op.get_bind().dialect.name == 'sqlite' else 'auto'
+    with op.batch_alter_table('users', schema=None, recreate=recreate) as batch_op:
+        batch_op.add_column(sa.Column(
+            'name_key', sa.String(length=100).with_variant(sa.String(length=100, collation='C'), 'postgresql'),
+            sa.Computed('lower(name)', persisted=True), nullable=True
+        ))
+
+    with op.get_context().autocommit_block():
+        op.create_index('ix_users_name_key', 'users', ['name_key', 'id'], unique=False,
+                        if_not_exists=True, postgresql_concurrently=True)
+        op.create_index('ix_users_location_name_key', 'users', [sa.text('lower(location)'), 'name_key', 'id'],
+                        unique=False, if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_users_location_name_key', table_name='users', if_exists=True, postgresql_concurrently=True)
+        op.drop_index('ix_users_name_key', table_name='users', if_exists=True, postgresql_concurrently=True)
+
+    recreate = 'always' if op.get_bind().dialect.name == 'sqlite' else 'auto'
+    with op.batch_alter_table('users', schema=None, recreate=recreate) as batch_op:
+        batch_op.drop_column('name_key')
@@ -0,0 +1,36 @@
+"""add friend_suggestions table
+
+Revision ID: a4e7c2d9f813
+Revises: 9f1c3e5a7d24
+Create Date: 2026-10-18 22:03:51.617204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4e7c2d9f813'
+down_revision = '9f1c3e5a7d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('friend_suggestions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('suggested_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('mutual_count', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('computed_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['suggested_id'], ['users.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'rank', name='unique_friend_suggestion_rank')
+    )
+
+
+def downgrade():
+    op.drop_table('friend_suggestions')
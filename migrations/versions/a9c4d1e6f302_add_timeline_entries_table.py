@@ -0,0 +1,50 @@
+"""add timeline_entries table for fan-out-on-write home timelines
+
+Revision ID: a9c4d1e6f302
+Revises: 7e3f0a5b8c21
+Create Date: 2026-10-18 11:26:07.551904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a9c4d1e6f302'
+down_revision = '7e3f0a5b8c21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('timeline_entries',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('post_id', sa.Integer(), nullable=False),
+    sa.Column('ts', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['post_id'], ['posts.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('user_id', 'post_id', name='unique_timeline_entry')
+    )
+    with op.batch_alter_table('timeline_entries', schema=None) as batch_op:
+        batch_op.create_index('ix_timeline_entries_user_ts', ['user_id', 'ts', 'post_id'], unique=False)
+
+    # Seed timelines from existing friendships and posts (each user sees their own and their friends' posts)
+    op.execute(
+        "INSERT INTO timeline_entries (user_id, post_id, ts) "
+        "SELECT posts.user_id, posts.id, posts.timestamp FROM posts"
+    )
+    op.execute(
+        "INSERT INTO timeline_entries (user_id, post_id, ts) "
+        "SELECT friendship.friend_id, posts.id, posts.timestamp FROM posts "
+        "JOIN friendship ON friendship.user_id = posts.user_id "
+        "WHERE friendship.friend_id <> posts.user_id"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('timeline_entries', schema=None) as batch_op:
+        batch_op.drop_index('ix_timeline_entries_user_ts')
+
+    op.drop_table('timeline_entries')
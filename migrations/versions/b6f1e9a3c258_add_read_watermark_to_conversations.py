@@ -0,0 +1,35 @@
+"""add read_up_to_id watermark to conversations
+
+Revision ID: b6f1e9a3c258
+Revises: 8c3d7b1e4f62
+Create Date: 2026-10-18 18:05:37.640129
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f1e9a3c258'
+down_revision = '8c3d7b1e4f62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('read_up_to_id', sa.Integer(), nullable=True))
+
+    op.execute("""
+        UPDATE conversations SET read_up_to_id = (
+            SELECT MAX(id) FROM messages
+            WHERE messages.sender_id = conversations.partner_id
+              AND messages.receiver_id = conversations.user_id
+              AND messages.is_read
+        )
+    """)
+
+
+def downgrade():
+    with op.batch_alter_table('conversations', schema=None) as batch_op:
+        batch_op.drop_column('read_up_to_id')
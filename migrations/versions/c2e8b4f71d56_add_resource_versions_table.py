@@ -0,0 +1,29 @@
+"""add resource_versions table for conditional GET validators
+
+Revision ID: c2e8b4f71d56
+Revises: a9c4d1e6f302
+Create Date: 2026-10-18 12:41:19.036254
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2e8b4f71d56'
+down_revision = 'a9c4d1e6f302'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('resource_versions',
+    sa.Column('key', sa.String(length=100), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade():
+    op.drop_table('resource_versions')
@@ -0,0 +1,92 @@
+"""add full-text search indexes for posts and users
+
+Revision ID: c5f8a1e3b796
+Revises: a4e7c2d9f813
+Create Date: 2026-10-18 23:10:42.885130
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c5f8a1e3b796'
+down_revision = 'a4e7c2d9f813'
+branch_labels = None
+depends_on = None
+
+# SQLite: FTS5 external-content tables kept current by triggers (see search.py)
+SQLITE_UPGRADE = [
+    "CREATE VIRTUAL TABLE posts_fts USING fts5(content, content='posts', content_rowid='id')",
+    "CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts BEGIN "
+    "INSERT INTO posts_fts(rowid, content) VALUES (new.id, new.content); END",
+    "CREATE TRIGGER posts_fts_delete AFTER DELETE ON posts BEGIN "
+    "INSERT INTO posts_fts(posts_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER posts_fts_update AFTER UPDATE OF content ON posts BEGIN "
+    "INSERT INTO posts_fts(posts_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO posts_fts(rowid, content) VALUES (new.id, new.content); END",
+    "INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')",
+    "CREATE VIRTUAL TABLE users_fts USING fts5(name, location, description, content='users', content_rowid='id')",
+    "INSERT INTO users_fts(users_fts, rank) VALUES ('rank', 'bm25(5.0, 2.0, 1.0)')",
+    "CREATE TRIGGER users_fts_insert AFTER INSERT ON users BEGIN "
+    "INSERT INTO users_fts(rowid, name, location, description) "
+    "VALUES (new.id, new.name, new.location, new.description); END",
+    "CREATE TRIGGER users_fts_delete AFTER DELETE ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, name, location, description) "
+    "VALUES ('delete', old.id, old.name, old.location, old.description); END",
+    "CREATE TRIGGER users_fts_update AFTER UPDATE OF name, location, description ON users BEGIN "
+    "INSERT INTO users_fts(users_fts, rowid, name, location, description) "
+    "VALUES ('delete', old.id, old.name, old.location, old.description); "
+    "INSERT INTO users_fts(rowid, name, location, description) "
+    "VALUES (new.id, new.name, new.location, new.description); END",
+    "INSERT INTO users_fts(users_fts) VALUES ('rebuild')",
+]
+
+SQLITE_DOWNGRADE = [
+    "DROP TRIGGER IF EXISTS users_fts_update",
+    "DROP TRIGGER IF EXISTS users_fts_delete",
+    "DROP TRIGGER IF EXISTS users_fts_insert",
+    "DROP TABLE IF EXISTS users_fts",
+    "DROP TRIGGER IF EXISTS posts_fts_update",
+    "DROP TRIGGER IF EXISTS posts_fts_delete",
+    "DROP TRIGGER IF EXISTS posts_fts_insert",
+    "DROP TABLE IF EXISTS posts_fts",
+]
+
+# Postgres: generated tsvector columns behind GIN indexes
+POSTGRES_COLUMNS = {
+    'posts': "to_tsvector('simple'::regconfig, coalesce(content, ''))",
+    'users': "setweight(to_tsvector('simple'::regconfig, coalesce(name, '')), 'A') || "
+             "setweight(to_tsvector('simple'::regconfig, coalesce(location, '')), 'B') || "
+             "setweight(to_tsvector('simple'::regconfig, coalesce(description, '')), 'C')",
+}
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_UPGRADE:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        # Adding a stored generated column rewrites the table under an exclusive lock
+        for table, expression in POSTGRES_COLUMNS.items():
+            op.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                       f"GENERATED ALWAYS AS ({expression}) STORED")
+        with op.get_context().autocommit_block():
+            for table in POSTGRES_COLUMNS:
+                op.create_index(f'ix_{table}_search', table, ['search_vector'], unique=False,
+                                postgresql_using='gin', if_not_exists=True, postgresql_concurrently=True)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'sqlite':
+        for statement in SQLITE_DOWNGRADE:
+            op.execute(statement)
+    elif dialect == 'postgresql':
+        with op.get_context().autocommit_block():
+            for table in POSTGRES_COLUMNS:
+                op.drop_index(f'ix_{table}_search', table_name=table, if_exists=True, postgresql_concurrently=True)
+        for table in POSTGRES_COLUMNS:
+            with op.batch_alter_table(table, schema=None) as batch_op:
+                batch_op.drop_column('search_vector')
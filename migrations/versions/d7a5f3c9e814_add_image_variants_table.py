@@ -0,0 +1,36 @@
+"""add image_variants table for upload derivatives
+
+Revision ID: d7a5f3c9e814
+Revises: c2e8b4f71d56
+Create Date: 2026-10-18 14:07:42.290513
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a5f3c9e814'
+down_revision = 'c2e8b4f71d56'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('image_variants',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('source', sa.String(length=300), nullable=False),
+    sa.Column('variant', sa.String(length=20), nullable=False),
+    sa.Column('format', sa.String(length=10), nullable=False),
+    sa.Column('path', sa.String(length=300), nullable=False),
+    sa.Column('width', sa.Integer(), nullable=False),
+    sa.Column('height', sa.Integer(), nullable=False),
+    sa.Column('bytes', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('source', 'variant', 'format', name='unique_image_variant')
+    )
+
+
+def downgrade():
+    op.drop_table('image_variants')
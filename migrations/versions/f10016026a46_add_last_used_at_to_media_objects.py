@@ -0,0 +1,31 @@
+"""add last_used_at lease to media_objects
+
+Revision ID: f10016026a46
+Revises: 922d50c64c8d
+Create Date: 2026-10-19 10:38:22.604117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f10016026a46'
+down_revision = '922d50c64c8d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('media_objects', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('last_used_at', sa.DateTime(), nullable=True))
+
+    op.execute("UPDATE media_objects SET last_used_at = created_at")
+
+    with op.batch_alter_table('media_objects', schema=None) as batch_op:
+        batch_op.alter_column('last_used_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('media_objects', schema=None) as batch_op:
+        batch_op.drop_column('last_used_at')
@@ -0,0 +1,57 @@
+"""add content-addressed media_objects table and references to it
+
+Revision ID: f4c9a2b7d130
+Revises: e1b6c8d2a475
+Create Date: 2026-10-18 16:48:55.713092
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c9a2b7d130'
+down_revision = 'e1b6c8d2a475'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('media_objects',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('digest', sa.String(length=64), nullable=False),
+    sa.Column('path', sa.String(length=300), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('digest'),
+    sa.UniqueConstraint('path')
+    )
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('media_object_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_posts_media_object_id', 'media_objects', ['media_object_id'], ['id'])
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('media_object_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_messages_media_object_id', 'media_objects', ['media_object_id'], ['id'])
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('picture_object_id', sa.Integer(), nullable=True))
+        batch_op.create_foreign_key('fk_users_picture_object_id', 'media_objects', ['picture_object_id'], ['id'])
+
+
+def downgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_users_picture_object_id', type_='foreignkey')
+        batch_op.drop_column('picture_object_id')
+
+    with op.batch_alter_table('messages', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_messages_media_object_id', type_='foreignkey')
+        batch_op.drop_column('media_object_id')
+
+    with op.batch_alter_table('posts', schema=None) as batch_op:
+        batch_op.drop_constraint('fk_posts_media_object_id', type_='foreignkey')
+        batch_op.drop_column('media_object_id')
+
+    op.drop_table('media_objects')
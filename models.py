@@ -10,7 +10,17 @@ class User(db.Model):
     description = db.Column(db.String(500))
     location = db.Column(db.String(255))
     picture = db.Column(db.String(255))
+    picture_object_id = db.Column(db.Integer, db.ForeignKey('media_objects.id'), nullable=True)
     is_super_user = db.Column(db.Boolean, default=False)
+    last_seen = db.Column(db.DateTime, nullable=True)  # flushed in batches from the presence store
+    # Denormalized count of unread notifications, maintained in the same transaction as the rows
+    unread_notifications = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Denormalized friend count, maintained by accept_friend_request; decides fan-out vs pull for timelines
+    friend_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Lower-cased name the user directory sorts and prefix-matches on, computed by the database.
+    # "C" collation on Postgres keeps every name prefix one contiguous index range.
+    name_key = db.Column(db.String(100).with_variant(db.String(100, collation='C'), 'postgresql'),
+                         db.Computed('lower(name)', persisted=True))
 
     # Relationships
     posts = db.relationship('Post', back_populates='user', lazy='dynamic')
@@ -19,6 +29,13 @@ class User(db.Model):
     likes = db.relationship('Like', back_populates='user', lazy='dynamic')
     comments = db.relationship('Comment', back_populates='user', lazy='select')
 
+    # Directory pages, by name or within one location; authors too big to fan out
+    __table_args__ = (
+        db.Index('ix_users_name_key', name_key, id),
+        db.Index('ix_users_location_name_key', db.func.lower(location), name_key, id),
+        db.Index('ix_users_friend_count', friend_count),
+    )
+
     def __repr__(self):
         return f"<User {self.name}>"
 
@@ -29,7 +46,10 @@ class Post(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     content = db.Column(db.Text, nullable=True)  # Text, images, videos, quotes, etc.
     media_url = db.Column(db.String(300), nullable=True)  # URL or file path for media
+    media_object_id = db.Column(db.Integer, db.ForeignKey('media_objects.id'), nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Denormalized like counter, maintained in the same transaction as the Like rows
+    like_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Relationships
     user = db.relationship('User', back_populates='posts', overlaps="author")
@@ -37,9 +57,11 @@ class Post(db.Model):
     likes = db.relationship('Like', back_populates='post', lazy='dynamic')
     comments = db.relationship('Comment', back_populates='post', lazy='select')  # Change 'dynamic' to 'select'
 
-    # This method calculates the total like count for a post
-    def like_count(self):
-        return self.likes.count()  # This returns the total number of likes
+    # Composite indexes backing keyset pagination of the feed and of one user's posts (newest first)
+    __table_args__ = (
+        db.Index('ix_posts_timestamp_id', 'timestamp', 'id'),
+        db.Index('ix_posts_user_timestamp', 'user_id', 'timestamp', 'id'),
+    )
 
     def __repr__(self):
         return f"<Post by User {self.user_id} at {self.timestamp}>"
@@ -56,6 +78,12 @@ class Comment(db.Model):  # New Comment model
     user = db.relationship('User', back_populates='comments')
     post = db.relationship('Post', back_populates='comments')
 
+    # Comments of a post, oldest to newest (counts and feed previews); posts a user commented on
+    __table_args__ = (
+        db.Index('ix_comments_post_timestamp', 'post_id', 'timestamp'),
+        db.Index('ix_comments_user_post', 'user_id', 'post_id'),
+    )
+
     def __repr__(self):
         return f"<Comment by User {self.user_id} on Post {self.post_id}>"
 
@@ -69,6 +97,11 @@ class Like(db.Model):
     user = db.relationship('User', back_populates='likes')
     post = db.relationship('Post', back_populates='likes')
 
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='unique_like'),
+        db.Index('ix_likes_post_id', 'post_id'),
+    )
+
     def __repr__(self):
         return f"<Like by User {self.user_id} on Post {self.post_id}>"
 
@@ -80,12 +113,16 @@ class Message(db.Model):
     message = db.Column(db.Text, nullable=True)
     media_type = db.Column(db.String(10), nullable=True)  # image, video, audio
     media_url = db.Column(db.String(300), nullable=True)
+    media_object_id = db.Column(db.Integer, db.ForeignKey('media_objects.id'), nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     is_read = db.Column(db.Boolean, default=False)  # New field to track read status
 
     sender = db.relationship("User", foreign_keys=[sender_id])
     receiver = db.relationship("User", foreign_keys=[receiver_id])
 
+    # One conversation direction, newest first, is a single range scan
+    __table_args__ = (db.Index('ix_messages_sender_receiver_ts', 'sender_id', 'receiver_id', 'timestamp', 'id'),)
+
     def __repr__(self):
         return f"<Message from {self.sender_id} to {self.receiver_id}>"
 
@@ -102,6 +139,11 @@ class FriendRequest(db.Model):
     requester = db.relationship('User', foreign_keys=[requester_id], back_populates='sent_requests')
     recipient = db.relationship('User', foreign_keys=[recipient_id], back_populates='received_requests')
 
+    __table_args__ = (
+        db.Index('ix_friend_requests_recipient_status', 'recipient_id', 'status'),
+        db.Index('ix_friend_requests_requester_recipient', 'requester_id', 'recipient_id'),
+    )
+
     def __repr__(self):
         return f"<FriendRequest from {self.requester_id} to {self.recipient_id}, status={self.status}>"
 
@@ -118,6 +160,10 @@ class Notification(db.Model):
     # Relationships (optional, but useful)
     friend_request = db.relationship("FriendRequest", backref="notifications")
 
+    __table_args__ = (
+        db.Index('ix_notification_user_read', 'user_id', 'read'),
+        db.Index('ix_notification_friend_request_id', 'friend_request_id'),
+    )
     
 
 
@@ -131,6 +177,132 @@ class Friendship(db.Model):
     user = db.relationship("User", foreign_keys=[user_id], backref="friends")
     friend = db.relationship("User", foreign_keys=[friend_id], backref="friend_of")
 
-    __table_args__ = (db.UniqueConstraint('user_id', 'friend_id', name='unique_friendship'),)
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'friend_id', name='unique_friendship'),
+        db.Index('ix_friendship_friend_id', 'friend_id'),
+    )
     
-    
\ No newline at end of file
+
+class TimelineEntry(db.Model):
+    # Fan-out-on-write home timeline: one row per (reader, post)
+    __tablename__ = 'timeline_entries'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('posts.id'), nullable=False)
+    ts = db.Column(db.DateTime, nullable=False)  # copy of Post.timestamp for range scans
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id', name='unique_timeline_entry'),
+        db.Index('ix_timeline_entries_user_ts', 'user_id', 'ts', 'post_id'),
+    )
+
+    def __repr__(self):
+        return f"<TimelineEntry post {self.post_id} for User {self.user_id}>"
+
+
+class ResourceVersion(db.Model):
+    # Version counters behind ETag/Last-Modified validators, bumped by write endpoints.
+    # Keys are scopes such as "feeds", "notifications:<user_id>" or "conversation:<a>:<b>".
+    __tablename__ = 'resource_versions'
+    key = db.Column(db.String(100), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<ResourceVersion {self.key}={self.version}>"
+
+
+class ImageVariant(db.Model):
+    # Resized/re-encoded derivative of an uploaded image, produced off the request thread
+    __tablename__ = 'image_variants'
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(300), nullable=False)  # original, relative to static/ (e.g. "uploads/x.jpg")
+    variant = db.Column(db.String(20), nullable=False)  # avatar, feed, full
+    format = db.Column(db.String(10), nullable=False)  # webp, jpeg
+    path = db.Column(db.String(300), nullable=False)  # derivative, relative to static/
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    bytes = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('source', 'variant', 'format', name='unique_image_variant'),
+    )
+
+    def __repr__(self):
+        return f"<ImageVariant {self.variant}/{self.format} of {self.source}>"
+
+
+class UploadSession(db.Model):
+    # Resumable chunked upload in progress; bytes live in a partial file until finalized
+    __tablename__ = 'upload_sessions'
+    id = db.Column(db.String(32), primary_key=True)  # uuid4 hex
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)  # declared total size
+    received = db.Column(db.BigInteger, nullable=False, default=0)  # contiguous bytes on disk
+    digest = db.Column(db.String(64), nullable=True)  # sha256 hex declared at init, checked on complete
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<UploadSession {self.id} {self.received}/{self.size}>"
+
+
+class MediaObject(db.Model):
+    # One stored file per distinct content; posts, messages and users point here
+    __tablename__ = 'media_objects'
+    id = db.Column(db.Integer, primary_key=True)
+    digest = db.Column(db.String(64), unique=True, nullable=False)  # sha256 hex
+    path = db.Column(db.String(300), unique=True, nullable=False)  # relative to static/
+    size = db.Column(db.BigInteger, nullable=False)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Last upload or dedup hit; gc-media spares unreferenced objects for MEDIA_GC_GRACE after it
+    last_used_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f"<MediaObject {self.digest[:12]} refs={self.ref_count}>"
+
+
+class Conversation(db.Model):
+    # Inbox summary: one row per (user, partner), maintained by send_message and mark_messages_as_read
+    __tablename__ = 'conversations'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    partner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('messages.id'), nullable=True)
+    last_message_at = db.Column(db.DateTime, nullable=False)
+    unread_count = db.Column(db.Integer, nullable=False, default=0)  # messages from partner not yet read by user
+    read_up_to_id = db.Column(db.Integer, nullable=True)  # user has read every message from partner up to this id
+
+    partner = db.relationship("User", foreign_keys=[partner_id])
+    last_message = db.relationship("Message", foreign_keys=[last_message_id])
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'partner_id', name='unique_conversation'),
+        db.Index('ix_conversations_user_last', 'user_id', 'last_message_at', 'id'),
+    )
+
+    def __repr__(self):
+        return f"<Conversation of User {self.user_id} with User {self.partner_id}>"
+
+
+class FriendSuggestion(db.Model):
+    # "People you may know": top-ranked friends of friends per user, written by `flask suggest-friends`
+    __tablename__ = 'friend_suggestions'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    suggested_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)  # 0 is the best suggestion
+    mutual_count = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)  # mutual_count, boosted for a shared location
+    computed_at = db.Column(db.DateTime, nullable=False)
+
+    suggested = db.relationship("User", foreign_keys=[suggested_id])
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'rank', name='unique_friend_suggestion_rank'),
+    )
+
+    def __repr__(self):
+        return f"<FriendSuggestion {self.rank} for User {self.user_id}: User {self.suggested_id}>"
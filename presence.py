@@ -0,0 +1,303 @@
+import threading
+import time
+
+
+# ----- Backends -----
+# A backend keeps, per user id, the number of open sockets, the last time one
+# of them was seen (unix seconds) and a generation counter that is bumped when
+# someone the user can see goes online or offline. Last-seen times are marked
+# dirty when they change and drained in batches into users.last_seen. Sockets
+# of a worker that died without disconnecting stay counted until ``expire``
+# finds their user unseen for the presence timeout.
+
+class MemoryBackend:
+    """Presence of the sockets held by this process only."""
+
+    def __init__(self):
+        self._connections = {}  # user_id -> open sockets
+        self._last_seen = {}  # user_id -> unix seconds; offline users are dropped once flushed
+        self._dirty = set()
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def incr(self, user_id, delta, now):
+        # Returns the user's socket count after the change
+        with self._lock:
+            count = self._connections.get(user_id, 0) + delta
+            if count > 0:
+                self._connections[user_id] = count
+            else:
+                self._connections.pop(user_id, None)
+            self._last_seen[user_id] = now
+            self._dirty.add(user_id)
+            return max(count, 0)
+
+    def touch(self, user_ids, now):
+        with self._lock:
+            for user_id in user_ids:
+                self._last_seen[user_id] = now
+            self._dirty.update(user_ids)
+
+    def get(self, user_ids):
+        # {user_id: (sockets, last_seen)} for the users this backend knows about
+        with self._lock:
+            return {
+                user_id: (self._connections.get(user_id, 0), self._last_seen[user_id])
+                for user_id in user_ids if user_id in self._last_seen
+            }
+
+    def drain(self):
+        # {user_id: last_seen} changed since the previous drain
+        with self._lock:
+            seen = {user_id: self._last_seen[user_id] for user_id in self._dirty}
+            self._dirty.clear()
+            for user_id in seen:
+                if user_id not in self._connections:
+                    del self._last_seen[user_id]  # the database copy is current from now on
+            return seen
+
+    def expire(self, cutoff, user_ids=None):
+        # Zero the socket count of users (of user_ids, or any) unseen since
+        # cutoff; returns their ids
+        with self._lock:
+            candidates = self._connections if user_ids is None else [
+                user_id for user_id in user_ids if user_id in self._connections]
+            expired = [user_id for user_id in candidates if self._last_seen[user_id] < cutoff]
+            for user_id in expired:
+                del self._connections[user_id]
+            self._dirty.update(expired)
+            return expired
+
+    def generation(self, user_id):
+        with self._lock:
+            return self._generations.get(user_id, 0)
+
+    def bump(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._generations[user_id] = self._generations.get(user_id, 0) + 1
+
+
+class RedisBackend:
+    """Presence shared by every worker and node through a Redis-protocol server.
+
+    Each kind of state is one hash keyed by user id, so a lookup for a page of
+    users is a single pipelined round trip. Users with open sockets are also
+    in a sorted set scored by last-seen time, so ``expire`` reads only the
+    stale ones. Pass ``client`` to use an existing
+    client; otherwise one is created from ``url`` with the optional ``redis``
+    package.
+    """
+
+    def __init__(self, url=None, client=None, prefix="presence:"):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise RuntimeError("Shared presence requires the 'redis' package")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.connections_key = f"{prefix}connections"
+        self.seen_key = f"{prefix}seen"
+        self.dirty_key = f"{prefix}dirty"
+        self.generations_key = f"{prefix}generations"
+        self.live_key = f"{prefix}live"
+
+    def incr(self, user_id, delta, now):
+        pipe = self.client.pipeline()
+        pipe.hincrby(self.connections_key, user_id, delta)
+        pipe.hset(self.seen_key, user_id, now)
+        pipe.sadd(self.dirty_key, user_id)
+        pipe.zadd(self.live_key, {user_id: now})
+        count = pipe.execute()[0]
+        if count <= 0:
+            self._drop_connections(user_id)
+        return max(count, 0)
+
+    def _drop_connections(self, user_id):
+        # Remove the zero count unless another socket connected in the meantime;
+        # a zero left behind after a conflict reads as offline all the same
+        import redis
+
+        with self.client.pipeline() as pipe:
+            try:
+                pipe.watch(self.connections_key)
+                if int(pipe.hget(self.connections_key, user_id) or 0) <= 0:
+                    pipe.multi()
+                    pipe.hdel(self.connections_key, user_id)
+                    pipe.zrem(self.live_key, user_id)
+                    pipe.execute()
+            except redis.WatchError:
+                pass
+
+    def touch(self, user_ids, now):
+        if user_ids:
+            pipe = self.client.pipeline()
+            pipe.hset(self.seen_key, mapping={user_id: now for user_id in user_ids})
+            pipe.sadd(self.dirty_key, *user_ids)
+            pipe.zadd(self.live_key, {user_id: now for user_id in user_ids})
+            pipe.execute()
+
+    def get(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        pipe = self.client.pipeline()
+        pipe.hmget(self.connections_key, user_ids)
+        pipe.hmget(self.seen_key, user_ids)
+        counts, seen = pipe.execute()
+        return {
+            user_id: (int(count or 0), int(last_seen))
+            for user_id, count, last_seen in zip(user_ids, counts, seen) if last_seen is not None
+        }
+
+    def drain(self):
+        # SPOP hands each dirty id to exactly one worker's flush
+        seen = {}
+        while True:
+            user_ids = [int(user_id) for user_id in self.client.spop(self.dirty_key, 1000)]
+            if not user_ids:
+                return seen
+            pipe = self.client.pipeline()
+            pipe.hmget(self.seen_key, user_ids)
+            pipe.hmget(self.connections_key, user_ids)
+            stamps, counts = pipe.execute()
+            offline = []
+            for user_id, last_seen, count in zip(user_ids, stamps, counts):
+                if last_seen is not None:
+                    seen[user_id] = int(last_seen)
+                    if not count:
+                        offline.append(user_id)
+            if offline:
+                self.client.hdel(self.seen_key, *offline)
+
+    def expire(self, cutoff, user_ids=None):
+        # Zero the socket count of users (of user_ids, or any) unseen since
+        # cutoff; returns their ids. Every worker may run this at once: WATCH
+        # lets one of them claim each user, and a socket connecting or seen
+        # meanwhile cancels the expiry.
+        import redis
+
+        if user_ids is None:
+            user_ids = self.client.zrangebyscore(self.live_key, "-inf", f"({cutoff}")
+        expired = []
+        for user_id in user_ids:
+            user_id = int(user_id)
+            with self.client.pipeline() as pipe:
+                try:
+                    pipe.watch(self.connections_key, self.seen_key)
+                    count = int(pipe.hget(self.connections_key, user_id) or 0)
+                    last_seen = pipe.hget(self.seen_key, user_id)
+                    if last_seen is None or int(last_seen) >= cutoff:
+                        continue
+                    pipe.multi()
+                    pipe.hdel(self.connections_key, user_id)
+                    pipe.zrem(self.live_key, user_id)
+                    pipe.sadd(self.dirty_key, user_id)
+                    pipe.execute()
+                except redis.WatchError:
+                    continue
+            if count > 0:
+                expired.append(user_id)
+        return expired
+
+    def generation(self, user_id):
+        return int(self.client.hget(self.generations_key, user_id) or 0)
+
+    def bump(self, user_ids):
+        if user_ids:
+            pipe = self.client.pipeline()
+            for user_id in user_ids:
+                pipe.hincrby(self.generations_key, user_id, 1)
+            pipe.execute()
+
+
+def make_backend(config):
+    url = config.get("PRESENCE_REDIS_URL")
+    if url:
+        return RedisBackend(url=url)
+    return MemoryBackend()
+
+
+# ----- Presence -----
+
+class Presence:
+    """Online state and last-seen times of users with open Socket.IO connections.
+
+    A user is online while at least one socket is open and one of them has been
+    seen within PRESENCE_TIMEOUT seconds; the timeout covers workers that died
+    without running their disconnect handlers. ``refresh()`` marks this
+    process's sockets as seen and ``expire()`` takes such users offline; both
+    are called from the periodic flush, so the client needs no heartbeat event
+    of its own.
+    """
+
+    def __init__(self, app=None, backend=None):
+        self.backend = backend
+        self.timeout = 90
+        self._sessions = {}  # sid -> user_id, for sockets held by this process
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault("PRESENCE_FLUSH_INTERVAL", 30)
+        app.config.setdefault("PRESENCE_TIMEOUT", 3 * app.config["PRESENCE_FLUSH_INTERVAL"])
+        self.timeout = app.config["PRESENCE_TIMEOUT"]
+        if self.backend is None:
+            self.backend = make_backend(app.config)
+        app.extensions["presence"] = self
+
+    def connect(self, sid, user_id):
+        # Returns True when this socket brought the user online. Sockets a dead
+        # worker left counted are dropped first once they have timed out, so
+        # they neither make the user look online already nor keep them online
+        # after this socket closes.
+        user_id = int(user_id)
+        with self._lock:
+            if sid in self._sessions:
+                return False
+            self._sessions[sid] = user_id
+        now = int(time.time())
+        self.backend.expire(now - self.timeout, [user_id])
+        return self.backend.incr(user_id, 1, now) == 1
+
+    def disconnect(self, sid):
+        # Returns the socket's user id when its last socket closed, else None
+        with self._lock:
+            user_id = self._sessions.pop(sid, None)
+        if user_id is None:
+            return None
+        return user_id if self.backend.incr(user_id, -1, int(time.time())) == 0 else None
+
+    def user(self, sid):
+        # The user id of a socket held by this process, or None
+        with self._lock:
+            return self._sessions.get(sid)
+
+    def refresh(self):
+        with self._lock:
+            user_ids = set(self._sessions.values())
+        self.backend.touch(user_ids, int(time.time()))
+
+    def lookup(self, user_ids):
+        # {user_id: (online, last_seen unix seconds)} for users with a live or
+        # not yet flushed entry; for the rest, users.last_seen is current
+        now = time.time()
+        return {
+            user_id: (count > 0 and now - last_seen < self.timeout, last_seen)
+            for user_id, (count, last_seen) in self.backend.get({int(user_id) for user_id in user_ids}).items()
+        }
+
+    def drain(self):
+        return self.backend.drain()
+
+    def expire(self):
+        # Ids of users whose remaining sockets have gone unseen for the timeout
+        return self.backend.expire(int(time.time()) - self.timeout)
+
+    def generation(self, user_id):
+        return self.backend.generation(int(user_id))
+
+    def bump(self, user_ids):
+        self.backend.bump(sorted({int(user_id) for user_id in user_ids}))
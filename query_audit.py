@@ -0,0 +1,299 @@
+import json
+import random
+import re
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func, text
+
+# ----- Query-plan audit -----
+# Every statement the endpoints below issue is recorded through the engine's
+# before_cursor_execute hook, then explained with the same parameters:
+# EXPLAIN QUERY PLAN on SQLite, EXPLAIN (FORMAT JSON) on Postgres. A full
+# table scan ("SCAN <table>" / "Seq Scan") of a table holding more than
+# min_rows rows is reported as a finding, as is a SQLite full index scan
+# ("SCAN <table> USING INDEX") in a statement without a LIMIT to stop it.
+
+# (method, path, JSON or form body); placeholders are filled from the database
+ENDPOINTS = [
+    ("GET", "/api/current_user", None),
+    ("GET", "/api/users", None),
+    ("GET", "/api/users?q=user1&limit=20", None),
+    ("GET", "/api/users?location=Nairobi", None),
+    ("GET", "/api/search?q=post", None),
+    ("GET", "/api/search?q=nairobi&type=users", None),
+    ("GET", "/api/user/{other}", None),
+    ("GET", "/api/user_posts", None),
+    ("GET", "/api/user_posts/{other}", None),
+    ("GET", "/api/feeds", None),
+    ("GET", "/api/timeline", None),
+    ("GET", "/api/posts/{post}/comments", None),
+    ("GET", "/api/friends", None),
+    ("GET", "/api/suggestions", None),
+    ("GET", "/api/notifications", None),
+    ("GET", "/api/notifications/unread_count", None),
+    ("GET", "/api/chats", None),
+    ("GET", "/messages/{friend}", None),
+    ("POST", "/api/posts", {"form": {"content": "Query audit"}}),
+    ("POST", "/api/posts/{post}/like", {}),
+    ("POST", "/api/posts/{post}/comments", {"content": "Query audit"}),
+    ("POST", "/messages/send", {"receiver_id": "{friend}", "message": "Query audit"}),
+    ("PUT", "/messages/read/{friend}", {}),
+    ("POST", "/api/send-friend-request", {"userId": "{stranger}"}),
+    ("POST", "/api/accept-friend-request", {"requestId": "{request}"}),
+    ("POST", "/api/mark-all-read", {}),
+]
+
+EXPLAINED = ("SELECT", "WITH", "UPDATE", "DELETE")
+
+
+class StatementRecorder:
+    """Collects the (statement, parameters) a block of code sends to the engine from this thread."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements = []
+        self._thread = None
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if threading.get_ident() != self._thread:
+            return  # background tasks started by the endpoint
+        if statement.lstrip().upper().startswith(EXPLAINED):
+            self.statements.append((statement, parameters[0] if executemany else parameters))
+
+    def __enter__(self):
+        self._thread = threading.get_ident()
+        event.listen(self.engine, "before_cursor_execute", self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, "before_cursor_execute", self._record)
+
+
+def explain(engine, statement, parameters):
+    # (plan lines, scanned tables) for one recorded statement
+    raw = engine.raw_connection()
+    try:
+        cursor = raw.cursor()
+        if engine.dialect.name == "postgresql":
+            cursor.execute("EXPLAIN (FORMAT JSON) " + statement, parameters)
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            lines, scans = [], []
+            _walk_postgres(plan[0]["Plan"], 0, lines, scans)
+            return lines, scans
+        cursor.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+        rows = cursor.fetchall()
+    finally:
+        raw.rollback()
+        raw.close()
+
+    aliases = {alias: table for table, alias in re.findall(r'(?:FROM|JOIN)\s+"?(\w+)"?\s+AS\s+"?(\w+)"?', statement)}
+    limited = re.search(r"\bLIMIT\b", statement, re.IGNORECASE) is not None
+    depth = {0: -1}
+    lines, scans = [], []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node_id] + detail)
+        match = re.match(r"SCAN (?:TABLE )?(\w+)(.*)", detail)
+        if match and "VIRTUAL TABLE" not in match.group(2) and (  # FTS5 tables answer MATCH from their own index
+                "USING" not in match.group(2) or ("INDEX" in match.group(2) and not limited)):
+            scans.append(aliases.get(match.group(1), match.group(1)))
+    return lines, scans
+
+
+def _walk_postgres(node, level, lines, scans):
+    label = node["Node Type"]
+    if "Relation Name" in node:
+        label += f" on {node['Relation Name']}"
+    if "Index Name" in node:
+        label += f" using {node['Index Name']}"
+    if node.get("Filter"):
+        label += f" (filter: {node['Filter']})"
+    lines.append("  " * level + label)
+    if node["Node Type"] in ("Seq Scan", "Parallel Seq Scan"):
+        scans.append(node["Relation Name"])
+    for child in node.get("Plans", []):
+        _walk_postgres(child, level + 1, lines, scans)
+
+
+def table_rows(db):
+    return {
+        table.name: db.session.execute(text(f'SELECT COUNT(*) FROM "{table.name}"')).scalar()
+        for table in db.metadata.sorted_tables
+    }
+
+
+# ----- Seed data -----
+
+def seed(db, users=2000, friends=20, posts=5, seed_value=0):
+    # Fill an empty database with a synthetic social graph, built in memory and
+    # written with executemany inserts in foreign-key order. Returns False when
+    # the database already has users.
+    from models import (User, Post, Like, Comment, Friendship, FriendRequest, Notification, Message,
+                        Conversation, TimelineEntry)
+
+    if db.session.query(User.id).first():
+        return False
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    locations = ["Nairobi", "Mombasa", "Kisumu", "Nakuru", "Eldoret", "Thika"]
+    user_ids = range(1, users + 1)
+
+    pairs = set()
+    for user_id in user_ids:
+        for friend_id in rng.sample(user_ids, min(friends // 2, users)):
+            if friend_id != user_id:
+                pairs.add((min(user_id, friend_id), max(user_id, friend_id)))
+    adjacency = {}
+    for a, b in pairs:
+        adjacency.setdefault(a, []).append(b)
+        adjacency.setdefault(b, []).append(a)
+
+    post_rows, likes, comments, timeline = [], [], [], []
+    for user_id in user_ids:
+        fans = adjacency.get(user_id, [])
+        for _ in range(posts):
+            post = {"id": len(post_rows) + 1, "user_id": user_id, "content": "Seeded post",
+                    "timestamp": now - timedelta(minutes=rng.randrange(60 * 24 * 90))}
+            post_rows.append(post)
+            likers = rng.sample(fans, min(len(fans), 3))
+            post["like_count"] = len(likers)
+            for fan in likers:
+                likes.append({"user_id": fan, "post_id": post["id"]})
+                comments.append({"user_id": fan, "post_id": post["id"], "content": "Seeded comment",
+                                 "timestamp": post["timestamp"] + timedelta(minutes=5)})
+            for reader in [user_id] + fans:
+                timeline.append({"user_id": reader, "post_id": post["id"], "ts": post["timestamp"]})
+
+    messages, conversations = [], {}
+    for a, b in rng.sample(sorted(pairs), min(len(pairs), users * 2)):
+        for _ in range(rng.randrange(1, 10)):
+            sender, receiver = (a, b) if rng.random() < 0.5 else (b, a)
+            message = {"id": len(messages) + 1, "sender_id": sender, "receiver_id": receiver, "message": "Seeded message",
+                       "timestamp": now - timedelta(minutes=rng.randrange(60 * 24 * 30)), "is_read": rng.random() < 0.8}
+            messages.append(message)
+            for owner, partner in ((sender, receiver), (receiver, sender)):
+                latest = conversations.get((owner, partner))
+                if latest is None or latest["timestamp"] < message["timestamp"]:
+                    conversations[(owner, partner)] = message
+
+    requests, notifications, unread = [], [], {}
+    for user_id in user_ids:
+        for requester in rng.sample(user_ids, min(2, users)):
+            if requester != user_id and (min(user_id, requester), max(user_id, requester)) not in pairs:
+                requests.append({"id": len(requests) + 1, "requester_id": requester, "recipient_id": user_id,
+                                 "status": "pending", "timestamp": now})
+                notifications.append({"user_id": user_id, "message": "You have a new friend request!",
+                                      "type": "friend_request", "friend_request_id": len(requests), "read": False})
+                unread[user_id] = unread.get(user_id, 0) + 1
+
+    tables = [
+        (User, [{"id": i, "name": f"user{i}", "email": f"user{i}@example.com", "password": "x",
+                 "location": rng.choice(locations), "description": f"Seeded user {i}",
+                 "unread_notifications": unread.get(i, 0), "friend_count": len(adjacency.get(i, []))}
+                for i in user_ids]),
+        (Friendship, [{"user_id": a, "friend_id": b, "created_at": now} for x, y in pairs for a, b in ((x, y), (y, x))]),
+        (Post, post_rows),
+        (Like, likes),
+        (Comment, comments),
+        (TimelineEntry, timeline),
+        (Message, messages),
+        (Conversation, [{"user_id": owner, "partner_id": partner, "last_message_id": m["id"],
+                         "last_message_at": m["timestamp"], "unread_count": 0}
+                        for (owner, partner), m in conversations.items()]),
+        (FriendRequest, requests),
+        (Notification, notifications),
+    ]
+    for model, rows in tables:
+        if rows:
+            db.session.execute(model.__table__.insert(), rows)
+    if db.engine.dialect.name == "postgresql":
+        # Explicit ids leave the serial sequences behind
+        for model in (User, Post, Message, FriendRequest):
+            table = model.__tablename__
+            db.session.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                                    f"(SELECT MAX(id) FROM {table}))"))
+    db.session.commit()
+    return True
+
+
+# ----- Audit -----
+
+def audit_targets(db):
+    # Ids the endpoint placeholders refer to: the best-connected user and their neighbourhood
+    from models import User, Post, Friendship, FriendRequest
+
+    me = (db.session.query(Friendship.user_id).group_by(Friendship.user_id)
+          .order_by(func.count().desc()).limit(1).scalar()
+          or db.session.query(User.id).limit(1).scalar())
+    friend = db.session.query(Friendship.friend_id).filter(Friendship.user_id == me).limit(1).scalar()
+    friend_ids = db.session.query(Friendship.friend_id).filter(Friendship.user_id == me)
+    stranger = db.session.query(User.id).filter(User.id != me, User.id.notin_(friend_ids)).limit(1).scalar()
+    request = (db.session.query(FriendRequest.id)
+               .filter(FriendRequest.recipient_id == me, FriendRequest.status == "pending").limit(1).scalar())
+    post = db.session.query(Post.id).order_by(Post.timestamp.desc()).limit(1).scalar()
+    return {"me": me, "friend": friend or stranger, "other": friend or stranger, "stranger": stranger,
+            "request": request or 0, "post": post or 0}
+
+
+def _fill(value, targets):
+    if isinstance(value, str):
+        if re.fullmatch(r"\{\w+\}", value):
+            return targets[value[1:-1]]
+        return value.format(**targets)
+    if isinstance(value, dict):
+        return {key: _fill(item, targets) for key, item in value.items()}
+    return value
+
+
+def run_audit(app, db, min_rows=1000, endpoints=ENDPOINTS):
+    # Returns [{"endpoint", "status", "queries": [{"sql", "plan", "scans"}]}]
+    # and the per-table row counts the findings were judged against.
+    # Write endpoints really run, so point it at a scratch or staging database.
+    from flask_jwt_extended import create_access_token
+
+    engine = db.engine
+    db.session.execute(text("ANALYZE"))  # fresh statistics on both SQLite and Postgres
+    db.session.commit()
+    rows = table_rows(db)
+    targets = audit_targets(db)
+
+    client = app.test_client()
+    client.set_cookie("access_token", create_access_token(identity=str(targets["me"])))
+    report = []
+    for method, path, body in endpoints:
+        path = _fill(path, targets)
+        kwargs = {}
+        if body is not None:
+            body = _fill(body, targets)
+            kwargs = {"data": body["form"]} if "form" in body else {"json": body}
+        with StatementRecorder(engine) as recorder:
+            response = client.open(path, method=method, **kwargs)
+        queries = []
+        for statement, parameters in recorder.statements:
+            plan, scans = explain(engine, statement, parameters)
+            queries.append({
+                "sql": " ".join(statement.split()),
+                "plan": plan,
+                "scans": sorted({table for table in scans if rows.get(table, 0) > min_rows}),
+            })
+        report.append({"endpoint": f"{method} {path}", "status": response.status_code, "queries": queries})
+        db.session.remove()
+    return report, rows
+
+
+def format_report(report, rows, min_rows, verbose=False):
+    # Text report; returns (text, number of findings)
+    out, findings = [], 0
+    for entry in report:
+        flagged = [query for query in entry["queries"] if query["scans"]]
+        findings += len(flagged)
+        out.append(f"{entry['endpoint']} -> {entry['status']}, {len(entry['queries'])} queries"
+                   + (f", {len(flagged)} with full scans" if flagged else ""))
+        for query in entry["queries"] if verbose else flagged:
+            scans = ", ".join(f"{table} ({rows[table]} rows)" for table in query["scans"])
+            out.append(f"  {'SCAN ' + scans if scans else 'ok'}: {query['sql'][:300]}")
+            out.extend(f"      {line}" for line in query["plan"])
+    out.append(f"{findings} finding(s): full scans of tables with more than {min_rows} rows")
+    return "\n".join(out), findings
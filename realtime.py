@@ -0,0 +1,131 @@
+import select
+import time
+
+import socketio
+
+# NOTIFY payloads must be shorter than 8000 bytes
+NOTIFY_MAX_BYTES = 7999
+# Larger events are stored in this table and notified by reference
+PAYLOAD_TABLE = "socketio_payloads"
+PAYLOAD_REF = "ref:"
+PAYLOAD_RETENTION = 60  # seconds a stored event stays readable by listeners
+
+
+class PostgresManager(socketio.PubSubManager):
+    """Socket.IO client manager that shares events over Postgres LISTEN/NOTIFY.
+
+    Lets every worker and node deliver emits to its own connected clients
+    using the database the app already has, without running Redis. Events
+    whose JSON exceeds the NOTIFY payload limit are written to an unlogged
+    table (created on first use) and only their row id is notified.
+    """
+
+    name = "postgres"
+
+    def __init__(self, url, channel="flask-socketio", write_only=False, logger=None, json=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+        # Accept SQLAlchemy-style URLs such as postgresql+psycopg2://
+        scheme, _, rest = url.partition("://")
+        self.dsn = f"{scheme.split('+', 1)[0]}://{rest}"
+        self._publisher = None
+
+    def _connect(self):
+        import psycopg2
+
+        conn = psycopg2.connect(self.dsn)
+        conn.autocommit = True
+        return conn
+
+    def _store(self, cur, payload):
+        # Keep an oversized event for the listeners and return its reference;
+        # events older than PAYLOAD_RETENTION have been read and are pruned
+        cur.execute(f"""
+            CREATE UNLOGGED TABLE IF NOT EXISTS {PAYLOAD_TABLE} (
+                id BIGSERIAL PRIMARY KEY,
+                payload TEXT NOT NULL,
+                created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+        """)
+        cur.execute(f"DELETE FROM {PAYLOAD_TABLE} WHERE created_at < now() - %s * interval '1 second'",
+                    (PAYLOAD_RETENTION,))
+        cur.execute(f"INSERT INTO {PAYLOAD_TABLE} (payload) VALUES (%s) RETURNING id", (payload,))
+        return f"{PAYLOAD_REF}{cur.fetchone()[0]}"
+
+    def _publish(self, data):
+        payload = self.json.dumps(data)
+        for retries_left in (1, 0):
+            try:
+                if self._publisher is None or self._publisher.closed:
+                    self._publisher = self._connect()
+                with self._publisher.cursor() as cur:
+                    message = payload
+                    if len(payload.encode()) > NOTIFY_MAX_BYTES:
+                        message = self._store(cur, payload)
+                    cur.execute("SELECT pg_notify(%s, %s)", (self.channel, message))
+                return
+            except Exception as exc:
+                self._publisher = None
+                if not retries_left:
+                    self._get_logger().error(f"Cannot publish to postgres: {exc}")
+
+    def _load(self, conn, ref):
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT payload FROM {PAYLOAD_TABLE} WHERE id = %s", (ref,))
+            row = cur.fetchone()
+        if row is None:
+            self._get_logger().error(f"Socket.IO event {ref} was pruned before it was read")
+            return None
+        return row[0]
+
+    def _listen(self):
+        retry_sleep = 1
+        while True:
+            try:
+                conn = self._connect()
+                with conn.cursor() as cur:
+                    cur.execute(f'LISTEN "{self.channel}"')
+                retry_sleep = 1
+                while True:
+                    # select() is cooperative under eventlet/gevent monkey-patching
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        payload = conn.notifies.pop(0).payload
+                        if payload.startswith(PAYLOAD_REF):
+                            payload = self._load(conn, int(payload[len(PAYLOAD_REF):]))
+                            if payload is None:
+                                continue
+                        yield payload
+            except Exception as exc:
+                self._get_logger().error(f"Cannot receive from postgres, retrying in {retry_sleep}s: {exc}")
+                time.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+
+
+def queue_options(config):
+    # SocketIO() keyword arguments for the configured SOCKETIO_MESSAGE_QUEUE:
+    #   unset               -> single process, no queue
+    #   postgresql://...    -> PostgresManager (LISTEN/NOTIFY)
+    #   redis://, amqp://, kafka://, zmq+tcp://... -> Flask-SocketIO's own managers
+    url = config.get("SOCKETIO_MESSAGE_QUEUE")
+    channel = config.get("SOCKETIO_CHANNEL", "flask-socketio")
+    if not url:
+        return {}
+    if url.startswith(("postgres://", "postgresql://", "postgresql+")):
+        return {"client_manager": PostgresManager(url, channel=channel)}
+    return {"message_queue": url, "channel": channel}
+
+
+def run_local_broker(host="127.0.0.1", port=6390):
+    # Redis-protocol stand-in for development and tests, using fakeredis's TCP
+    # server: point SOCKETIO_MESSAGE_QUEUE at redis://<host>:<port>/0
+    try:
+        from fakeredis import TcpFakeServer
+    except ImportError:
+        raise RuntimeError("The local broker requires the 'fakeredis' package")
+    server = TcpFakeServer((host, port))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
@@ -0,0 +1,90 @@
+import numpy as np
+from scipy import sparse
+
+# ----- Friend-of-friend scoring -----
+# Users are numbered 0..n-1 in id order. A is the symmetric n x n friendship
+# matrix, so row i of A @ A holds, for every user j, the number of friends i
+# and j have in common. Rows are scored in batches sized to a budget of
+# non-zeros, which bounds memory whatever the graph looks like.
+
+BATCH_NONZEROS = 20_000_000  # ~250 MB of intermediate COO arrays per batch
+
+
+def build_graph(user_ids, friend_pairs, excluded_pairs=()):
+    """Sparse matrices for the scorer.
+
+    ``user_ids`` lists every user id; ``friend_pairs`` and ``excluded_pairs``
+    are (n, 2) id arrays. Returns (ids, A, E): the sorted ids, the symmetric
+    0/1 friendship matrix, and the mask of pairs never to suggest (friends,
+    excluded pairs and every user themselves).
+    """
+    ids = np.unique(np.asarray(user_ids, dtype=np.int64))
+    n = len(ids)
+
+    def matrix(pairs):
+        pairs = np.asarray(pairs, dtype=np.int64).reshape(-1, 2)
+        pairs = pairs[np.isin(pairs, ids).all(axis=1)]  # rows pointing at deleted users
+        rows, cols = np.searchsorted(ids, pairs[:, 0]), np.searchsorted(ids, pairs[:, 1])
+        m = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(n, n))
+        m = m.maximum(m.T)  # tolerate pairs stored in one direction only
+        m.data[:] = 1  # duplicates were summed
+        return m
+
+    A = matrix(friend_pairs)
+    E = (A + matrix(excluded_pairs) + sparse.identity(n, dtype=np.int32, format="csr")).tocsr()
+    E.data[:] = 1
+    return ids, A, E
+
+
+def affected_rows(A, changed):
+    # Rows whose scores a change to the friendships of `changed` can move:
+    # those users and everyone they are friends with
+    changed = np.unique(np.asarray(changed, dtype=np.int64))
+    if not len(changed):
+        return changed
+    neighbours = A[changed].indices
+    return np.union1d(changed, neighbours)
+
+
+def batches(A, rows, budget=BATCH_NONZEROS):
+    # Split rows so that A[batch] @ A stays within ~budget non-zeros: a row's
+    # product has at most the summed degree of its friends entries
+    degree = np.diff(A.indptr).astype(np.int64)
+    cost = A[rows] @ degree + 1
+    bounds = np.searchsorted(np.cumsum(cost), np.arange(budget, cost.sum() + budget, budget), side="right")
+    start = 0
+    for end in np.unique(np.append(bounds, len(rows))):
+        if end > start:
+            yield rows[start:end]
+            start = end
+
+
+def suggest(A, E, rows, top_k=20, locations=None, location_weight=0.0, budget=BATCH_NONZEROS):
+    """Top-k friend-of-friend suggestions for the given row indices.
+
+    Yields (batch, user, suggested, rank, mutual, score) per batch of rows:
+    the rows scored, then equal-length arrays of suggestions, with user and
+    suggested as row indices. The score is the
+    mutual-friend count, multiplied by (1 + location_weight) when
+    ``locations`` (one integer code per row, negative for unknown) says both
+    users live in the same place. Ties go to the lower user id.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    for batch in batches(A, rows, budget):
+        counts = A[batch] @ A
+        counts = counts - counts.multiply(E[batch])  # drop friends, exclusions and self
+        counts.eliminate_zeros()
+        counts.sort_indices()  # ascending ids within each row, which the stable sort below keeps for ties
+        counts = counts.tocoo()
+        local, suggested, mutual = counts.row, counts.col, counts.data
+
+        score = mutual.astype(np.float32)
+        if locations is not None and location_weight:
+            here = locations[batch[local]]
+            score *= 1 + location_weight * ((here >= 0) & (here == locations[suggested]))
+
+        order = np.lexsort((-score, local))
+        local, suggested, mutual, score = local[order], suggested[order], mutual[order], score[order]
+        rank = np.arange(len(local)) - np.searchsorted(local, local)
+        keep = rank < top_k
+        yield batch, batch[local[keep]], suggested[keep], rank[keep], mutual[keep], score[keep]
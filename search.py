@@ -0,0 +1,134 @@
+import re
+
+from sqlalchemy import event, text
+
+
+# ----- Full-text search -----
+# Posts are matched on content, users on name, location and description.
+# SQLite keeps FTS5 external-content tables (posts_fts, users_fts) current
+# with triggers; Postgres keeps a generated tsvector column on each table
+# behind a GIN index. Neither stems, so both backends match the same words.
+# Every write path is covered without application code, but on SQLite a
+# migration that rebuilds posts or users (batch_alter_table with recreate)
+# drops the triggers and must create them again.
+
+MAX_TERMS = 8
+
+SQLITE_TABLES = {
+    "posts_fts": [
+        "CREATE VIRTUAL TABLE posts_fts USING fts5(content, content='posts', content_rowid='id')",
+        "CREATE TRIGGER posts_fts_insert AFTER INSERT ON posts BEGIN "
+        "INSERT INTO posts_fts(rowid, content) VALUES (new.id, new.content); END",
+        "CREATE TRIGGER posts_fts_delete AFTER DELETE ON posts BEGIN "
+        "INSERT INTO posts_fts(posts_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+        "CREATE TRIGGER posts_fts_update AFTER UPDATE OF content ON posts BEGIN "
+        "INSERT INTO posts_fts(posts_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+        "INSERT INTO posts_fts(rowid, content) VALUES (new.id, new.content); END",
+        "INSERT INTO posts_fts(posts_fts) VALUES ('rebuild')",
+    ],
+    "users_fts": [
+        "CREATE VIRTUAL TABLE users_fts USING fts5(name, location, description, content='users', content_rowid='id')",
+        # Same 5:2:1 column weights as the A/B/C weights of users.search_vector on Postgres
+        "INSERT INTO users_fts(users_fts, rank) VALUES ('rank', 'bm25(5.0, 2.0, 1.0)')",
+        "CREATE TRIGGER users_fts_insert AFTER INSERT ON users BEGIN "
+        "INSERT INTO users_fts(rowid, name, location, description) "
+        "VALUES (new.id, new.name, new.location, new.description); END",
+        "CREATE TRIGGER users_fts_delete AFTER DELETE ON users BEGIN "
+        "INSERT INTO users_fts(users_fts, rowid, name, location, description) "
+        "VALUES ('delete', old.id, old.name, old.location, old.description); END",
+        "CREATE TRIGGER users_fts_update AFTER UPDATE OF name, location, description ON users BEGIN "
+        "INSERT INTO users_fts(users_fts, rowid, name, location, description) "
+        "VALUES ('delete', old.id, old.name, old.location, old.description); "
+        "INSERT INTO users_fts(rowid, name, location, description) "
+        "VALUES (new.id, new.name, new.location, new.description); END",
+        "INSERT INTO users_fts(users_fts) VALUES ('rebuild')",
+    ],
+}
+
+POSTGRES_COLUMNS = {
+    "posts": "to_tsvector('simple'::regconfig, coalesce(content, ''))",
+    "users": "setweight(to_tsvector('simple'::regconfig, coalesce(name, '')), 'A') || "
+             "setweight(to_tsvector('simple'::regconfig, coalesce(location, '')), 'B') || "
+             "setweight(to_tsvector('simple'::regconfig, coalesce(description, '')), 'C')",
+}
+
+
+def install_search_index(connection):
+    # Create whatever is missing; used by db.create_all() (see register_search_index)
+    if connection.dialect.name == "sqlite":
+        for table, statements in SQLITE_TABLES.items():
+            exists = connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table}
+            ).first()
+            if not exists:
+                for statement in statements:
+                    connection.execute(text(statement))
+    elif connection.dialect.name == "postgresql":
+        for table, expression in POSTGRES_COLUMNS.items():
+            connection.execute(text(
+                f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS search_vector tsvector "
+                f"GENERATED ALWAYS AS ({expression}) STORED"
+            ))
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_{table}_search ON {table} USING gin (search_vector)"
+            ))
+
+
+def register_search_index(metadata):
+    event.listen(metadata, "after_create", lambda target, connection, **kw: install_search_index(connection))
+
+
+def skip_search_objects(obj, name, type_, reflected, compare_to):
+    # include_object hook that keeps autogenerate from dropping what lives outside the models
+    if type_ == "table" and name.startswith(tuple(SQLITE_TABLES)):  # with FTS5's shadow tables
+        return False
+    if type_ == "column" and name == "search_vector":
+        return False
+    if type_ == "index" and name in ("ix_posts_search", "ix_users_search"):
+        return False
+    return True
+
+
+# ----- Queries -----
+
+def search_terms(query):
+    # Words of a free-text query; anything else (FTS5 or tsquery operators) is dropped
+    return re.findall(r"[^\W_]+", query.lower())[:MAX_TERMS]
+
+
+def _match(session, table, terms, limit, after, candidates):
+    # [(id, score)], best first. The last term matches as a prefix, so results
+    # follow the user's typing. Only the newest ``candidates`` matches are
+    # ranked, which bounds the cost of common words on large tables; ties on
+    # score go to the newest row. ``after`` is the (score, id) of the previous
+    # page's last row.
+    if session.get_bind().dialect.name == "postgresql":
+        query = " & ".join(terms[:-1] + [terms[-1] + ":*"])
+        inner = (f"SELECT id, ts_rank_cd(search_vector, query)::float8 AS score "
+                 f"FROM {table}, to_tsquery('simple', :query) AS query WHERE search_vector @@ query "
+                 f"ORDER BY id DESC")
+    else:
+        # FTS5 walks its doclists in rowid order, so the LIMIT ends the scan early
+        query = " ".join(f'"{term}"' for term in terms[:-1]) + f' "{terms[-1]}"*'
+        inner = (f"SELECT rowid AS id, -rank AS score FROM {table}_fts WHERE {table}_fts MATCH :query "
+                 f"ORDER BY rowid DESC")
+    params = {"query": query, "limit": limit}
+    if candidates:
+        inner += " LIMIT :candidates"
+        params["candidates"] = candidates
+    where = ""
+    if after:
+        where = "WHERE score < :score OR (score = :score AND id < :id)"
+        params.update(score=after[0], id=after[1])
+    rows = session.execute(text(
+        f"SELECT id, score FROM ({inner}) AS matches {where} ORDER BY score DESC, id DESC LIMIT :limit"
+    ), params)
+    return [(row_id, score) for row_id, score in rows]
+
+
+def match_posts(session, terms, limit, after=None, candidates=None):
+    return _match(session, "posts", terms, limit, after, candidates)
+
+
+def match_users(session, terms, limit, after=None, candidates=None):
+    return _match(session, "users", terms, limit, after, candidates)
@@ -0,0 +1,213 @@
+import base64
+import io
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from flask import request
+
+STREAM_BUFFER = 256 * 1024
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+# ----- Backends -----
+# A backend stores media under keys relative to static/ ("media/ab/<sha256>.jpg",
+# "variants/feed/...", "sidebar_images/x.png") and knows the public URL of each
+# key. Rows in the database only ever hold keys, so switching backends or
+# putting a CDN in front of one changes no stored data.
+
+class LocalStorage:
+    """Files under the app's static folder, served by this app (or a CDN in front of it)."""
+
+    presigned_uploads = False
+
+    def __init__(self, root, base_url=None):
+        self.root = root
+        self.base_url = base_url
+
+    def path(self, key):
+        return os.path.join(self.root, key)
+
+    def url(self, key):
+        return f"{self.base_url or request.host_url + 'static/'}{key}"
+
+    def key_for(self, url):
+        # Inverse of url() for URLs under a configured base; /static/ URLs are handled by the caller
+        if self.base_url and url.startswith(self.base_url):
+            return url[len(self.base_url):]
+        return None
+
+    def save(self, key, f, content_type=None):
+        # Write the file object's content under key atomically
+        dest = self.path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = f"{dest}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as out:
+            f.seek(0)
+            shutil.copyfileobj(f, out, STREAM_BUFFER)
+        os.replace(tmp, dest)
+
+    def save_file(self, key, source_path, content_type=None):
+        # Take ownership of a finished file on disk
+        dest = self.path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.move(source_path, dest)  # a rename when both are on one filesystem
+
+    def open(self, key):
+        return open(self.path(key), "rb")
+
+    def head(self, key, length):
+        # The first length bytes of key (or fewer), as a seekable file
+        with open(self.path(key), "rb") as f:
+            return io.BytesIO(f.read(length))
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self.path(key))
+        except OSError:
+            return None
+
+    def delete(self, key):
+        if os.path.exists(self.path(key)):
+            os.remove(self.path(key))
+
+    def list(self, prefix):
+        # (name, size, version) of the files directly under prefix/; version
+        # changes whenever a file's content is replaced
+        folder = self.path(prefix)
+        if not os.path.isdir(folder):
+            return []
+        entries = []
+        for name in sorted(os.listdir(folder)):
+            path = os.path.join(folder, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((name, stat.st_size, stat.st_mtime_ns))
+        return entries
+
+    def listing_stamp(self, prefix):
+        # Changes whenever a file is added to or removed from prefix/
+        try:
+            return os.stat(self.path(prefix)).st_mtime_ns
+        except OSError:
+            return None
+
+
+class S3Storage:
+    """Any S3-compatible bucket (AWS S3, MinIO, R2, ...).
+
+    Objects are written once and served by the bucket or a CDN in front of it
+    (``base_url``); clients can upload straight to the bucket with presigned
+    PUT URLs. Pass ``client`` to use an existing boto3 client (e.g. one created
+    inside moto's ``mock_aws``); otherwise one is created with the optional
+    ``boto3`` package, with credentials from the usual AWS_* environment.
+    """
+
+    presigned_uploads = True
+    LISTING_INTERVAL = 60  # seconds; buckets have no cheap change signal
+
+    def __init__(self, bucket, endpoint_url=None, region=None, base_url=None, client=None):
+        if client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise RuntimeError("MEDIA_STORAGE=s3 requires the 'boto3' package")
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        if base_url is None:
+            base_url = (f"{endpoint_url.rstrip('/')}/{bucket}/" if endpoint_url
+                        else f"https://{bucket}.s3.amazonaws.com/")
+        self.base_url = base_url
+
+    def url(self, key):
+        return f"{self.base_url}{key}"
+
+    def key_for(self, url):
+        return url[len(self.base_url):] if url.startswith(self.base_url) else None
+
+    def _extra_args(self, key, content_type):
+        args = {"CacheControl": IMMUTABLE if key.startswith("media/") else "public, no-cache"}
+        if content_type:
+            args["ContentType"] = content_type
+        return args
+
+    def save(self, key, f, content_type=None):
+        f.seek(0)
+        self.client.upload_fileobj(f, self.bucket, key, ExtraArgs=self._extra_args(key, content_type))
+
+    def save_file(self, key, source_path, content_type=None):
+        self.client.upload_file(source_path, self.bucket, key, ExtraArgs=self._extra_args(key, content_type))
+        os.remove(source_path)
+
+    def open(self, key):
+        # Local copy for readers that need a seekable file (Pillow, header parsing)
+        f = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        self.client.download_fileobj(self.bucket, key, f)
+        f.seek(0)
+        return f
+
+    def head(self, key, length):
+        # The first length bytes of key (or fewer) with one ranged GET
+        body = self.client.get_object(Bucket=self.bucket, Key=key, Range=f"bytes=0-{length - 1}")["Body"]
+        return io.BytesIO(body.read())
+
+    def size(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ContentLength"]
+        except self.client.exceptions.ClientError:
+            return None
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=key)
+
+    def list(self, prefix):
+        entries = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix.rstrip("/") + "/", Delimiter="/"):
+            for item in page.get("Contents", []):
+                entries.append((item["Key"].rsplit("/", 1)[-1], item["Size"], item["ETag"]))
+        return sorted(entries)
+
+    def listing_stamp(self, prefix):
+        # Re-list at most once per interval; uploads through this node call refresh() directly
+        return int(time.time() // self.LISTING_INTERVAL)
+
+    def presign_upload(self, key, content_type, sha256, expires):
+        # URL and headers for a direct PUT of one object. The bucket checks the
+        # body against the declared sha256, so the object is exactly the content
+        # the key was derived from.
+        checksum = base64.b64encode(bytes.fromhex(sha256)).decode()
+        params = {
+            "Bucket": self.bucket,
+            "Key": key,
+            "ContentType": content_type,
+            "ChecksumSHA256": checksum,
+            "CacheControl": IMMUTABLE,
+        }
+        url = self.client.generate_presigned_url("put_object", Params=params, ExpiresIn=expires)
+        headers = {
+            "Content-Type": content_type,
+            "x-amz-checksum-sha256": checksum,
+            "Cache-Control": IMMUTABLE,
+        }
+        return url, headers
+
+
+def make_storage(app):
+    backend = app.config.get("MEDIA_STORAGE", "local")
+    base_url = app.config.get("MEDIA_BASE_URL") or None
+    if base_url and not base_url.endswith("/"):
+        base_url += "/"
+    if backend == "s3":
+        return S3Storage(
+            app.config["MEDIA_S3_BUCKET"],
+            endpoint_url=app.config.get("MEDIA_S3_ENDPOINT_URL") or None,
+            region=app.config.get("MEDIA_S3_REGION") or None,
+            base_url=base_url,
+        )
+    if backend == "local":
+        return LocalStorage(app.static_folder, base_url=base_url)
+    raise ValueError(f"Unknown MEDIA_STORAGE: {backend}")
@@ -0,0 +1,165 @@
+"""Socket.IO events reach clients on every worker through the message queue.
+
+Starts a local broker (``realtime.run_local_broker``) and several app processes
+sharing one database, joins the same user's sockets to their room on every
+process, then sends a chat message through each process: every socket must
+receive every message. Set REALTIME_TEST_DATABASE_URL to a Postgres database
+to also run the LISTEN/NOTIFY manager, including an event too large for NOTIFY.
+
+    python -m pytest tests/test_realtime.py
+"""
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+socketio = pytest.importorskip("socketio")
+requests = pytest.importorskip("requests")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROCESSES = 3
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"process on port {port} exited with {process.returncode}")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"nothing listening on port {port}")
+
+
+def seed(env):
+    # Create the schema, a sender and a receiver in a separate process so the
+    # test never imports app.py; returns {"sender": token, "receiver": [id, token]}
+    script = f"""
+import json, logging, sys, uuid
+logging.disable(logging.INFO)
+sys.path.insert(0, {ROOT!r})
+from app import app, db
+from models import User
+from flask_jwt_extended import create_access_token
+with app.app_context():
+    db.create_all()
+    users = [User(name=name, email=f"{{uuid.uuid4().hex}}@example.com", password="x") for name in ("a", "b")]
+    db.session.add_all(users)
+    db.session.commit()
+    sender, receiver = users
+    print(json.dumps({{"sender": create_access_token(identity=str(sender.id)),
+                      "receiver": [receiver.id, create_access_token(identity=str(receiver.id))]}}))
+"""
+    out = subprocess.run([sys.executable, "-c", script], env=env, cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def start_app(port, env):
+    script = f"""
+import logging, sys
+logging.disable(logging.INFO)
+sys.path.insert(0, {ROOT!r})
+from app import app, socketio
+socketio.run(app, host="127.0.0.1", port={port}, allow_unsafe_werkzeug=True)
+"""
+    return subprocess.Popen([sys.executable, "-c", script], env=env, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@pytest.fixture
+def broker():
+    pytest.importorskip("fakeredis")
+    port = free_port()
+    script = f"import sys; sys.path.insert(0, {ROOT!r}); from realtime import run_local_broker; run_local_broker(port={port})"
+    process = subprocess.Popen([sys.executable, "-c", script], cwd=ROOT,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port, process)
+        yield f"redis://127.0.0.1:{port}/0"
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run_cluster(queue, database_url, messages):
+    # Start PROCESSES app processes on queue, connect the receiver to each and
+    # send every message through each; returns (expected, received) deliveries
+    env = dict(os.environ, DATABASE_URL=database_url, SOCKETIO_MESSAGE_QUEUE=queue,
+               SOCKETIO_ASYNC_MODE="threading", JWT_SECRET_KEY=os.urandom(16).hex())
+    users = seed(env)
+    receiver_id, receiver_token = users["receiver"]
+    ports = [free_port() for _ in range(PROCESSES)]
+    processes = [start_app(port, env) for port in ports]
+    clients, received = [], []
+    lock = threading.Lock()
+    try:
+        for port, process in zip(ports, processes):
+            wait_for_port(port, process)
+        for port in ports:
+            client = socketio.Client(reconnection=False)
+
+            def on_message(data, port=port):
+                with lock:
+                    received.append((port, data["message"]))
+
+            client.on("new_message", on_message)
+            client.connect(f"http://127.0.0.1:{port}", headers={"Cookie": f"access_token={receiver_token}"},
+                           transports=["websocket"])
+            # The payload's user_id is ignored: the handshake's cookie picks the room
+            client.call("join_chat", {"user_id": receiver_id}, timeout=10)
+            clients.append(client)
+        time.sleep(1)  # room membership is local, but let every listener subscribe
+
+        sent = []
+        for port in ports:
+            for message in messages:
+                text = f"{port}:{message}"
+                response = requests.post(f"http://127.0.0.1:{port}/messages/send",
+                                         json={"receiver_id": receiver_id, "message": text},
+                                         cookies={"access_token": users["sender"]}, timeout=10)
+                assert response.status_code == 201, response.text
+                sent.append(text)
+
+        expected = sorted((port, text) for port in ports for text in sent)
+        deadline = time.time() + 10
+        while time.time() < deadline and len(received) < len(expected):
+            time.sleep(0.1)
+        time.sleep(0.5)  # catch duplicates
+        return expected, sorted(received)
+    finally:
+        for client in clients:
+            client.disconnect()
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+
+def test_redis_queue_delivers_to_every_process(broker):
+    database_url = f"sqlite:///{tempfile.mkdtemp()}/realtime.db"
+    expected, received = run_cluster(broker, database_url, ["hello"])
+    assert len(expected) == PROCESSES * PROCESSES
+    assert received == expected
+
+
+@pytest.mark.skipif(not os.getenv("REALTIME_TEST_DATABASE_URL"), reason="REALTIME_TEST_DATABASE_URL is not set")
+def test_postgres_queue_delivers_to_every_process():
+    pytest.importorskip("psycopg2")
+    database_url = os.environ["REALTIME_TEST_DATABASE_URL"]
+    # The second message is larger than a NOTIFY payload and travels by reference
+    expected, received = run_cluster(database_url, database_url, ["hello", "x" * 10000])
+    assert len(expected) == 2 * PROCESSES * PROCESSES
+    assert received == expected